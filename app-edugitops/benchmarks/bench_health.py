@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark del sondeo de salud (src/health_probe.py): toma los servicios de
+un roster sintético (HTTP y TCP según el catálogo), los redirige a un
+servidor local (asyncio) que responde con latencia configurable, los barre
+a la vez y compara con sondearlos uno detrás de otro.
+
+Uso: python benchmarks/bench_health.py [--endpoints 1000] [--latency-ms 50]
+     [--concurrency 200] [--sequential-max 100]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import threading
+import time
+from typing import Any
+
+from rosters import generate_catalog, generate_roster
+
+import health_probe
+import monitoring
+
+
+class SlowHTTPServer:
+    """Servidor HTTP mínimo en un hilo propio que tarda `latency` en contestar."""
+
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.port = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name="bench-http", daemon=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        else:
+            # Las sondas TCP cierran sin enviar nada; solo se responde a un GET
+            await asyncio.sleep(self.latency)
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            await writer.drain()
+        writer.close()
+
+    def _serve(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=4096))
+        self.port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        self._loop.run_forever()
+
+    def __enter__(self) -> SlowHTTPServer:
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del sondeo de salud de servicios.")
+    parser.add_argument("--endpoints", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Tiempo de respuesta simulado.")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--sequential-max", type=int, default=100,
+                        help="Servicios a sondear de uno en uno como referencia (0 = no medirlo).")
+    args = parser.parse_args()
+
+    with SlowHTTPServer(args.latency_ms / 1000) as server:
+        # Alumnos suficientes para llegar a --endpoints servicios, todos apuntando al servidor local
+        roster_endpoints: list[dict[str, Any]] = []
+        size = max(1, args.endpoints // 2)
+        while len(roster_endpoints) < args.endpoints:
+            roster_endpoints = health_probe.endpoints_from_roster(
+                generate_roster(size), monitoring.catalog_by_id(generate_catalog())
+            )
+            size *= 2
+        endpoints = [
+            dict(endpoint, host="127.0.0.1", port=server.port, url=f"http://127.0.0.1:{server.port}/")
+            for endpoint in roster_endpoints[:args.endpoints]
+        ]
+        tcp = sum(1 for endpoint in endpoints if endpoint["protocol"] == "tcp")
+
+        print(f"Latencia simulada: {args.latency_ms} ms · timeout: {args.timeout} s · "
+              f"{len(endpoints) - tcp} HTTP / {tcp} TCP")
+        print(f"{'modo':>12} {'servicios':>10} {'tiempo (s)':>11} {'arriba':>7}")
+
+        start = time.perf_counter()
+        results = health_probe.sweep(endpoints, args.timeout, args.concurrency)
+        elapsed = time.perf_counter() - start
+        up = sum(1 for result in results if result["status"] == health_probe.STATUS_UP)
+        print(f"{'concurrente':>12} {len(endpoints):>10} {elapsed:>11.2f} {up:>7}")
+
+        if args.sequential_max:
+            subset = endpoints[:args.sequential_max]
+            start = time.perf_counter()
+            results = health_probe.sweep(subset, args.timeout, concurrency=1)
+            elapsed = time.perf_counter() - start
+            up = sum(1 for result in results if result["status"] == health_probe.STATUS_UP)
+            print(f"{'secuencial':>12} {len(subset):>10} {elapsed:>11.2f} {up:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
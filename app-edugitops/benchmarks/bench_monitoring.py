@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la regeneración de la monitorización (src/monitoring.py)
+contra un Checkmk simulado en local (checkmk_stub.py) con latencia configurable.
+
+Para cada tamaño de roster mide tiempo total, peticiones HTTP y procesos
+lanzados en tres escenarios:
+  - full:        primera instalación (borra todo y crea todas las reglas)
+  - reconcile=:  reconciliación sin cambios
+  - reconcile±1: reconciliación tras cambiar las apps de un alumno
+y, para los rosters pequeños, el flujo antiguo con los scripts checkmk-*.sh
+(un proceso bash + curl por regla) como referencia.
+
+Uso: python benchmarks/bench_monitoring.py [--sizes 50 100 1000 5000]
+     [--latency-ms 5] [--concurrency 8] [--scripts-max 100]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+from checkmk_stub import CheckmkStub
+from rosters import generate_catalog, generate_roster
+
+import checkmk_client
+import checkmk_rules
+import config
+import monitoring
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / "monitoring-scripts"
+
+
+class SpawnCounter:
+    """Cuenta los procesos hijos lanzados (subprocess.Popen) mientras está activo."""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._original: Any = None
+
+    def __enter__(self) -> SpawnCounter:
+        counter = self
+        self._original = original = subprocess.Popen
+
+        class CountingPopen(original):  # type: ignore[misc, valid-type]
+            def __init__(self, *args: Any, **kwargs: Any) -> None:
+                counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen  # type: ignore[misc]
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        subprocess.Popen = self._original  # type: ignore[misc]
+
+
+def _measure(stub: CheckmkStub, func: Callable[[], Any]) -> tuple[float, int, int]:
+    """(segundos, peticiones HTTP, procesos) de una ejecución."""
+    stub.reset_counters()
+    with SpawnCounter() as spawns:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+    return elapsed, stub.request_count, spawns.count
+
+
+def _legacy_scripts_full(stub: CheckmkStub, students: list[dict[str, Any]], catalog: list[dict[str, Any]]) -> None:
+    """Flujo anterior: borrado total, host y un script por regla (SKIP_ACTIVATE=1)."""
+    env = os.environ.copy()
+    env.update({
+        "CHECKMK_URL": stub.base_url,
+        "CHECKMK_SITE": stub.site,
+        "CHECKMK_HOST_NAME": config.CHECKMK_HOST_NAME,
+        "CHECKMK_HOST_IP": config.CHECKMK_HOST_IP,
+    })
+    quiet: dict[str, Any] = {"env": env, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+
+    for script in ("checkmk-borrar-reglas-http2.sh", "checkmk-borrar-reglas-tcp.sh",
+                   "checkmk-borrar-host.sh", "checkmk-crear-host.sh"):
+        subprocess.run(["bash", str(SCRIPTS_DIR / script)], **quiet)
+
+    batch = dict(quiet, env=dict(env, SKIP_ACTIVATE="1"))
+    desired, _ = checkmk_rules.build_desired_rules(students, monitoring.catalog_by_id(catalog))
+    for rule in desired.values():
+        if rule["protocol"] == "http":
+            command = ["bash", str(SCRIPTS_DIR / "checkmk-crear-regla-http2.sh"), config.CHECKMK_HOST_NAME,
+                       rule["url"], rule["service_label"]]
+        else:
+            command = ["bash", str(SCRIPTS_DIR / "checkmk-crear-regla-tcp.sh"), config.CHECKMK_HOST_NAME,
+                       rule["address"], str(rule["port"]), rule["service_label"]]
+        subprocess.run(command, check=True, **batch)
+
+    subprocess.run(["bash", str(SCRIPTS_DIR / "checkmk-activar-cambios.sh")], **quiet)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de la reconciliación de reglas de Checkmk.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 100, 1000, 5000])
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Latencia simulada por petición.")
+    parser.add_argument("--concurrency", type=int, default=config.CHECKMK_CONCURRENCY)
+    parser.add_argument("--scripts-max", type=int, default=100,
+                        help="Tamaño máximo de roster para medir los scripts .sh (0 = no medirlos).")
+    args = parser.parse_args()
+
+    catalog = generate_catalog()
+    log: Callable[[str], None] = lambda message: None
+
+    print(f"Latencia simulada: {args.latency_ms} ms/petición · concurrencia: {args.concurrency}")
+    print(f"{'alumnos':>8} {'reglas':>7} {'escenario':>12} {'tiempo (s)':>11} {'peticiones':>11} {'procesos':>9}")
+    for size in args.sizes:
+        students = generate_roster(size)
+        desired, _ = checkmk_rules.build_desired_rules(students, monitoring.catalog_by_id(catalog))
+
+        with CheckmkStub(latency=args.latency_ms / 1000) as stub:
+            client = checkmk_client.CheckmkClient(
+                stub.base_url, stub.site, config.CHECKMK_API_USER, config.CHECKMK_API_SECRET,
+                pool_size=max(config.CHECKMK_POOL_SIZE, args.concurrency),
+            )
+
+            def run(mode: str, roster: list[dict[str, Any]]) -> Callable[[], Any]:
+                return lambda: monitoring.run_monitoring(
+                    roster, catalog, mode=mode, log=log, client=client, concurrency=args.concurrency
+                )
+
+            edited = [dict(student) for student in students]
+            edited[0]["apps"] = ["grafana"] if edited[0]["apps"] != ["grafana"] else ["prometheus"]
+
+            scenarios = [
+                ("full", run(monitoring.MODE_FULL, students)),
+                ("reconcile=", run(monitoring.MODE_RECONCILE, students)),
+                ("reconcile±1", run(monitoring.MODE_RECONCILE, edited)),
+            ]
+            if size <= args.scripts_max:
+                scenarios.append(("scripts .sh", lambda: _legacy_scripts_full(stub, students, catalog)))
+
+            for label, func in scenarios:
+                elapsed, requests_made, spawns = _measure(stub, func)
+                print(f"{size:>8} {len(desired):>7} {label:>12} {elapsed:>11.2f} {requests_made:>11} {spawns:>9}")
+
+            client.session.close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los backends de alumnos de src/data_manager.py: 'yaml' (alumnos.yaml
+reescrito en cada cambio) frente a 'sqlite' (almacén SQLite con escrituras por
+fila). Para cada tamaño de roster mide la modificación de un alumno, la lectura
+de un alumno tras un cambio hecho por otro worker y el push (que en modo SQLite
+es cuando se escribe alumnos.yaml).
+
+Uso: python benchmarks/bench_store.py [--sizes 1000 10000 50000] [--repeat 20]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Callable
+
+from rosters import generate_catalog, generate_roster
+
+import config
+import data_manager
+import yaml_io
+
+
+def _mean_of(repeat: int, func: Callable[[int], Any]) -> float:
+    """Tiempo medio (en segundos) de `repeat` ejecuciones de func(i)."""
+    start = time.perf_counter()
+    for i in range(repeat):
+        func(i)
+    return (time.perf_counter() - start) / repeat
+
+
+def _forget_caches() -> None:
+    """Simula a otro worker: sin nada cacheado en memoria."""
+    data_manager._invalidate_cache(data_manager.ALUMNOS_FILE)
+    data_manager._forget_store_view()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de los backends de alumnos (YAML y SQLite).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    catalog = generate_catalog()
+    app_ids = [service["id"] for service in catalog]
+    print(f"{'alumnos':>8} {'backend':>8} {'guardar (ms)':>13} {'leer 1 en frío (ms)':>20} {'materializar (ms)':>18}")
+
+    for size in args.sizes:
+        roster = generate_roster(size)
+        for backend in ("yaml", "sqlite"):
+            with tempfile.TemporaryDirectory() as tmp:
+                data_manager.ALUMNOS_FILE = os.path.join(tmp, "alumnos.yaml")
+                data_manager.CATALOGO_FILE = os.path.join(tmp, "catalogo.yaml")
+                config.SHARED_STATE_DB = os.path.join(tmp, "state.sqlite")
+                config.ALUMNOS_DB = os.path.join(tmp, "alumnos.sqlite")
+                config.ALUMNOS_BACKEND = backend
+                for path, data in ((data_manager.ALUMNOS_FILE, roster), (data_manager.CATALOGO_FILE, catalog)):
+                    with open(path, "w", encoding="utf-8") as f:
+                        yaml_io.dump_roster(data, f)
+                data_manager.load_alumnos()
+
+                def save(i: int) -> None:
+                    student = roster[(i * 7919) % size]
+                    ok, message = data_manager.save_alumno_changes(
+                        student["id"], student["nombre"], app_ids[: 1 + i % len(app_ids)]
+                    )
+                    assert ok, message
+
+                def read_cold(i: int) -> None:
+                    _forget_caches()
+                    assert data_manager.get_student(roster[i % size]["id"]) is not None
+
+                save_s = _mean_of(args.repeat, save)
+                read_s = _mean_of(args.repeat, read_cold)
+                # En modo YAML el fichero ya está escrito: no hay nada que materializar
+                materialize = "-"
+                if backend == "sqlite":
+                    materialize = f"{_mean_of(1, lambda i: data_manager.materialize_alumnos()) * 1000:.1f}"
+                print(f"{size:>8} {backend:>8} {save_s * 1000:>13.2f} {read_s * 1000:>20.2f} {materialize:>18}")
+                _forget_caches()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la capa YAML (src/yaml_io.py).
+Compara el parseo y volcado de rosters de distintos tamaños con la
+implementación pura en Python y con libyaml (CSafeLoader/CSafeDumper),
+y comprueba que ambas producen exactamente los mismos bytes.
+
+Uso: python benchmarks/bench_yaml.py [--sizes 100 1000 10000] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Any, Callable
+
+from rosters import generate_roster
+
+import yaml_io
+
+
+def _best_of(repeat: int, func: Callable[[], Any]) -> float:
+    """Mejor tiempo (en segundos) de `repeat` ejecuciones."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de parseo/volcado YAML de rosters.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    modes = [("python", False)]
+    if yaml_io.HAS_LIBYAML:
+        modes.append(("libyaml", True))
+    else:
+        print("⚠️ PyYAML no tiene soporte libyaml: solo se mide la versión pura.")
+
+    print(f"{'alumnos':>8} {'modo':>8} {'bytes':>10} {'parse (ms)':>11} {'dump (ms)':>10}")
+    for size in args.sizes:
+        roster = generate_roster(size)
+        reference = yaml_io.dump_roster(roster, accelerated=False)
+
+        for label, accelerated in modes:
+            text = yaml_io.dump_roster(roster, accelerated=accelerated)
+            if text != reference:
+                print(f"❌ La salida de '{label}' no es idéntica a la pura para {size} alumnos.")
+                return 1
+            if yaml_io.safe_load(text, accelerated=accelerated) != roster:
+                print(f"❌ El parseo de '{label}' no reproduce los datos para {size} alumnos.")
+                return 1
+
+            parse_s = _best_of(args.repeat, lambda: yaml_io.safe_load(text, accelerated=accelerated))
+            dump_s = _best_of(args.repeat, lambda: yaml_io.dump_roster(roster, accelerated=accelerated))
+            print(f"{size:>8} {label:>8} {len(text.encode('utf-8')):>10} {parse_s * 1000:>11.1f} {dump_s * 1000:>10.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita los endpoints de la API REST de Checkmk que usan
+src/checkmk_client.py y los scripts checkmk-*.sh:
+reglas (collections/all y objects/rule/<id>), hosts, pending_changes (ETag)
+y activate-changes. Guarda el estado en memoria, cuenta las peticiones y
+permite simular latencia por petición.
+
+Uso independiente: python benchmarks/checkmk_stub.py [--port 5000] [--latency-ms 20]
+(después: CHECKMK_URL=http://127.0.0.1:5000 python monitoring-scripts/monitoriza-laboratorios.py)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+# /<site>/check_mk/api/<1.0|2.0>/<resto>
+_API_PATH_RE = re.compile(r"^/(?P<site>[^/]+)/check_mk/api/(?:1\.0|2\.0)/(?P<path>.*)$")
+
+
+class CheckmkStub:
+    """Estado en memoria de un site de Checkmk y servidor HTTP que lo expone."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, site: str = "cmk") -> None:
+        self.site = site
+        self.latency = latency
+        self.hosts: dict[str, dict[str, Any]] = {}
+        self.rules: dict[str, dict[str, Any]] = {}
+        self.pending_changes = 0
+        self.activations = 0
+        self.requests: Counter[str] = Counter()
+        self._version = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return sum(self.requests.values())
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests.clear()
+
+    def start(self) -> CheckmkStub:
+        self._thread = threading.Thread(target=self._server.serve_forever, name="checkmk-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> CheckmkStub:
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    # --- Lógica de la API ---
+
+    def _etag(self) -> str:
+        return f'"{self._version}"'
+
+    def _change(self) -> None:
+        self.pending_changes += 1
+        self._version += 1
+
+    def handle(self, method: str, path: str, query: dict[str, list[str]], headers: Any,
+               body: Any) -> tuple[int, Any, dict[str, str]]:
+        """Devuelve (status, cuerpo JSON o None, cabeceras extra)."""
+        with self._lock:
+            if path == "domain-types/rule/collections/all":
+                if method == "GET":
+                    self.requests["list_rules"] += 1
+                    ruleset = (query.get("ruleset_name") or [""])[0]
+                    value = [
+                        {"id": rule_id, "extensions": rule}
+                        for rule_id, rule in self.rules.items()
+                        if not ruleset or rule.get("ruleset") == ruleset
+                    ]
+                    return 200, {"value": value}, {}
+                if method == "POST":
+                    self.requests["create_rule"] += 1
+                    rule_id = uuid.uuid4().hex
+                    self.rules[rule_id] = dict(body or {})
+                    self._change()
+                    return 200, {"id": rule_id, "extensions": self.rules[rule_id]}, {}
+
+            if path.startswith("objects/rule/") and method == "DELETE":
+                self.requests["delete_rule"] += 1
+                if self.rules.pop(path.rsplit("/", 1)[-1], None) is None:
+                    return 404, {"title": "Not Found"}, {}
+                self._change()
+                return 204, None, {}
+
+            if path == "domain-types/host_config/collections/all" and method == "POST":
+                self.requests["create_host"] += 1
+                host_name = str((body or {}).get("host_name") or "")
+                if not host_name or host_name in self.hosts:
+                    return 400, {"title": "Bad Request", "detail": "Host ya existe"}, {}
+                self.hosts[host_name] = dict(body)
+                self._change()
+                return 200, {"id": host_name}, {}
+
+            if path.startswith("objects/host_config/"):
+                host_name = path.rsplit("/", 1)[-1]
+                if method == "GET":
+                    self.requests["get_host"] += 1
+                    if host_name not in self.hosts:
+                        return 404, {"title": "Not Found"}, {}
+                    return 200, {"id": host_name, "extensions": self.hosts[host_name]}, {"ETag": self._etag()}
+                if method == "DELETE":
+                    self.requests["delete_host"] += 1
+                    if self.hosts.pop(host_name, None) is None:
+                        return 404, {"title": "Not Found"}, {}
+                    self._change()
+                    return 204, None, {}
+
+            if path == "domain-types/activation_run/collections/pending_changes" and method == "GET":
+                self.requests["pending_changes"] += 1
+                return 200, {"value": [{"id": str(i)} for i in range(self.pending_changes)]}, {"ETag": self._etag()}
+
+            if path == "domain-types/activation_run/actions/activate-changes/invoke" and method == "POST":
+                self.requests["activate_changes"] += 1
+                if_match = str(headers.get("If-Match") or "").strip()
+                if if_match != "*" and if_match.strip('"') != str(self._version):
+                    return 412, {"title": "Precondition Failed"}, {}
+                if not self.pending_changes:
+                    return 422, {"title": "No pending changes"}, {}
+                self.pending_changes = 0
+                self.activations += 1
+                return 200, {"id": uuid.uuid4().hex, "title": "Activation started"}, {}
+
+            self.requests["unknown"] += 1
+            return 404, {"title": f"Ruta no emulada: {method} {path}"}, {}
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 para que los clientes puedan reutilizar conexiones (keep-alive)
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _dispatch(self) -> None:
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else None
+                except ValueError:
+                    body = None
+
+                match = _API_PATH_RE.match(url.path)
+                if match is None or match.group("site") != stub.site:
+                    status, payload, headers = 404, {"title": "Site desconocido"}, {}
+                else:
+                    status, payload, headers = stub.handle(
+                        self.command, match.group("path"), parse_qs(url.query), self.headers, body
+                    )
+
+                data = json.dumps(payload).encode("utf-8") if payload is not None else b""
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if data:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if data:
+                    self.wfile.write(data)
+
+            do_GET = do_POST = do_DELETE = do_PUT = _dispatch
+
+        return Handler
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Servidor local que emula la API REST de Checkmk.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--site", default="cmk")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latencia añadida a cada petición.")
+    args = parser.parse_args()
+
+    stub = CheckmkStub(args.host, args.port, latency=args.latency_ms / 1000, site=args.site)
+    print(f"Checkmk simulado en {stub.base_url}/{stub.site}/check_mk/api/1.0 (Ctrl+C para salir)")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub._server.server_close()
+        print(f"Peticiones atendidas: {dict(stub.requests)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,58 @@
+"""
+Generador de rosters sintéticos con la misma forma que edugitops/alumnos-100.yaml.
+Lo comparten los benchmarks de este directorio.
+"""
+
+from __future__ import annotations
+
+import random
+import sys
+from pathlib import Path
+from typing import Any
+
+# Permite importar los módulos de src/ (config, yaml_io, data_manager...)
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.append(str(SRC_DIR))
+
+# Apps y puertos del catálogo por defecto (src/catalogo-servicios.yaml)
+CATALOG_PORTS: dict[str, int] = {
+    "app-lablight": 80,
+    "app-lablight-2": 80,
+    "grafana": 3000,
+    "prometheus": 9090,
+    "code-server": 8080,
+    "mysql": 3306,
+    "postgresql": 5432,
+    "mongodb": 27017,
+}
+
+# Apps que el catálogo monitoriza por TCP (el resto, por HTTP)
+TCP_APPS = {"mysql", "postgresql", "mongodb"}
+
+
+def generate_catalog() -> list[dict[str, Any]]:
+    """Catálogo mínimo (id, port, protocol) coherente con CATALOG_PORTS."""
+    return [
+        {"id": app, "port": port, "protocol": "tcp" if app in TCP_APPS else "http"}
+        for app, port in CATALOG_PORTS.items()
+    ]
+
+
+def generate_roster(size: int, seed: int = 42) -> list[dict[str, Any]]:
+    """Devuelve una lista de `size` alumnos con 1-3 apps y sus URLs check-http."""
+    rng = random.Random(seed)
+    app_ids = list(CATALOG_PORTS)
+    roster: list[dict[str, Any]] = []
+    for idx in range(1, size + 1):
+        nombre = f"alumno-{idx:05d}"
+        apps = rng.sample(app_ids, rng.randint(1, 3))
+        roster.append({
+            "nombre": nombre,
+            "id": str(idx).zfill(3),
+            "apps": apps,
+            "check-http": [
+                f"http://{app}-service.{nombre}.svc.cluster.local:{CATALOG_PORTS[app]}" for app in apps
+            ],
+        })
+    return roster
@@ -2,170 +2,91 @@
 """
 Orquestador de Monitorización para Checkmk.
 Soporta reglas HTTP y TCP basándose en catalogo-servicios.yaml.
+La lógica vive en src/monitoring.py (la app la ejecuta en proceso);
+este script es la entrada de línea de comandos.
 """
 
 from __future__ import annotations
 
 import argparse
 import os
-import subprocess
 import sys
-import yaml # type: ignore
 from pathlib import Path
 from typing import List, Dict, Any
 
-# --- Importar config.py ---
-try:
-    script_path = Path(__file__).resolve()
-    src_path = script_path.parent.parent / "src"
-    if str(src_path) not in sys.path:
-        sys.path.append(str(src_path))
-    import config # type: ignore
-except ImportError:
-    config = None
-
-def run_command(command: List[str], env: Dict[str, str]) -> None:
-    """Ejecuta comando bash y sale si falla."""
-    try:
-        subprocess.run(command, check=True, env=env)
-    except subprocess.CalledProcessError as exc:
-        print(f"❌ Error ejecutando {command[0]}: {exc}")
-        sys.exit(exc.returncode)
-
-def load_catalog(catalog_path: Path) -> Dict[str, Dict[str, Any]]:
-    """Carga el catálogo y devuelve un mapa {app_id: {protocol, port, ...}}."""
-    if not catalog_path.exists():
-        print(f"⚠️ No se encuentra el catálogo en {catalog_path}")
+SCRIPT_DIR = Path(__file__).resolve().parent
+ROOT_DIR = SCRIPT_DIR.parent
+
+
+def load_env_file(env_path: Path) -> None:
+    """Carga ROOT_DIR/.env (como hacen los scripts .sh) sin pisar el entorno."""
+    if not env_path.exists():
+        return
+    for line in env_path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        key = key.strip().removeprefix("export ").strip()
+        os.environ.setdefault(key, value.strip().strip("'\""))
+
+
+# El .env debe cargarse antes de importar config.py (lee el entorno al importarse)
+load_env_file(ROOT_DIR / ".env")
+
+# --- Importar los módulos de la app (src/) ---
+src_path = ROOT_DIR / "src"
+if str(src_path) not in sys.path:
+    sys.path.append(str(src_path))
+import checkmk_client # type: ignore
+import data_manager # type: ignore
+import monitoring # type: ignore
+
+def load_catalog() -> Dict[str, Dict[str, Any]]:
+    """Carga el catálogo de la app y devuelve un mapa {app_id: {protocol, port, ...}}."""
+    if not os.path.exists(data_manager.CATALOGO_FILE):
+        print(f"⚠️ No se encuentra el catálogo en {data_manager.CATALOGO_FILE}")
         return {}
-    
-    try:
-        data = yaml.safe_load(catalog_path.read_text()) or []
-        catalog = {}
-        for item in data:
-            if 'id' in item:
-                catalog[item['id']] = item
-        return catalog
-    except Exception as e:
-        print(f"❌ Error leyendo catálogo: {e}")
-        sys.exit(1)
+    return monitoring.catalog_by_id(data_manager.load_catalogo())
 
-def load_students(alumnos_path: Path) -> List[Dict[str, Any]]:
-    """Carga lista de alumnos."""
-    if not alumnos_path.exists():
-        return []
-    try:
-        return yaml.safe_load(alumnos_path.read_text()) or []
-    except Exception:
-        return []
+def load_students() -> List[Dict[str, Any]]:
+    """
+    Carga los alumnos como los ve la app: con los cambios del diario o del
+    almacén SQLite que aún no se han subido a Gitea.
+    """
+    return data_manager.load_alumnos()
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Configura monitorización HTTP/TCP en Checkmk.")
-    parser.parse_args()
+    parser.add_argument(
+        "--mode", choices=list(monitoring.MODES), default=monitoring.MODE_RECONCILE,
+        help="reconcile: solo aplica las diferencias (por defecto). "
+             "full: borra todo, recrea el host y todas las reglas (primera instalación).",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=None, metavar="N",
+        help="Peticiones simultáneas a Checkmk al crear/borrar reglas "
+             "(por defecto CHECKMK_CONCURRENCY).",
+    )
+    args = parser.parse_args()
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error("--concurrency debe ser >= 1")
+
+    catalog = load_catalog()
+    students = load_students()
 
-    # 1. Definir rutas
-    script_dir = Path(__file__).resolve().parent
-    root_dir = script_dir.parent
-    
-    # Buscamos ficheros en src/ (estructura Docker) o relativo (estructura local)
-    alumnos_file = root_dir / "src" / "alumnos.yaml"
-    if not alumnos_file.exists(): alumnos_file = root_dir / "alumnos.yaml"
-    
-    catalog_file = root_dir / "src" / "catalogo-servicios.yaml"
-    if not catalog_file.exists(): catalog_file = root_dir / "catalogo-servicios.yaml"
-
-    # 2. Preparar entorno
-    base_env = os.environ.copy()
-    if config:
-        vars_to_sync = ["CHECKMK_HOST_NAME", "CHECKMK_HOST_IP", "CHECKMK_API_USER", 
-                        "CHECKMK_API_SECRET", "CHECKMK_SITE", "CHECKMK_URL"]
-        for var in vars_to_sync:
-            if var not in base_env and hasattr(config, var):
-                val = getattr(config, var)
-                if val: base_env[var] = str(val)
-
-    # Validar Hostname
-    target_host_name = base_env.get("CHECKMK_HOST_NAME")
-    if not target_host_name:
-        print("❌ ERROR: CHECKMK_HOST_NAME no definido.")
+    try:
+        monitoring.run_monitoring(students, catalog, mode=args.mode, concurrency=args.concurrency)
+    except (checkmk_client.CheckmkError, ValueError) as exc:
+        print(f"❌ ERROR: {exc}")
+        body = getattr(exc, "body", "")
+        if body:
+            print(body)
+        return 1
+    except Exception as exc:
+        print(f"❌ Error de conexión con Checkmk: {exc}")
         return 1
-
-    # 3. Limpieza Inicial
-    print("🧹 [1/4] Limpiando reglas antiguas (HTTP y TCP)...")
-    run_command([str(script_dir / "checkmk-borrar-reglas-http2.sh")], env=base_env)
-    run_command([str(script_dir / "checkmk-borrar-reglas-tcp.sh")], env=base_env)
-    
-    # Reiniciar host (opcional, para asegurar limpieza)
-    run_command([str(script_dir / "checkmk-borrar-host.sh")], env=base_env)
-    run_command([str(script_dir / "checkmk-crear-host.sh")], env=base_env)
-
-    # 4. Cargar Datos
-    catalog = load_catalog(catalog_file)
-    students = load_students(alumnos_file)
-
-    if not students:
-        print("ℹ️ No hay alumnos. Finalizando.")
-        return 0
-
-    print(f"⚙️ [2/4] Procesando {len(students)} alumnos...")
-    
-    # Entorno para creación masiva (sin activar cambios cada vez)
-    env_batch = base_env.copy()
-    env_batch["SKIP_ACTIVATE"] = "1"
-
-    count_http = 0
-    count_tcp = 0
-
-    for alumno in students:
-        nombre = alumno.get("nombre", "").strip()
-        apps = alumno.get("apps", [])
-        
-        if not nombre: continue
-
-        for app_id in apps:
-            if app_id not in catalog:
-                print(f"⚠️ App desconocida '{app_id}' para {nombre}. Saltando.")
-                continue
-            
-            app_info = catalog[app_id]
-            protocol = app_info.get("protocol", "http").lower()
-            port = app_info.get("port")
-            
-            # Construir nombre de servicio K8s: <app>-service.<alumno>.svc.cluster.local
-            # Nota: Esto asume tu convención de nombres estándar
-            k8s_dns = f"{app_id}-service.{nombre}.svc.cluster.local"
-            service_label = f"{nombre}-{app_id}"
-
-            if protocol == "http":
-                # Construir URL completa
-                target_url = f"http://{k8s_dns}:{port}"
-                print(f"   Creating HTTP: {service_label} -> {target_url}")
-                run_command([
-                    str(script_dir / "checkmk-crear-regla-http2.sh"),
-                    target_host_name,
-                    target_url,
-                    service_label
-                ], env=env_batch)
-                count_http += 1
-                
-            elif protocol == "tcp":
-                print(f"   Creating TCP: {service_label} -> {k8s_dns}:{port}")
-                run_command([
-                    str(script_dir / "checkmk-crear-regla-tcp.sh"),
-                    target_host_name,
-                    k8s_dns,
-                    str(port),
-                    service_label
-                ], env=env_batch)
-                count_tcp += 1
-
-    print(f"📊 Resumen: {count_http} reglas HTTP, {count_tcp} reglas TCP creadas.")
-
-    # 5. Activar Cambios
-    print("🚀 [3/4] Activando cambios en Checkmk...")
-    run_command([str(script_dir / "checkmk-activar-cambios.sh")], env=base_env)
-
-    print("✅ [4/4] Proceso completado con éxito.")
     return 0
 
 if __name__ == "__main__":
-    sys.exit(main())
\ No newline at end of file
+    sys.exit(main())
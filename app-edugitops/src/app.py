@@ -6,12 +6,10 @@ import data_manager # Importamos para ejecutar la sincro
 def create_app():
     app = Flask(__name__)
     
-    # Ejecutar Sincronización Inicial con Gitea
-    print("--- INICIANDO SINCRONIZACIÓN CON GIT ---")
-    if data_manager.sync_files_from_gitea():
-        print("--- GIT: SINCRONIZADO CORRECTAMENTE ---")
-    else:
-        print("--- GIT: ERROR DE SINCRONIZACIÓN (Usando ficheros locales) ---")
+    # Sincronización inicial con Gitea en segundo plano: la app arranca ya
+    # con los ficheros locales y /readyz indica cuándo ha terminado
+    if data_manager.start_initial_sync():
+        print("--- INICIANDO SINCRONIZACIÓN CON GIT (en segundo plano) ---")
 
     app.register_blueprint(main_bp)
     
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import metrics
+import profiling
+
+# Códigos ante los que merece la pena reintentar (errores transitorios y 429)
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# En un POST (no idempotente) solo se reintenta si Checkmk indica que no lo procesó
+POST_RETRY_STATUS_CODES = (429, 503)
+
+
+class CheckmkError(Exception):
+    """Respuesta inesperada de la API REST de Checkmk."""
+
+    def __init__(self, message: str, status_code: int | None = None, body: str = "") -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class CheckmkClient:
+    """
+    Cliente de la API REST de Checkmk (hosts, reglas y activación de cambios).
+    Usa una única requests.Session con pool de conexiones, reintentos con
+    backoff en métodos idempotentes y registro de latencia por operación.
+    Sustituye a los scripts checkmk-*.sh (un proceso bash + curl por llamada).
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        site: str,
+        user: str,
+        secret: str,
+        pool_size: int = 8,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: tuple[float, float] = (3.05, 30.0),
+    ) -> None:
+        self.site = site
+        self.api_url = f"{base_url.rstrip('/')}/{site}/check_mk/api/1.0"
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"GET", "HEAD", "DELETE"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Authorization": f"Bearer {user} {secret}",
+        })
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats: dict[str, dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+
+    # --- Registro de latencias ---
+
+    def _record(self, operation: str, elapsed: float, failed: bool) -> None:
+        elapsed_ms = elapsed * 1000
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                operation, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += 1 if failed else 0
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["last_ms"] = elapsed_ms
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Latencias por operación: {op: {count, errors, total_ms, max_ms, last_ms}}."""
+        with self._stats_lock:
+            return {operation: dict(values) for operation, values in self._stats.items()}
+
+    # --- Peticiones ---
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        """Espera antes de reintentar: Retry-After si viene, si no backoff exponencial."""
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * (2 ** attempt)
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        operation: str,
+        expected: tuple[int, ...] = (200,),
+        retry_on: tuple[int, ...] = (),
+        **kwargs: Any,
+    ) -> requests.Response:
+        """
+        Petición a la API (path relativo a .../check_mk/api/1.0).
+        Los GET/DELETE se reintentan en el adaptador; `retry_on` añade
+        reintentos propios (con backoff) para métodos no idempotentes.
+        Lanza CheckmkError si el código de respuesta no está en `expected`.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.api_url}/{path.lstrip('/')}"
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            failed = True
+            status = "error"
+            try:
+                response = self.session.request(method, url, **kwargs)
+                failed = response.status_code not in expected
+                status = str(response.status_code)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._record(operation, elapsed, failed)
+                metrics.CHECKMK_SECONDS.observe(elapsed, operation=operation, status=status)
+                profiling.record("checkmk", elapsed)
+            if response.status_code not in retry_on or attempt >= self.max_retries:
+                break
+            time.sleep(self._retry_delay(response, attempt))
+            attempt += 1
+
+        if failed:
+            raise CheckmkError(
+                f"{operation}: Checkmk respondió {response.status_code}", response.status_code, response.text
+            )
+        return response
+
+    # --- Hosts ---
+
+    def get_host(self, host_name: str) -> dict[str, Any] | None:
+        """Devuelve el host o None si no existe."""
+        response = self.request("GET", f"objects/host_config/{host_name}", "get_host", expected=(200, 404))
+        return None if response.status_code == 404 else response.json()
+
+    def create_host(self, host_name: str, ip_address: str | None = None, folder: str = "/") -> None:
+        attributes: dict[str, Any] = {"tag_agent": "no-agent"}
+        if ip_address:
+            attributes["ipaddress"] = ip_address
+        self.request(
+            "POST", "domain-types/host_config/collections/all", "create_host",
+            json={"folder": folder, "host_name": host_name, "attributes": attributes},
+        )
+
+    def delete_host(self, host_name: str) -> bool:
+        """Borra el host. Devuelve False si no existía."""
+        response = self.request(
+            "DELETE", f"objects/host_config/{host_name}", "delete_host", expected=(200, 204, 404)
+        )
+        return response.status_code != 404
+
+    def ensure_host(self, host_name: str, ip_address: str | None = None) -> bool:
+        """Crea el host si no existe. Devuelve True si lo ha creado."""
+        if self.get_host(host_name) is not None:
+            return False
+        self.create_host(host_name, ip_address)
+        return True
+
+    # --- Reglas ---
+
+    def list_rules(self, ruleset: str) -> list[dict[str, Any]]:
+        """Reglas de un ruleset (el array `value` de collections/all)."""
+        response = self.request(
+            "GET", "domain-types/rule/collections/all", "list_rules", params={"ruleset_name": ruleset}
+        )
+        return list(response.json().get("value") or [])
+
+    def create_rule(
+        self, ruleset: str, value_raw: str, host_name: str, description: str, folder: str = "/"
+    ) -> str | None:
+        """Crea una regla que aplica a `host_name`. Devuelve su ID."""
+        response = self.request(
+            "POST", "domain-types/rule/collections/all", "create_rule", expected=(200, 201),
+            retry_on=POST_RETRY_STATUS_CODES,
+            json={
+                "ruleset": ruleset,
+                "folder": folder,
+                "properties": {"description": description, "disabled": False},
+                "value_raw": value_raw,
+                "conditions": {"host_name": {"match_on": [host_name], "operator": "one_of"}},
+            },
+        )
+        try:
+            return response.json().get("id")
+        except ValueError:
+            return None
+
+    def delete_rule(self, rule_id: str) -> bool:
+        """Borra una regla. Devuelve False si no existía."""
+        response = self.request("DELETE", f"objects/rule/{rule_id}", "delete_rule", expected=(200, 204, 404))
+        return response.status_code != 404
+
+    # --- Activación de cambios ---
+
+    def pending_changes_etag(self) -> str:
+        """ETag de los cambios pendientes ('*' si Checkmk no lo envía)."""
+        response = self.request(
+            "GET", "domain-types/activation_run/collections/pending_changes", "pending_changes"
+        )
+        return response.headers.get("ETag") or "*"
+
+    def activate_changes(self, sites: list[str] | None = None) -> bool:
+        """
+        Activa los cambios pendientes con If-Match (reintenta con '*' si el
+        ETag quedó desfasado). Devuelve False si no había nada que activar.
+        """
+        payload = {"redirect": False, "force_foreign_changes": False, "sites": sites or [self.site]}
+        path = "domain-types/activation_run/actions/activate-changes/invoke"
+        expected = (200, 201, 204, 412, 422)
+
+        response = self.request(
+            "POST", path, "activate_changes", expected=expected,
+            json=payload, headers={"If-Match": self.pending_changes_etag()},
+        )
+        if response.status_code == 412:
+            response = self.request(
+                "POST", path, "activate_changes", expected=expected, json=payload, headers={"If-Match": "*"}
+            )
+        if response.status_code == 412:
+            raise CheckmkError("activate_changes: ETag rechazado", 412, response.text)
+        # 422: no hay cambios pendientes
+        return response.status_code != 422
+
+
+_CLIENT: CheckmkClient | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> CheckmkClient:
+    """Cliente compartido por todo el proceso, creado a partir de config.py."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = CheckmkClient(
+                base_url=config.CHECKMK_URL,
+                site=config.CHECKMK_SITE,
+                user=config.CHECKMK_API_USER,
+                secret=config.CHECKMK_API_SECRET,
+                # Al menos una conexión por hilo del reparto concurrente
+                pool_size=max(config.CHECKMK_POOL_SIZE, config.CHECKMK_CONCURRENCY),
+                max_retries=config.CHECKMK_MAX_RETRIES,
+                backoff_factor=config.CHECKMK_RETRY_BACKOFF,
+                timeout=(config.CHECKMK_CONNECT_TIMEOUT, config.CHECKMK_READ_TIMEOUT),
+            )
+        return _CLIENT
+
+
+def reset_client() -> None:
+    """Descarta el cliente compartido (p. ej. tras cambiar la configuración)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.session.close()
+        _CLIENT = None
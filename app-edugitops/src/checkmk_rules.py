@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import ast
+from typing import Any
+
+# Rulesets de Checkmk que gestiona EduGitOps
+HTTP_RULESET = "active_checks:httpv2"
+TCP_RULESET = "active_checks:tcp"
+RULESETS = (HTTP_RULESET, TCP_RULESET)
+
+Rule = dict[str, Any]
+
+
+def http_value_raw(service_label: str, url: str) -> str:
+    """value_raw de una regla HTTPv2 (mismo formato que checkmk-crear-regla-http2.sh)."""
+    return (
+        f"{{'endpoints': [{{'service_name': {{'prefix': 'auto', 'name': '{service_label}'}}, "
+        f"'url': '{url}'}}], 'standard_settings': {{}}}}"
+    )
+
+
+def tcp_value_raw(service_label: str, address: str, port: int | str) -> str:
+    """value_raw de una regla TCP (mismo formato que checkmk-crear-regla-tcp.sh)."""
+    return f"{{'port': {port}, 'svc_description': 'TCP {service_label}', 'hostname': '{address}'}}"
+
+
+def build_desired_rules(
+    students: list[dict[str, Any]], catalog: dict[str, dict[str, Any]]
+) -> tuple[dict[str, Rule], list[str]]:
+    """
+    Reglas que deberían existir según alumnos.yaml y el catálogo, indexadas por
+    service_label ('<alumno>-<app>'). Devuelve también los avisos (apps desconocidas).
+    """
+    desired: dict[str, Rule] = {}
+    warnings: list[str] = []
+
+    for alumno in students:
+        nombre = str(alumno.get("nombre") or "").strip()
+        if not nombre:
+            continue
+
+        for app_id in alumno.get("apps") or []:
+            if app_id not in catalog:
+                warnings.append(f"App desconocida '{app_id}' para {nombre}. Saltando.")
+                continue
+
+            app_info = catalog[app_id]
+            protocol = str(app_info.get("protocol", "http")).lower()
+            port = app_info.get("port")
+
+            # Construir nombre de servicio K8s: <app>-service.<alumno>.svc.cluster.local
+            k8s_dns = f"{app_id}-service.{nombre}.svc.cluster.local"
+            service_label = f"{nombre}-{app_id}"
+
+            if protocol == "http":
+                url = f"http://{k8s_dns}:{port}"
+                desired[service_label] = {
+                    "service_label": service_label,
+                    "protocol": "http",
+                    "ruleset": HTTP_RULESET,
+                    "url": url,
+                    "target": url,
+                    "description": f"Monitorizar {service_label}",
+                    "value_raw": http_value_raw(service_label, url),
+                }
+            elif protocol == "tcp":
+                desired[service_label] = {
+                    "service_label": service_label,
+                    "protocol": "tcp",
+                    "ruleset": TCP_RULESET,
+                    "address": k8s_dns,
+                    "port": port,
+                    "target": f"{k8s_dns}:{port}",
+                    "description": f"Monitorizar TCP {service_label}",
+                    "value_raw": tcp_value_raw(service_label, k8s_dns, port),
+                }
+    return desired, warnings
+
+
+def rule_identity(ruleset: str, value_raw: str) -> tuple[str, str] | None:
+    """
+    (service_label, destino) de una regla existente a partir de su value_raw,
+    o None si no tiene la forma de las reglas que crea EduGitOps.
+    """
+    try:
+        value = ast.literal_eval(value_raw)
+    except (ValueError, SyntaxError, TypeError):
+        return None
+    if not isinstance(value, dict):
+        return None
+
+    if ruleset == HTTP_RULESET:
+        endpoints = value.get("endpoints") or []
+        if len(endpoints) != 1 or not isinstance(endpoints[0], dict):
+            return None
+        name = (endpoints[0].get("service_name") or {}).get("name")
+        url = endpoints[0].get("url")
+        if not name or not url:
+            return None
+        return str(name), str(url)
+
+    if ruleset == TCP_RULESET:
+        description = str(value.get("svc_description") or "")
+        if not description.startswith("TCP ") or not value.get("hostname"):
+            return None
+        return description[len("TCP "):], f"{value['hostname']}:{value.get('port')}"
+
+    return None
+
+
+def existing_rules(ruleset: str, rules: list[dict[str, Any]], host_name: str) -> list[Rule]:
+    """
+    Reglas del listado de la API (`value` de collections/all) que aplican al
+    host monitorizado. Las reglas de otros hosts no se tocan.
+    """
+    found: list[Rule] = []
+    for rule in rules:
+        extensions = rule.get("extensions") or {}
+        host_condition = (extensions.get("conditions") or {}).get("host_name") or {}
+        if host_name not in (host_condition.get("match_on") or []):
+            continue
+        identity = rule_identity(ruleset, str(extensions.get("value_raw") or ""))
+        found.append({
+            "id": rule.get("id"),
+            "ruleset": ruleset,
+            "service_label": identity[0] if identity else None,
+            "target": identity[1] if identity else None,
+        })
+    return found
+
+
+def diff_rules(desired: dict[str, Rule], existing: list[Rule]) -> dict[str, Any]:
+    """
+    Compara el estado deseado con el existente por service_label.
+    - create: reglas deseadas que no existen (o cuyo destino/protocolo cambió).
+    - delete: reglas sobrantes, duplicadas, desfasadas o no reconocibles.
+    - unchanged: número de reglas que ya están bien.
+    """
+    kept: set[str] = set()
+    delete: list[Rule] = []
+
+    for rule in existing:
+        label = rule.get("service_label")
+        wanted = desired.get(label) if label else None
+        if (
+            wanted is not None
+            and label not in kept
+            and wanted["ruleset"] == rule["ruleset"]
+            and wanted["target"] == rule["target"]
+        ):
+            kept.add(label)
+        else:
+            delete.append(rule)
+
+    create = [rule for label, rule in desired.items() if label not in kept]
+    return {"create": create, "delete": delete, "unchanged": len(kept)}
@@ -11,11 +11,25 @@ GITEA_BRANCH = os.getenv("GITEA_BRANCH", "gonzalo")
 GITEA_USER = os.getenv("GITEA_USER", "admin")
 GITEA_PASSWORD = os.getenv("GITEA_PASSWORD", "admin123")
 
+# Conexiones HTTP con Gitea: tamaño del pool, reintentos (con backoff) y timeouts
+GITEA_POOL_SIZE = int(os.getenv("GITEA_POOL_SIZE", 4))
+GITEA_MAX_RETRIES = int(os.getenv("GITEA_MAX_RETRIES", 3))
+GITEA_RETRY_BACKOFF = float(os.getenv("GITEA_RETRY_BACKOFF", 0.5))
+GITEA_CONNECT_TIMEOUT = float(os.getenv("GITEA_CONNECT_TIMEOUT", 3.05))
+GITEA_READ_TIMEOUT = float(os.getenv("GITEA_READ_TIMEOUT", 10))
+# Secreto del webhook de push de Gitea (/webhooks/gitea). Vacío: webhook desactivado.
+GITEA_WEBHOOK_SECRET = os.getenv("GITEA_WEBHOOK_SECRET", "")
+
 # --- RUTAS REMOTAS (Para la API de Gitea - Git/ArgoCD) ---
 # Estas deben coincidir con la estructura de carpetas en tu repositorio Git.
 # Por defecto: "edugitops/alumnos.yaml"
 GITEA_FILE_PATH_REMOTE = os.getenv("GITEA_FILE_PATH", "edugitops/alumnos.yaml")
 GITEA_CATALOGO_PATH_REMOTE = os.getenv("GITEA_CATALOGO_PATH", "edugitops/catalogo-servicios.yaml")
+# Modo fragmentado (ALUMNOS_SHARDED): además de alumnos.yaml se sube un fichero
+# por alumno (<directorio>/<id>.yaml) para el ApplicationSet con generador glob
+# (edugitops/labs/applicationset-sharded.yaml); solo viajan los que cambian.
+ALUMNOS_SHARDED = os.getenv("ALUMNOS_SHARDED", "False").lower() in ("true", "1", "t")
+GITEA_ALUMNOS_SHARDS_PATH_REMOTE = os.getenv("GITEA_ALUMNOS_SHARDS_PATH", "edugitops/alumnos")
 
 # Mantenemos compatibilidad hacia atrás por si algo más lo usa, 
 # pero data_manager usará las versiones _REMOTE explícitas.
@@ -24,7 +38,88 @@ GITEA_CATALOGO_PATH = GITEA_CATALOGO_PATH_REMOTE
 
 # --- CONFIGURACIÓN FLASK ---
 FLASK_PORT = int(os.getenv("FLASK_PORT", 5001))
-FLASK_DEBUG = os.getenv("FLASK_DEBUG", "True").lower() in ("true", "1", "t")
+FLASK_DEBUG = os.getenv("FLASK_DEBUG", "False").lower() in ("true", "1", "t")
+
+# --- CONFIGURACIÓN SERVIDOR WSGI (gunicorn, ver src/gunicorn.conf.py) ---
+# Procesos worker (por defecto uno por núcleo) e hilos por worker
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", os.cpu_count() or 1))
+WEB_THREADS = int(os.getenv("WEB_THREADS", 4))
+# Segundos que puede tardar una petición antes de que gunicorn recicle el worker
+WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", 120))
+# Estado compartido por todos los workers (estado de la sincro, generaciones de
+# caché, tareas): una base de datos SQLite local y sus ficheros de bloqueo.
+SHARED_STATE_DB = os.getenv(
+    "SHARED_STATE_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".edugitops-state.sqlite")
+)
+# Cada worker publica sus métricas en SHARED_STATE_DB cada N segundos y
+# /metrics (en cualquier worker) las agrega: ver metrics.py
+METRICS_PUBLISH_INTERVAL = float(os.getenv("METRICS_PUBLISH_INTERVAL", 5))
+
+# --- CONFIGURACIÓN LISTADO DE ALUMNOS ---
+# Tamaño de página del directorio de alumnos (y máximo que se puede pedir)
+STUDENTS_PAGE_SIZE = int(os.getenv("STUDENTS_PAGE_SIZE", 50))
+STUDENTS_MAX_PAGE_SIZE = int(os.getenv("STUDENTS_MAX_PAGE_SIZE", 500))
+
+# --- CONFIGURACIÓN ARRANQUE ---
+# La sincronización inicial con Gitea corre en segundo plano; /readyz da la
+# app por lista cuando termina o, como mucho, pasados estos segundos.
+INITIAL_SYNC_TIMEOUT = float(os.getenv("INITIAL_SYNC_TIMEOUT", 15))
+
+# --- CONFIGURACIÓN PERFILADO ---
+# Cabecera Server-Timing (yaml_load, render, kubectl, gitea...) en cada respuesta.
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "True").lower() in ("true", "1", "t")
+# cProfile de TODAS las peticiones (solo para depurar) o, con PROFILING_SECRET,
+# solo de las que traen ?profile=<HMAC-SHA256 de la ruta>.
+# /admin/profiles solo existe con PROFILING_SECRET (se pide como ?token=).
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ("true", "1", "t")
+PROFILING_SECRET = os.getenv("PROFILING_SECRET", "")
+# Los perfiles se guardan como un buffer circular de como mucho N ficheros
+PROFILING_DIR = os.getenv("PROFILING_DIR", "/tmp/edugitops-profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", 20))
+
+# --- CONFIGURACIÓN YAML ---
+# Usa el parser en C (libyaml) para leer si PyYAML se compiló con él.
+# La escritura usa siempre el emisor en Python (su salida es la canónica).
+YAML_USE_LIBYAML = os.getenv("YAML_USE_LIBYAML", "True").lower() in ("true", "1", "t")
+
+# --- CONFIGURACIÓN DIARIO DE ALUMNOS ---
+# Si se activa, cada alta/modificación/baja se añade a un diario local en vez de
+# reescribir alumnos.yaml; se compacta al llegar al umbral y siempre antes del push.
+ALUMNOS_JOURNAL_ENABLED = os.getenv("ALUMNOS_JOURNAL_ENABLED", "False").lower() in ("true", "1", "t")
+ALUMNOS_JOURNAL_COMPACT_EVERY = int(os.getenv("ALUMNOS_JOURNAL_COMPACT_EVERY", 200))
+
+# --- CONFIGURACIÓN ALMACÉN DE ALUMNOS ---
+# 'yaml' (por defecto): alumnos.yaml es la fuente de verdad (con el diario opcional).
+# 'sqlite': los alumnos viven en ALUMNOS_DB (lecturas y escrituras por fila) y
+# alumnos.yaml solo se escribe al hacer push a Gitea o al importar una sincronización.
+ALUMNOS_BACKEND = os.getenv("ALUMNOS_BACKEND", "yaml").lower()
+ALUMNOS_DB = os.getenv("ALUMNOS_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alumnos.sqlite"))
+
+# --- CONFIGURACIÓN TAREAS EN SEGUNDO PLANO ---
+# Hilos de la cola de tareas (la regeneración de Checkmk tras un push).
+# Por defecto 1: dos regeneraciones simultáneas de Checkmk se pisarían.
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", 1))
+# Número de tareas terminadas que se conservan para consultar en /jobs/<id>
+JOBS_HISTORY = int(os.getenv("JOBS_HISTORY", 100))
+# Segundos que se espera tras un push antes de regenerar Checkmk: los pushes
+# que llegan mientras tanto se agrupan en una sola regeneración (y activación).
+JOBS_COALESCE_WINDOW = float(os.getenv("JOBS_COALESCE_WINDOW", 10))
+
+# --- CONFIGURACIÓN KUBERNETES ---
+# La vista /deployments se sirve de una caché (list + watch con kubectl)
+KUBECTL_BIN = os.getenv("KUBECTL_BIN", "kubectl")
+K8S_NAMESPACE_PREFIX = os.getenv("K8S_NAMESPACE_PREFIX", "alumno-")
+# Cada cuántos segundos se relista todo por si el watch perdió algún evento
+K8S_RESYNC_SECONDS = float(os.getenv("K8S_RESYNC_SECONDS", 300))
+# Segundos que la primera visita a /deployments espera al listado inicial
+K8S_INITIAL_SYNC_TIMEOUT = float(os.getenv("K8S_INITIAL_SYNC_TIMEOUT", 5))
+
+# --- CONFIGURACIÓN SONDAS DE SALUD ---
+# /api/health sondea cada servicio de alumno (HTTP GET o conexión TCP).
+# Los resultados se reutilizan durante HEALTH_PROBE_TTL segundos.
+HEALTH_PROBE_TTL = float(os.getenv("HEALTH_PROBE_TTL", 30))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", 2))
+HEALTH_PROBE_CONCURRENCY = int(os.getenv("HEALTH_PROBE_CONCURRENCY", 200))
 
 # --- CONFIGURACIÓN CHECKMK ---
 # Definimos valores por defecto por si no existen en las variables de entorno
@@ -33,4 +128,13 @@ CHECKMK_HOST_IP = os.getenv("CHECKMK_HOST_IP", "127.0.0.1")
 CHECKMK_API_USER = os.getenv("CHECKMK_API_USER", "cmkadmin")
 CHECKMK_API_SECRET = os.getenv("CHECKMK_API_SECRET", "admin123") # Pon aquí tu secreto de desarrollo por defecto si quieres
 CHECKMK_SITE = os.getenv("CHECKMK_SITE", "cmk")
-CHECKMK_URL = os.getenv("CHECKMK_URL", "http://localhost:5000")
\ No newline at end of file
+CHECKMK_URL = os.getenv("CHECKMK_URL", "http://localhost:5000")
+
+# Conexiones HTTP con Checkmk: tamaño del pool, reintentos (con backoff) y timeouts
+CHECKMK_POOL_SIZE = int(os.getenv("CHECKMK_POOL_SIZE", 8))
+CHECKMK_MAX_RETRIES = int(os.getenv("CHECKMK_MAX_RETRIES", 3))
+CHECKMK_RETRY_BACKOFF = float(os.getenv("CHECKMK_RETRY_BACKOFF", 0.5))
+CHECKMK_CONNECT_TIMEOUT = float(os.getenv("CHECKMK_CONNECT_TIMEOUT", 3.05))
+CHECKMK_READ_TIMEOUT = float(os.getenv("CHECKMK_READ_TIMEOUT", 30))
+# Peticiones simultáneas al crear/borrar reglas (la activación sigue siendo una sola)
+CHECKMK_CONCURRENCY = int(os.getenv("CHECKMK_CONCURRENCY", 8))
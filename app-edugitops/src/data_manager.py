@@ -1,34 +1,202 @@
 from __future__ import annotations
 
 import base64
+import checkmk_client
+import csv
+import gitea_client
+import hashlib
+import io
+import jobs
+import json
+import metrics
+import monitoring
 import os
+import posixpath
 import requests
-import subprocess
+import shared_state
+import student_store
+import threading
+import time
 import yaml
+import yaml_io
 from typing import Any, cast
 
 # Importamos la configuración para Gitea
 import config
+from student_repository import StudentRepository
 
 # Definimos rutas absolutas
 BASE_DIR: str = os.path.dirname(os.path.abspath(__file__))
 ALUMNOS_FILE: str = os.path.join(BASE_DIR, "alumnos.yaml")
 CATALOGO_FILE: str = os.path.join(BASE_DIR, "catalogo-servicios.yaml")
+# Diario de cambios de alumnos (una línea JSON por alta/modificación/baja)
+ALUMNOS_JOURNAL_FILE: str = os.path.join(BASE_DIR, "alumnos.journal")
+# Un fichero por alumno (<id>.yaml) en modo ALUMNOS_SHARDED
+ALUMNOS_SHARDS_DIR: str = os.path.join(BASE_DIR, "alumnos")
+
+# Último SHA de blob visto en Gitea por ruta remota (para no descargar lo que no cambia)
+GITEA_SYNC_STATE_FILE: str = os.path.join(BASE_DIR, ".gitea-sync-state.json")
 
 # Variable global para almacenar el estado de la sincro con Gitea
+# (la de este proceso; get_sync_status() da la última de cualquier worker)
 GIT_SYNC_STATUS: bool = False
+# Resultado por fichero de la última sincronización: unchanged / updated / failed
+LAST_SYNC_REPORT: dict[str, str] = {}
+# Clave del estado compartido con el resultado de la última sincronización
+_SYNC_STATE_KEY = "gitea_sync"
 
 YamlItem = dict[str, Any]
 YamlData = list[YamlItem]
+FileSignature = tuple[int, int, int]
 
+# Caché en memoria de documentos YAML ya parseados.
+# Clave: ruta absoluta. Valor: (firma del fichero, datos parseados).
+# La firma (mtime_ns, tamaño, inodo) detecta cambios hechos por otros procesos
+# (p. ej. un editor o git); los escritores de este módulo invalidan explícitamente.
+_YAML_CACHE: dict[str, tuple[FileSignature, YamlData]] = {}
+_YAML_CACHE_LOCK = threading.Lock()
+_CACHE_STATS: dict[str, int] = {"hits": 0, "misses": 0}
 
-def _load_yaml(filepath: str) -> YamlData:
-    """Función interna para cargar YAML genérico de forma segura."""
-    if not os.path.exists(filepath):
-        return []
+# Hash SHA-256 del contenido de cada fichero, también por firma (para ETags)
+_HASH_CACHE: dict[str, tuple[FileSignature, str]] = {}
+
+# Repositorio indexado construido sobre la lista de alumnos cacheada.
+# Se asocia a la identidad de esa lista: si la caché se renueva, se reconstruye.
+# Los guardados de un alumno lo modifican en el sitio (coste constante).
+_REPO_CACHE: tuple[YamlData, StudentRepository] | None = None
+
+# Vista "snapshot + diario" cacheada:
+# (snapshot de alumnos.yaml, firma del diario, repositorio resultante, nº de entradas)
+_JOURNAL_VIEW: tuple[YamlData, FileSignature, StudentRepository, int] | None = None
+
+# Vista del almacén SQLite (modo ALUMNOS_BACKEND=sqlite):
+# (ruta de la base de datos, versión leída, repositorio de alumnos)
+_STORE_VIEW: tuple[str, int, StudentRepository] | None = None
+
+# Serializa las escrituras de alumnos (fichero, diario y estado en memoria),
+# también entre los workers de gunicorn
+_WRITE_LOCK = shared_state.ProcessLock("alumnos")
+# Una sola sincronización con Gitea a la vez en todo el pod
+_SYNC_LOCK = shared_state.ProcessLock("gitea_sync")
+
+
+def _file_signature(filepath: str) -> FileSignature | None:
+    """Devuelve (mtime_ns, tamaño, inodo) del fichero o None si no existe."""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _generation_name(filepath: str) -> str | None:
+    """Dato al que pertenece un fichero: 'alumnos' (snapshot y diario) o 'catalogo'."""
+    if filepath in (ALUMNOS_FILE, ALUMNOS_JOURNAL_FILE):
+        return "alumnos"
+    if filepath == CATALOGO_FILE:
+        return "catalogo"
+    return None
+
+
+def _bump_generation(filepath: str) -> None:
+    """Anuncia a todos los workers que un fichero ha cambiado."""
+    name = _generation_name(filepath)
+    if name is not None:
+        shared_state.bump_generation(name)
+
+
+def data_generation() -> tuple[int, int]:
+    """
+    Generaciones (alumnos, catálogo) compartidas por todos los workers: suben
+    con cada escritura, así que sirven para invalidar cachés derivadas
+    (p. ej. el sondeo de salud) que no dependen de la firma de un fichero.
+    """
+    return (shared_state.generation("alumnos"), shared_state.generation("catalogo"))
+
+
+def _forget_cached(filepath: str) -> None:
+    """Descarta lo cacheado en este proceso para un fichero (y lo que depende de él)."""
+    global _REPO_CACHE, _JOURNAL_VIEW
+    with _YAML_CACHE_LOCK:
+        _YAML_CACHE.pop(filepath, None)
+        if filepath == ALUMNOS_FILE:
+            _REPO_CACHE = None
+            _JOURNAL_VIEW = None
+
+
+def _invalidate_cache(filepath: str) -> None:
+    """Descarta la entrada cacheada de un fichero tras escribirlo."""
+    _forget_cached(filepath)
+    _bump_generation(filepath)
+
+
+def _prime_cache(filepath: str, previous: FileSignature | None, items: YamlData) -> None:
+    """
+    Tras escribir un fichero, deja en caché los datos recién volcados para que
+    la siguiente lectura no tenga que parsearlo. Si la firma no ha cambiado
+    (no podemos distinguir la escritura), se invalida sin más.
+    """
+    signature = _file_signature(filepath)
+    if signature is None or signature == previous:
+        _invalidate_cache(filepath)
+        return
+    with _YAML_CACHE_LOCK:
+        _YAML_CACHE[filepath] = (signature, items)
+    _bump_generation(filepath)
+
+
+def get_cache_stats() -> dict[str, int]:
+    """Devuelve los contadores de aciertos/fallos de la caché YAML."""
+    with _YAML_CACHE_LOCK:
+        return dict(_CACHE_STATS, entries=len(_YAML_CACHE))
+
+
+def _file_hash(filepath: str) -> str:
+    """SHA-256 del contenido del fichero ('' si no existe), cacheado por firma."""
+    signature = _file_signature(filepath)
+    if signature is None:
+        return ""
+    with _YAML_CACHE_LOCK:
+        cached = _HASH_CACHE.get(filepath)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    try:
+        with open(filepath, "rb") as f:
+            for chunk in iter(lambda: f.read(65536), b""):
+                digest.update(chunk)
+    except OSError:
+        return ""
+    content_hash = digest.hexdigest()
+
+    if _file_signature(filepath) == signature:
+        with _YAML_CACHE_LOCK:
+            _HASH_CACHE[filepath] = (signature, content_hash)
+    return content_hash
+
+
+def get_alumnos_etag() -> str:
+    """ETag fuerte de los datos de alumnos (alumnos.yaml + diario pendiente, o versión del almacén)."""
+    if _sqlite_backend():
+        store = _student_store()
+        return hashlib.sha256(f"{store.path}:{store.version()}".encode()).hexdigest()
+    journal_hash = _file_hash(ALUMNOS_JOURNAL_FILE)
+    if not journal_hash:
+        return _file_hash(ALUMNOS_FILE)
+    return hashlib.sha256(f"{_file_hash(ALUMNOS_FILE)}:{journal_hash}".encode()).hexdigest()
+
+
+def get_catalogo_etag() -> str:
+    """ETag fuerte del catálogo de servicios."""
+    return _file_hash(CATALOGO_FILE)
+
+
+def _parse_yaml_file(filepath: str) -> YamlData:
+    """Parsea un fichero YAML y se queda solo con los elementos tipo dict."""
     try:
         with open(filepath, "r", encoding="utf-8") as f:
-            loaded: Any = yaml.safe_load(f)
+            loaded: Any = yaml_io.safe_load(f)
     except Exception as exc:
         print(f"Error cargando {filepath}: {exc}")
         return []
@@ -43,9 +211,310 @@ def _load_yaml(filepath: str) -> YamlData:
     return items
 
 
+def _load_yaml(filepath: str) -> YamlData:
+    """
+    Función interna para cargar YAML genérico de forma segura.
+    Si el fichero no ha cambiado desde la última lectura (misma firma),
+    devuelve el documento cacheado sin volver a parsearlo.
+    El resultado se comparte entre llamadas: quien lo modifique debe guardarlo
+    a disco (lo que invalida la caché) o invalidarlo explícitamente.
+    """
+    signature = _file_signature(filepath)
+    if signature is None:
+        # Es una lectura: se suelta lo cacheado (si lo había) sin subir la generación
+        with _YAML_CACHE_LOCK:
+            had_entry = filepath in _YAML_CACHE
+        if had_entry:
+            _forget_cached(filepath)
+        return []
+
+    with _YAML_CACHE_LOCK:
+        cached = _YAML_CACHE.get(filepath)
+        if cached is not None and cached[0] == signature:
+            _CACHE_STATS["hits"] += 1
+            return cached[1]
+        _CACHE_STATS["misses"] += 1
+
+    items = _parse_yaml_file(filepath)
+
+    # Solo cacheamos si el fichero no cambió mientras lo leíamos
+    if _file_signature(filepath) == signature:
+        with _YAML_CACHE_LOCK:
+            _YAML_CACHE[filepath] = (signature, items)
+    return items
+
+
 def load_alumnos() -> YamlData:
-    """Devuelve la lista de alumnos parseada."""
-    return _load_yaml(ALUMNOS_FILE)
+    """
+    Devuelve la lista de alumnos parseada (o la del almacén SQLite).
+    Si hay cambios en el diario pendientes de compactar, se aplican encima.
+    """
+    if _sqlite_backend():
+        return _store_view()
+    return _journal_view(_load_yaml(ALUMNOS_FILE))
+
+
+def get_student(student_id: str | int) -> YamlItem | None:
+    """Un alumno por su ID (en modo SQLite, leyendo solo su fila)."""
+    if _sqlite_backend():
+        return _student_store().get(student_id)
+    return get_student_repository().get(student_id)
+
+
+# ====================================================================
+# DIARIO DE CAMBIOS (modo ALUMNOS_JOURNAL_ENABLED)
+# ====================================================================
+
+def _read_journal() -> list[dict[str, Any]]:
+    """Lee las entradas del diario, ignorando líneas corruptas (p. ej. cortadas)."""
+    entries: list[dict[str, Any]] = []
+    try:
+        with open(ALUMNOS_JOURNAL_FILE, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print(f"Entrada de diario inválida ignorada: {line.strip()[:80]}")
+                    continue
+                if isinstance(entry, dict):
+                    entries.append(entry)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _apply_journal_entry(repo: StudentRepository, entry: dict[str, Any]) -> None:
+    """Aplica una entrada del diario. Reaplicarla es inocuo (idempotente)."""
+    op = entry.get("op")
+    if op == "upsert" and isinstance(entry.get("record"), dict):
+        repo.upsert(dict(entry["record"]))
+    elif op == "delete":
+        repo.delete(str(entry.get("id")))
+
+
+def _journal_repository(snapshot: YamlData) -> StudentRepository | None:
+    """Repositorio con el diario superpuesto al snapshot de alumnos.yaml (None si no hay diario)."""
+    global _JOURNAL_VIEW
+    signature = _file_signature(ALUMNOS_JOURNAL_FILE)
+    if signature is None:
+        return None
+
+    with _YAML_CACHE_LOCK:
+        cached = _JOURNAL_VIEW
+    if cached is not None and cached[0] is snapshot and cached[1] == signature:
+        return cached[2]
+
+    entries = _read_journal()
+    # El repositorio sustituye los registros que cambian: el snapshot cacheado no se altera
+    repo = StudentRepository(snapshot)
+    for entry in entries:
+        _apply_journal_entry(repo, entry)
+
+    with _YAML_CACHE_LOCK:
+        _JOURNAL_VIEW = (snapshot, signature, repo, len(entries))
+    return repo
+
+
+def _journal_view(snapshot: YamlData) -> YamlData:
+    """Superpone el diario (si existe) sobre el snapshot de alumnos.yaml."""
+    repo = _journal_repository(snapshot)
+    return snapshot if repo is None else repo.to_list()
+
+
+def _append_journal(repo: StudentRepository, entry: dict[str, Any]) -> None:
+    """
+    Registra un cambio ya aplicado en `repo` añadiendo una línea al diario
+    (coste constante: la vista se regenera al leerla). Al llegar al umbral
+    configurado se compacta.
+    """
+    global _JOURNAL_VIEW, _REPO_CACHE
+    snapshot = _load_yaml(ALUMNOS_FILE)
+    previous = _file_signature(ALUMNOS_JOURNAL_FILE)
+
+    with _YAML_CACHE_LOCK:
+        cached = _JOURNAL_VIEW
+    if previous is None:
+        count = 0
+    elif cached is not None and cached[0] is snapshot and cached[1] == previous:
+        count = cached[3]
+    else:
+        count = len(_read_journal())
+
+    try:
+        with open(ALUMNOS_JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except Exception:
+        _invalidate_cache(ALUMNOS_FILE)
+        raise
+
+    signature = _file_signature(ALUMNOS_JOURNAL_FILE)
+    with _YAML_CACHE_LOCK:
+        # `repo` ya no corresponde al snapshot (si era el suyo) sino al diario
+        _REPO_CACHE = None
+        if signature is not None and signature != previous:
+            _JOURNAL_VIEW = (snapshot, signature, repo, count + 1)
+        else:
+            _JOURNAL_VIEW = None
+            _REPO_CACHE = None
+    _bump_generation(ALUMNOS_JOURNAL_FILE)
+
+    if count + 1 >= config.ALUMNOS_JOURNAL_COMPACT_EVERY:
+        _write_alumnos(repo)
+
+
+def _discard_journal() -> None:
+    """Elimina el diario (su contenido ya está en alumnos.yaml o se descarta)."""
+    global _JOURNAL_VIEW, _REPO_CACHE
+    try:
+        os.remove(ALUMNOS_JOURNAL_FILE)
+    except FileNotFoundError:
+        pass
+    with _YAML_CACHE_LOCK:
+        _JOURNAL_VIEW = None
+        _REPO_CACHE = None
+
+
+def compact_journal() -> None:
+    """Vuelca snapshot + diario al alumnos.yaml canónico y vacía el diario."""
+    with _WRITE_LOCK:
+        if _file_signature(ALUMNOS_JOURNAL_FILE) is None:
+            return
+        _write_alumnos(get_student_repository())
+
+
+# ====================================================================
+# ALMACÉN SQLITE (modo ALUMNOS_BACKEND=sqlite)
+# ====================================================================
+
+def _sqlite_backend() -> bool:
+    return config.ALUMNOS_BACKEND == "sqlite"
+
+
+def _student_store() -> student_store.SqliteStudentStore:
+    """Almacén de alumnos. La primera vez se llena con el alumnos.yaml local."""
+    store = student_store.get_store(config.ALUMNOS_DB)
+    if not store.initialized():
+        with _WRITE_LOCK:
+            if not store.initialized():
+                _import_alumnos_file(store)
+    return store
+
+
+def _import_alumnos_file(store: student_store.SqliteStudentStore) -> None:
+    """Sustituye el contenido del almacén por el de alumnos.yaml (fila a fila)."""
+    changed = store.replace(_load_yaml(ALUMNOS_FILE))
+    print(f"DEBUG: alumnos.yaml importado al almacén SQLite ({changed} filas cambiadas).")
+    if changed:
+        _forget_store_view()
+        _bump_generation(ALUMNOS_FILE)
+
+
+def _store_repository() -> StudentRepository:
+    """Repositorio de alumnos del almacén; solo se vuelve a leer si cambió su versión."""
+    global _STORE_VIEW
+    store = _student_store()
+    version = store.version()
+    with _YAML_CACHE_LOCK:
+        cached = _STORE_VIEW
+    if cached is not None and cached[0] == store.path and cached[1] == version:
+        return cached[2]
+
+    repo = StudentRepository(store.records())
+    with _YAML_CACHE_LOCK:
+        _STORE_VIEW = (store.path, version, repo)
+    return repo
+
+
+def _store_view() -> YamlData:
+    """Lista de alumnos del almacén."""
+    return _store_repository().to_list()
+
+
+def _remember_store_view(store: student_store.SqliteStudentStore, repo: StudentRepository) -> None:
+    """Tras escribir (bajo _WRITE_LOCK), el repositorio del almacén pasa a ser `repo`."""
+    global _STORE_VIEW
+    version = store.version()
+    with _YAML_CACHE_LOCK:
+        _STORE_VIEW = (store.path, version, repo)
+    _bump_generation(ALUMNOS_FILE)
+
+
+def _forget_store_view() -> None:
+    global _STORE_VIEW, _REPO_CACHE
+    with _YAML_CACHE_LOCK:
+        _STORE_VIEW = None
+        _REPO_CACHE = None
+
+
+def _store_change(repo: StudentRepository, entry: dict[str, Any]) -> None:
+    """Aplica en el almacén el cambio de un alumno ya hecho en `repo` (una fila)."""
+    store = _student_store()
+    try:
+        if entry["op"] == "upsert":
+            store.upsert(entry["record"])
+        else:
+            store.delete(entry["id"])
+    except Exception:
+        # No sabemos qué parte llegó al almacén: se vuelve a leer
+        _forget_store_view()
+        raise
+    _remember_store_view(store, repo)
+
+
+def _store_roster(repo: StudentRepository) -> None:
+    """Deja en el almacén el roster completo de `repo` (solo escribe las filas que cambian)."""
+    store = _student_store()
+    try:
+        store.replace(repo.to_list())
+    except Exception:
+        _forget_store_view()
+        raise
+    _remember_store_view(store, repo)
+
+
+def materialize_alumnos() -> str:
+    """
+    Escribe el alumnos.yaml canónico a partir del almacén (si difiere del que
+    hay en disco) y devuelve su texto. Se usa justo antes del push a Gitea.
+    """
+    with _WRITE_LOCK:
+        view = _store_view()
+        text = yaml_io.dump_roster(view)
+        try:
+            with open(ALUMNOS_FILE, "r", encoding="utf-8") as f:
+                unchanged = f.read() == text
+        except OSError:
+            unchanged = False
+        if not unchanged:
+            previous = _file_signature(ALUMNOS_FILE)
+            try:
+                with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
+                    f.write(text)
+            except Exception:
+                _invalidate_cache(ALUMNOS_FILE)
+                raise
+            _prime_cache(ALUMNOS_FILE, previous, view)
+        return text
+
+
+def _persist_change(repo: StudentRepository, entry: dict[str, Any]) -> None:
+    """Persiste un cambio de un alumno: en el almacén, al diario o reescribiendo el fichero."""
+    if _sqlite_backend():
+        _store_change(repo, entry)
+    elif config.ALUMNOS_JOURNAL_ENABLED:
+        _append_journal(repo, entry)
+    else:
+        _write_alumnos(repo)
+
+
+def _save_roster(repo: StudentRepository) -> None:
+    """Guarda el roster completo: en el almacén o en alumnos.yaml."""
+    if _sqlite_backend():
+        _store_roster(repo)
+    else:
+        _write_alumnos(repo)
 
 
 def load_catalogo() -> YamlData:
@@ -53,8 +522,113 @@ def load_catalogo() -> YamlData:
     return _load_yaml(CATALOGO_FILE)
 
 
+def get_student_repository() -> StudentRepository:
+    """
+    Devuelve el repositorio indexado de alumnos.
+    Con diario o almacén SQLite es el de su vista cacheada (sin pasar por la
+    lista, que se regenera tras cada cambio); si no, solo se reconstruye
+    cuando cambia la lista que devuelve load_alumnos().
+    """
+    global _REPO_CACHE
+    if _sqlite_backend():
+        return _store_repository()
+    journal_repo = _journal_repository(_load_yaml(ALUMNOS_FILE))
+    if journal_repo is not None:
+        return journal_repo
+
+    alumnos = load_alumnos()
+    with _YAML_CACHE_LOCK:
+        cached = _REPO_CACHE
+        if cached is not None and cached[0] is alumnos:
+            return cached[1]
+
+    repo = StudentRepository(alumnos)
+    with _YAML_CACHE_LOCK:
+        _REPO_CACHE = (alumnos, repo)
+    return repo
+
+
+def search_students(query: str = "", page: int = 1, page_size: int | None = None) -> dict[str, Any]:
+    """
+    Busca alumnos por nombre o ID y devuelve una página de resultados:
+    {'items', 'total', 'page', 'page_size', 'pages', 'query'}.
+    """
+    if page_size is None:
+        page_size = config.STUDENTS_PAGE_SIZE
+    page_size = max(1, min(page_size, config.STUDENTS_MAX_PAGE_SIZE))
+
+    matches = get_student_repository().search(query or "")
+    total = len(matches)
+    pages = max(1, -(-total // page_size))
+    page = max(1, min(page, pages))
+    start = (page - 1) * page_size
+
+    return {
+        "items": matches[start:start + page_size],
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": pages,
+        "query": query or "",
+    }
+
+
+def _write_alumnos(repo: StudentRepository) -> None:
+    """
+    Vuelca el repositorio a alumnos.yaml (compactando el diario si lo hay).
+    Si va bien, la caché y el repositorio quedan apuntando a lo escrito;
+    si falla, se invalidan (el fichero puede haber quedado a medias).
+    """
+    global _REPO_CACHE
+    alumnos_data = repo.to_list()
+    previous = _file_signature(ALUMNOS_FILE)
+    try:
+        with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
+            yaml_io.dump_roster(alumnos_data, f)
+    except Exception:
+        _invalidate_cache(ALUMNOS_FILE)
+        raise
+
+    # El snapshot ya incluye todo lo del diario
+    _discard_journal()
+    _prime_cache(ALUMNOS_FILE, previous, alumnos_data)
+    with _YAML_CACHE_LOCK:
+        cached = _YAML_CACHE.get(ALUMNOS_FILE)
+        if cached is not None and cached[1] is alumnos_data:
+            _REPO_CACHE = (alumnos_data, repo)
+
+
+def _service_ports(servicios: YamlData) -> dict[str, int]:
+    """Mapa {id_app: puerto} con las entradas válidas del catálogo."""
+    service_ports: dict[str, int] = {}
+    for service in servicios:
+        sid = service.get("id")
+        port = service.get("port")
+        if isinstance(sid, str) and isinstance(port, int):
+            service_ports[sid] = port
+    return service_ports
+
+
+def _build_check_http(nombre: str, apps: list[str], service_ports: dict[str, int]) -> list[str]:
+    """URLs check-http de un alumno (se omiten las apps sin puerto en el catálogo)."""
+    urls: list[str] = []
+    for app_id in apps:
+        port = service_ports.get(app_id)
+        if port is not None:
+            # Formato requerido: http://<app>-service.<alumno>.svc.cluster.local:<port>
+            urls.append(f"http://{app_id}-service.{nombre}.svc.cluster.local:{port}")
+    return urls
+
+
 def get_raw_alumnos_yaml() -> str:
-    """Lee el archivo alumnos.yaml tal cual, como texto plano."""
+    """
+    Lee el archivo alumnos.yaml tal cual, como texto plano.
+    Antes compacta el diario para que el texto refleje todos los cambios.
+    En modo SQLite se genera a partir del almacén (sin escribir el fichero).
+    """
+    if _sqlite_backend():
+        return str(yaml_io.dump_roster(_store_view()))
+    compact_journal()
     if not os.path.exists(ALUMNOS_FILE):
         return ""
     try:
@@ -63,64 +637,374 @@ def get_raw_alumnos_yaml() -> str:
     except Exception:
         return ""
 
-def _download_file_from_gitea(remote_path: str, local_path: str) -> bool:
-    """Descarga un fichero de Gitea y sobrescribe el local."""
-    api_url = f"{config.GITEA_API_URL}/repos/{config.GITEA_REPO_OWNER}/{config.GITEA_REPO_NAME}/contents/{remote_path}"
-    auth_creds = (config.GITEA_USER, config.GITEA_PASSWORD)
-    params = {'ref': config.GITEA_BRANCH}
+def git_blob_sha(content: bytes) -> str:
+    """SHA-1 de blob de Git (el 'sha' que devuelve Gitea) de un contenido."""
+    header = f"blob {len(content)}\0".encode("utf-8")
+    return hashlib.sha1(header + content).hexdigest()
+
 
+def _load_sync_state() -> dict[str, dict[str, Any]]:
+    """Estado persistido de la sincronización: {ruta_remota: {sha, signature}}."""
     try:
-        print(f"DEBUG: Descargando {remote_path} de Gitea...")
-        response = requests.get(api_url, auth=auth_creds, params=params, timeout=5)
-        
+        with open(GITEA_SYNC_STATE_FILE, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return state if isinstance(state, dict) else {}
+
+
+def _save_sync_state(state: dict[str, dict[str, Any]]) -> None:
+    try:
+        with open(GITEA_SYNC_STATE_FILE, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+    except OSError as exc:
+        print(f"DEBUG: No se pudo guardar el estado de sincronización: {exc}")
+
+
+def _remember_remote_sha(state: dict[str, dict[str, Any]], remote_path: str, local_path: str, sha: str) -> None:
+    """Anota el SHA remoto junto con la firma actual del fichero local equivalente."""
+    signature = _file_signature(local_path)
+    state[remote_path] = {"sha": sha, "signature": list(signature) if signature else None}
+
+
+def _local_blob_sha(state: dict[str, dict[str, Any]], remote_path: str, local_path: str) -> str | None:
+    """
+    SHA de blob del fichero local. Si no ha cambiado desde la última vez
+    (misma firma) se reutiliza el SHA recordado sin leerlo.
+    """
+    signature = _file_signature(local_path)
+    if signature is None:
+        return None
+    entry = state.get(remote_path) or {}
+    if entry.get("signature") == list(signature) and entry.get("sha"):
+        return str(entry["sha"])
+    try:
+        with open(local_path, "rb") as f:
+            return git_blob_sha(f.read())
+    except OSError:
+        return None
+
+
+def _list_remote_shas(remote_paths: list[str]) -> tuple[dict[str, str], set[str]]:
+    """
+    SHA actual en Gitea de cada ruta, listando su directorio padre
+    (una petición por directorio, en paralelo y sin descargar contenidos).
+    Las rutas cuyo directorio no se pudo listar no aparecen en el resultado.
+    Devuelve también los directorios con error de conexión (Gitea inalcanzable
+    tras los reintentos del cliente): no tiene sentido intentar descargarlos.
+    """
+    directories = sorted({posixpath.dirname(path) for path in remote_paths})
+    responses = gitea_client.get_client().get_contents_many(directories)
+    shas: dict[str, str] = {}
+    unreachable: set[str] = set()
+
+    for directory in directories:
+        response = responses[directory]
+        try:
+            if isinstance(response, requests.exceptions.ConnectionError):
+                unreachable.add(directory)
+            if isinstance(response, Exception):
+                raise response
+            if response.status_code != 200:
+                print(f"DEBUG: No se pudo listar '{directory}' en Gitea. Status: {response.status_code}")
+                continue
+            entries = response.json()
+        except Exception as e:
+            print(f"DEBUG: Excepción al listar '{directory}' en Gitea: {e}")
+            continue
+
+        if isinstance(entries, list):
+            for entry in entries:
+                if isinstance(entry, dict) and entry.get("type") == "file":
+                    shas[str(entry.get("path"))] = str(entry.get("sha"))
+    return shas, unreachable
+
+
+def _store_downloaded_file(remote_path: str, local_path: str, response: Any) -> str | None:
+    """
+    Sobrescribe el fichero local con la respuesta de Gitea (o la excepción
+    de la descarga). Devuelve el SHA de blob o None si la descarga falló.
+    """
+    try:
+        if isinstance(response, Exception):
+            raise response
         if response.status_code == 200:
-            content_b64 = response.json().get('content', '')
-            file_content = base64.b64decode(content_b64).decode('utf-8')
+            data_json = response.json()
+            file_bytes = base64.b64decode(data_json.get('content', ''))
+            file_content = file_bytes.decode('utf-8')
             
             # Sobrescribimos el fichero local
-            with open(local_path, 'w', encoding='utf-8') as f:
-                f.write(file_content)
+            try:
+                with open(local_path, 'w', encoding='utf-8') as f:
+                    f.write(file_content)
+            finally:
+                _invalidate_cache(local_path)
             print(f"DEBUG: {remote_path} actualizado correctamente.")
-            return True
+            return str(data_json.get('sha') or git_blob_sha(file_bytes))
         else:
             print(f"DEBUG: Fallo al descargar {remote_path}. Status: {response.status_code}")
-            return False
+            return None
             
     except Exception as e:
         print(f"DEBUG: Excepción al descargar {remote_path}: {e}")
+        return None
+
+
+def _is_unchanged(
+    state: dict[str, dict[str, Any]], remote_path: str, local_path: str, remote_sha: str | None,
+    keep_local_changes: bool = False,
+) -> bool:
+    """
+    True si no hace falta descargar el fichero: el local ya tiene el SHA
+    remoto o, con `keep_local_changes`, el remoto sigue en el último SHA
+    sincronizado o subido (lo que difiere son cambios locales posteriores).
+    """
+    if remote_sha is None:
+        return False
+    if keep_local_changes and (state.get(remote_path) or {}).get("sha") == remote_sha:
+        print(f"DEBUG: {remote_path} no se movió en Gitea (sha {remote_sha[:8]}), se conservan los cambios locales.")
+        return True
+    if _local_blob_sha(state, remote_path, local_path) != remote_sha:
         return False
+    _remember_remote_sha(state, remote_path, local_path, remote_sha)
+    print(f"DEBUG: {remote_path} sin cambios (sha {remote_sha[:8]}).")
+    return True
+
+
+def _gitea_files() -> list[tuple[str, str]]:
+    """
+    Ficheros versionados en Gitea: (ruta remota, ruta local).
+    MODIFICACIÓN: Usamos las rutas REMOTAS (_REMOTE) para pedir a la API,
+    pero guardamos en las rutas locales constantes (ALUMNOS_FILE, CATALOGO_FILE).
+    """
+    return [
+        (config.GITEA_FILE_PATH_REMOTE, ALUMNOS_FILE),
+        (config.GITEA_CATALOGO_PATH_REMOTE, CATALOGO_FILE),
+    ]
+
+
+def _shard_name(student_id: Any) -> str:
+    """
+    Nombre del fichero de un alumno: '<id>.yaml'. Todo lo que no sea ASCII
+    alfanumérico, '-' o '_' se codifica como %XX (UTF-8), así que la ruta es
+    segura (sin '/', ni '..', ni ficheros ocultos) y dos IDs distintos nunca
+    comparten fichero ('a/b' -> 'a%2Fb', 'a_b' -> 'a_b').
+    """
+    encoded = "".join(
+        c if c.isascii() and (c.isalnum() or c in "-_")
+        else "".join(f"%{byte:02X}" for byte in c.encode("utf-8"))
+        for c in str(student_id)
+    )
+    # La validación no deja IDs vacíos; '%' solo no sale nunca de un ID codificado
+    return f"{encoded or '%'}.yaml"
+
+
+def write_alumnos_shards() -> tuple[list[tuple[str, str]], list[str], dict[str, str | None]]:
+    """
+    Modo fragmentado: escribe en ALUMNOS_SHARDS_DIR un fichero por alumno
+    (solo los que cambian) y borra los de alumnos que ya no existen.
+    Lo que hay que subir y borrar se decide contra el listado del directorio
+    de fragmentos en Gitea (no contra el estado local, que se pierde al
+    reiniciar el pod). Devuelve los fragmentos que difieren del remoto
+    (ruta remota, ruta local), las rutas remotas de los que sobran y el SHA
+    remoto de cada una de esas rutas (None si no existe).
+    """
+    remote_dir = config.GITEA_ALUMNOS_SHARDS_PATH_REMOTE.rstrip("/")
+    remote_shas, unreachable = _list_remote_shas([posixpath.join(remote_dir, "_")])
+    if unreachable:
+        raise requests.exceptions.ConnectionError(f"No se pudo listar '{remote_dir}' en Gitea.")
+    state = _load_sync_state()
+    to_push: list[tuple[str, str]] = []
+    current: set[str] = set()
+
+    with _WRITE_LOCK:
+        os.makedirs(ALUMNOS_SHARDS_DIR, exist_ok=True)
+        for alumno in load_alumnos():
+            name = _shard_name(alumno.get("id"))
+            remote_path = posixpath.join(remote_dir, name)
+            local_path = os.path.join(ALUMNOS_SHARDS_DIR, name)
+            current.add(remote_path)
+
+            content = str(yaml_io.dump_roster(alumno)).encode("utf-8")
+            sha = git_blob_sha(content)
+            if _local_blob_sha(state, remote_path, local_path) != sha:
+                with open(local_path, "wb") as f:
+                    f.write(content)
+            if remote_shas.get(remote_path) != sha:
+                to_push.append((remote_path, local_path))
+
+        for entry in os.scandir(ALUMNOS_SHARDS_DIR):
+            if entry.name.endswith(".yaml") and posixpath.join(remote_dir, entry.name) not in current:
+                os.remove(entry.path)
+
+    removed = sorted(
+        remote_path for remote_path in remote_shas
+        if remote_path.endswith(".yaml") and remote_path not in current
+    )
+    print(f"DEBUG: Fragmentos de alumnos: {len(to_push)} por subir, {len(removed)} por borrar.")
+    owned = {remote_path: remote_shas.get(remote_path) for remote_path in [*(path for path, _ in to_push), *removed]}
+    return to_push, removed, owned
+
+
+def sync_from_gitea(remote_paths: set[str] | None = None, keep_local_changes: bool = False) -> dict[str, str]:
+    """
+    Sincroniza alumnos.yaml y catalogo-servicios.yaml con Gitea de forma
+    condicional: compara el SHA de blob remoto con el del fichero local y
+    solo descarga y reescribe los que difieren. Con `remote_paths` solo
+    se consideran esos ficheros (p. ej. los que cambió un push en Gitea).
+    Con `keep_local_changes` (webhook) solo se descargan los ficheros que
+    se movieron en Gitea desde la última sincronización o push: el webhook
+    del propio push de la app no pisa lo guardado después en local.
+    Devuelve {ruta_remota: 'unchanged' | 'updated' | 'failed'}.
+    """
+    files = [f for f in _gitea_files() if remote_paths is None or f[0] in remote_paths]
+    if not files:
+        return {}
+    # Con varios workers (p. ej. la sincronización inicial de cada uno) se
+    # sincroniza de uno en uno: los siguientes ya encuentran los SHA al día
+    with _SYNC_LOCK:
+        return _sync_files(files, partial=remote_paths is not None, keep_local_changes=keep_local_changes)
+
+
+def _sync_files(files: list[tuple[str, str]], partial: bool, keep_local_changes: bool = False) -> dict[str, str]:
+    global GIT_SYNC_STATUS, LAST_SYNC_REPORT
+
+    remote_shas, unreachable = _list_remote_shas([remote for remote, _ in files])
+    state = _load_sync_state()
+    previous_state = json.dumps(state, sort_keys=True)
+    report: dict[str, str] = {}
+
+    pending = []
+    for remote_path, local_path in files:
+        if posixpath.dirname(remote_path) in unreachable:
+            report[remote_path] = "failed"
+        elif _is_unchanged(state, remote_path, local_path, remote_shas.get(remote_path), keep_local_changes):
+            report[remote_path] = "unchanged"
+        else:
+            pending.append((remote_path, local_path))
+
+    # Las descargas necesarias se hacen en paralelo; la escritura, bajo el cerrojo
+    responses = gitea_client.get_client().get_contents_many([remote for remote, _ in pending]) if pending else {}
+    for remote_path, local_path in pending:
+        with _WRITE_LOCK:
+            downloaded_sha = _store_downloaded_file(remote_path, local_path, responses[remote_path])
+            if downloaded_sha is None:
+                report[remote_path] = "failed"
+                continue
+            _remember_remote_sha(state, remote_path, local_path, downloaded_sha)
+            report[remote_path] = "updated"
+            if local_path == ALUMNOS_FILE:
+                # El fichero remoto sustituye al local, también a los cambios del diario
+                # (o a los del almacén SQLite, que se rellena con él)
+                _discard_journal()
+                if _sqlite_backend():
+                    _import_alumnos_file(student_store.get_store(config.ALUMNOS_DB))
+
+    if json.dumps(state, sort_keys=True) != previous_state:
+        _save_sync_state(state)
+    if partial:
+        # Sincronización parcial: se conserva el resultado de los demás ficheros
+        report = {**get_sync_status()["files"], **report}
+    GIT_SYNC_STATUS = all(status != "failed" for status in report.values())
+    LAST_SYNC_REPORT = report
+    shared_state.put(_SYNC_STATE_KEY, {"success": GIT_SYNC_STATUS, "files": report, "at": time.time()})
+    return {remote_path: report[remote_path] for remote_path, _ in files}
+
+
+def gitea_push_changed_files(payload: dict[str, Any]) -> list[str]:
+    """
+    Ficheros sincronizados (rutas remotas) que toca el evento push de un
+    webhook de Gitea en la rama configurada. [] si es otra rama o no los toca.
+    """
+    if payload.get("ref") != f"refs/heads/{config.GITEA_BRANCH}":
+        return []
+    touched: set[str] = set()
+    for commit in payload.get("commits") or []:
+        if isinstance(commit, dict):
+            for key in ("added", "modified", "removed"):
+                touched.update(str(path) for path in commit.get(key) or [])
+    return [remote_path for remote_path, _ in _gitea_files() if remote_path in touched]
+
 
 def sync_files_from_gitea() -> bool:
     """
-    Intenta descargar alumnos.yaml y catalogo-servicios.yaml.
+    Sincroniza alumnos.yaml y catalogo-servicios.yaml con Gitea.
     Actualiza la variable global GIT_SYNC_STATUS.
     """
-    global GIT_SYNC_STATUS
-    
-    # MODIFICACIÓN: Usamos las rutas REMOTAS (_REMOTE) para pedir a la API,
-    # pero guardamos en las rutas locales constantes (ALUMNOS_FILE, CATALOGO_FILE).
-    success_alumnos = _download_file_from_gitea(config.GITEA_FILE_PATH_REMOTE, ALUMNOS_FILE)
-    success_catalogo = _download_file_from_gitea(config.GITEA_CATALOGO_PATH_REMOTE, CATALOGO_FILE)
-    
-    if success_alumnos and success_catalogo:
-        GIT_SYNC_STATUS = True
-        return True
+    sync_from_gitea()
+    return GIT_SYNC_STATUS
+
+
+def get_sync_status() -> dict[str, Any]:
+    """
+    Última sincronización con Gitea hecha por cualquier worker:
+    {'success': bool, 'files': {ruta_remota: estado}, 'at': timestamp}.
+    Sin estado compartido, la de este proceso.
+    """
+    status = shared_state.get(_SYNC_STATE_KEY)
+    if not isinstance(status, dict):
+        return {"success": GIT_SYNC_STATUS, "files": dict(LAST_SYNC_REPORT), "at": None}
+    return status
+
+
+# Sincronización inicial en segundo plano (una por proceso)
+_INITIAL_SYNC_LOCK = threading.Lock()
+_INITIAL_SYNC_DONE = threading.Event()
+_INITIAL_SYNC: dict[str, Any] = {"started_at": None, "finished_at": None, "success": None}
+
+
+def _initial_sync() -> None:
+    try:
+        success = sync_files_from_gitea()
+    except Exception as e:
+        print(f"ERROR: Sincronización inicial con Gitea falló: {e}")
+        success = False
+    if success:
+        print("--- GIT: SINCRONIZADO CORRECTAMENTE ---")
     else:
-        GIT_SYNC_STATUS = False
-        return False
+        print("--- GIT: ERROR DE SINCRONIZACIÓN (Usando ficheros locales) ---")
+    _INITIAL_SYNC.update(finished_at=time.time(), success=success)
+    _INITIAL_SYNC_DONE.set()
+
+
+def start_initial_sync() -> bool:
+    """
+    Lanza la sincronización inicial con Gitea en un hilo aparte (solo la
+    primera vez). Mientras tanto la app sirve los ficheros locales.
+    Devuelve True si la ha lanzado ahora.
+    """
+    with _INITIAL_SYNC_LOCK:
+        if _INITIAL_SYNC["started_at"] is not None:
+            return False
+        _INITIAL_SYNC["started_at"] = time.time()
+    threading.Thread(target=_initial_sync, name="gitea-initial-sync", daemon=True).start()
+    return True
+
+
+def wait_initial_sync(timeout: float | None = None) -> bool:
+    """Espera a que termine la sincronización inicial. Devuelve True si terminó."""
+    return _INITIAL_SYNC_DONE.wait(timeout)
+
+
+def initial_sync_status() -> dict[str, Any]:
+    """
+    Estado de la sincronización inicial. `ready` es True cuando ha terminado
+    (con éxito o no) o cuando lleva más de INITIAL_SYNC_TIMEOUT segundos.
+    """
+    status = dict(_INITIAL_SYNC)
+    started_at = status["started_at"]
+    timed_out = (
+        started_at is not None and not _INITIAL_SYNC_DONE.is_set()
+        and time.time() - started_at >= config.INITIAL_SYNC_TIMEOUT
+    )
+    status["done"] = _INITIAL_SYNC_DONE.is_set()
+    status["timed_out"] = timed_out
+    status["ready"] = status["done"] or timed_out
+    return status
 
 def get_next_student_id() -> str:
     """Calcula el siguiente ID disponible basado en los existentes."""
-    alumnos = load_alumnos()
-    max_id = 0
-    for alumno in alumnos:
-        try:
-            curr_id = int(str(alumno.get("id", 0)))
-            if curr_id > max_id:
-                max_id = curr_id
-        except (ValueError, TypeError):
-            continue
-    return str(max_id + 1).zfill(3)
+    return get_student_repository().next_id()
 
 
 def save_alumno_changes(
@@ -131,92 +1015,181 @@ def save_alumno_changes(
     - Valida duplicidad de nombre.
     - Regenera automáticamente la lista check-http basándose en el catálogo.
     """
-    if not os.path.exists(ALUMNOS_FILE) and not isinstance(load_alumnos(), list):
-         alumnos_data: YamlData = []
-    else:
-        alumnos_data = load_alumnos()
-        
     servicios_data: YamlData = load_catalogo()
-    
-    # 1. Validación de unicidad de nombre
-    for alumno in alumnos_data:
-        existing_id = str(alumno.get("id"))
-        existing_name = str(alumno.get("nombre", "")).strip().lower()
-        
+    clean_name = new_name.strip()
+
+    # 1. Preparar mapa de puertos y URLs
+    service_ports = _service_ports(servicios_data)
+    new_check_http = _build_check_http(clean_name, new_apps, service_ports)
+
+    with _WRITE_LOCK:
+        # El cambio se aplica en el sitio sobre el repositorio cacheado (O(1)):
+        # los registros se sustituyen, así que quien los esté leyendo no lo nota
+        repo = get_student_repository()
+
+        # 2. Validación de unicidad de nombre
         # Si el nombre coincide Y el ID es distinto, es un duplicado prohibido.
-        if existing_name == new_name.strip().lower() and existing_id != str(student_id):
+        if repo.is_name_taken(clean_name, student_id):
             return False, f"El nombre '{new_name}' ya está en uso por otro alumno."
 
-    # 2. Preparar mapa de puertos y URLs
-    service_ports: dict[str, int] = {}
-    for service in servicios_data:
-        sid = service.get("id")
-        port = service.get("port")
-        if isinstance(sid, str) and isinstance(port, int):
-            service_ports[sid] = port
-
-    new_check_http: list[str] = []
-    for app_id in new_apps:
-        port = service_ports.get(app_id)
-        if port is not None:
-            # Formato requerido: http://<app>-service.<alumno>.svc.cluster.local:<port>
-            url = f"http://{app_id}-service.{new_name.strip()}.svc.cluster.local:{port}"
-            new_check_http.append(url)
-
-    # 3. Buscar para Actualizar o Crear
-    student_found = False
-    for alumno in alumnos_data:
-        if str(alumno.get('id')) == str(student_id):
-            # ACTUALIZAR
-            alumno['nombre'] = new_name.strip()
-            alumno['apps'] = new_apps
-            alumno['check-http'] = new_check_http
-            student_found = True
-            break
-    
-    if not student_found:
-        # CREAR NUEVO
-        new_student: YamlItem = {
-            "nombre": new_name.strip(),
+        # 3. Actualizar o Crear (el repositorio conserva la posición si ya existe)
+        created = repo.upsert({
+            "nombre": clean_name,
             "id": str(student_id),
             "apps": new_apps,
             "check-http": new_check_http
-        }
-        alumnos_data.append(new_student)
+        })
 
-    # 4. Guardar en disco
-    try:
-        with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
-            yaml.safe_dump(alumnos_data, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
-        
-        action_type = "actualizado" if student_found else "creado"
-        return True, f"Alumno {action_type} correctamente."
+        # 4. Guardar (diario o fichero completo, según configuración)
+        try:
+            record = dict(repo.get(student_id) or {})
+            _persist_change(repo, {"op": "upsert", "record": record})
+            action_type = "creado" if created else "actualizado"
+            return True, f"Alumno {action_type} correctamente."
 
-    except Exception as exc:
-        print(f"Error al guardar: {exc}")
-        return False, f"Error interno: {str(exc)}"
+        except Exception as exc:
+            print(f"Error al guardar: {exc}")
+            return False, f"Error interno: {str(exc)}"
 
 
 def delete_student(student_id: str | int) -> tuple[bool, str]:
     """Elimina un alumno por su ID."""
-    if not os.path.exists(ALUMNOS_FILE):
+    if not _sqlite_backend() and not os.path.exists(ALUMNOS_FILE):
         return False, "Fichero de alumnos no encontrado."
     
-    alumnos = load_alumnos()
-    initial_count = len(alumnos)
-    
-    # Filtramos para eliminar el que coincida
-    new_alumnos = [a for a in alumnos if str(a.get('id')) != str(student_id)]
-    
-    if len(new_alumnos) == initial_count:
-        return False, "Alumno no encontrado."
-        
-    try:
-        with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
-             yaml.safe_dump(new_alumnos, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
-        return True, "Alumno eliminado correctamente."
-    except Exception as exc:
-        return False, f"Error al borrar: {str(exc)}"
+    with _WRITE_LOCK:
+        repo = get_student_repository()
+        if repo.delete(student_id) is None:
+            return False, "Alumno no encontrado."
+            
+        try:
+            _persist_change(repo, {"op": "delete", "id": str(student_id)})
+            return True, "Alumno eliminado correctamente."
+        except Exception as exc:
+            return False, f"Error al borrar: {str(exc)}"
+
+
+BULK_OPERATIONS = ("create", "update", "delete")
+BULK_CSV_APPS_SEPARATOR = ";"
+
+
+def parse_bulk_csv(raw_text: str) -> list[dict[str, Any]]:
+    """
+    Convierte un CSV de operaciones masivas en la lista que acepta
+    apply_bulk_operations. Columnas: op,id,nombre,apps (apps separadas por ';').
+    Si falta 'op' se asume 'create'.
+    """
+    operations: list[dict[str, Any]] = []
+    for row in csv.DictReader(io.StringIO(raw_text)):
+        operation: dict[str, Any] = {"op": (row.get("op") or "create").strip()}
+        if (row.get("id") or "").strip():
+            operation["id"] = row["id"].strip()
+        if row.get("nombre") is not None:
+            operation["nombre"] = row["nombre"]
+        if row.get("apps") is not None:
+            operation["apps"] = [
+                app.strip() for app in row["apps"].split(BULK_CSV_APPS_SEPARATOR) if app.strip()
+            ]
+        operations.append(operation)
+    return operations
+
+
+def _apply_bulk_operation(
+    repo: StudentRepository, operation: Any, service_ports: dict[str, int]
+) -> tuple[str, str, str | None]:
+    """
+    Valida y aplica una operación sobre `repo`.
+    Devuelve (acción, id, error); si hay error no se modifica nada.
+    """
+    if not isinstance(operation, dict):
+        return "", "", "La operación no es un objeto válido."
+
+    action = str(operation.get("op", "create")).strip().lower()
+    if action not in BULK_OPERATIONS:
+        return action, "", f"Operación desconocida '{action}'."
+
+    raw_id = operation.get("id")
+    sid = str(raw_id).strip() if raw_id not in (None, "") else ""
+
+    if action == "delete":
+        if not sid:
+            return action, sid, "El ID es obligatorio."
+        if repo.delete(sid) is None:
+            return action, sid, "Alumno no encontrado."
+        return action, sid, None
+
+    existing = repo.get(sid) if sid else None
+    if action == "create":
+        if not sid:
+            sid = repo.next_id()
+        elif existing is not None:
+            return action, sid, f"El ID {sid} ya existe."
+    elif existing is None:
+        return action, sid, "Alumno no encontrado."
+
+    default_name = existing.get("nombre", "") if existing else ""
+    nombre = str(operation.get("nombre", default_name) or "").strip()
+    if not nombre:
+        return action, sid, "El nombre no puede estar vacío."
+    if repo.is_name_taken(nombre, sid):
+        return action, sid, f"El nombre '{nombre}' ya está en uso por otro alumno."
+
+    apps = operation.get("apps", existing.get("apps", []) if existing else [])
+    if not isinstance(apps, list) or not all(isinstance(app, str) for app in apps):
+        return action, sid, "La lista 'apps' es inválida."
+    for app in apps:
+        if app not in service_ports:
+            return action, sid, f"La aplicación '{app}' no existe en el catálogo."
+
+    repo.upsert({
+        "nombre": nombre,
+        "id": sid,
+        "apps": list(apps),
+        "check-http": _build_check_http(nombre, apps, service_ports),
+    })
+    return action, sid, None
+
+
+def apply_bulk_operations(operations: list[Any]) -> tuple[bool, str, list[dict[str, Any]]]:
+    """
+    Aplica en bloque altas/modificaciones/bajas de alumnos.
+    Valida todas las filas en una sola pasada (unicidad, apps del catálogo,
+    check-http) sobre una copia del repositorio y, solo si todas son válidas,
+    guarda con una única escritura. Devuelve (éxito, mensaje, resultado por fila).
+    """
+    service_ports = _service_ports(load_catalogo())
+    results: list[dict[str, Any]] = []
+    counts = {action: 0 for action in BULK_OPERATIONS}
+
+    with _WRITE_LOCK:
+        staging = get_student_repository().copy()
+        for row, operation in enumerate(operations, start=1):
+            action, sid, error = _apply_bulk_operation(staging, operation, service_ports)
+            results.append({
+                "row": row,
+                "op": action,
+                "id": sid,
+                "success": error is None,
+                "message": error or "OK",
+            })
+            if error is None:
+                counts[action] += 1
+
+        failed = sum(1 for result in results if not result["success"])
+        if failed:
+            return False, f"No se ha aplicado ningún cambio: {failed} fila(s) con errores.", results
+
+        try:
+            _save_roster(staging)
+        except Exception as exc:
+            print(f"Error al guardar: {exc}")
+            return False, f"Error interno: {str(exc)}", results
+
+    message = (
+        f"Cambios aplicados: {counts['create']} altas, "
+        f"{counts['update']} modificaciones y {counts['delete']} bajas."
+    )
+    return True, message, results
 
 
 def validate_and_save_raw_yaml(raw_text: str) -> tuple[bool, str]:
@@ -226,7 +1199,7 @@ def validate_and_save_raw_yaml(raw_text: str) -> tuple[bool, str]:
     """
     # 1. Validación de Sintaxis YAML
     try:
-        data = yaml.safe_load(raw_text)
+        data = yaml_io.safe_load(raw_text)
     except yaml.YAMLError as e:
         return False, f"Error de sintaxis YAML: {str(e)}"
 
@@ -288,109 +1261,286 @@ def validate_and_save_raw_yaml(raw_text: str) -> tuple[bool, str]:
         if current_urls != expected_urls:
             return False, f"Error en 'check-http' para {nombre}. Las URLs no coinciden con las apps asignadas."
 
-    # 4. Guardar
-    try:
-        with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
-            yaml.safe_dump(data, f, allow_unicode=True, default_flow_style=False, sort_keys=False)
-        return True, "Fichero YAML validado y guardado correctamente."
-    except Exception as e:
-        return False, f"Error de escritura: {str(e)}"
+    # 4. Guardar (sustituye el fichero completo: el diario deja de aplicar)
+    with _WRITE_LOCK:
+        if _sqlite_backend():
+            try:
+                _store_roster(StudentRepository(data))
+                return True, "Fichero YAML validado y guardado correctamente."
+            except Exception as e:
+                return False, f"Error de escritura: {str(e)}"
+        try:
+            with open(ALUMNOS_FILE, "w", encoding="utf-8") as f:
+                yaml_io.dump_roster(data, f)
+            _discard_journal()
+            return True, "Fichero YAML validado y guardado correctamente."
+        except Exception as e:
+            return False, f"Error de escritura: {str(e)}"
+        finally:
+            _invalidate_cache(ALUMNOS_FILE)
 
-def push_alumnos_to_gitea(commit_message: str = "Update alumnos.yaml from EduGitOps App") -> tuple[bool, str]:
+def _read_push_contents(files: list[tuple[str, str]]) -> dict[str, bytes]:
+    """Contenido local a subir de cada ruta remota (alumnos.yaml ya compactado)."""
+    contents: dict[str, bytes] = {}
+    for remote_path, local_path in files:
+        if local_path == ALUMNOS_FILE:
+            # En modo SQLite es aquí cuando se escribe el alumnos.yaml canónico
+            text = materialize_alumnos() if _sqlite_backend() else get_raw_alumnos_yaml()
+            if text:
+                contents[remote_path] = text.encode('utf-8')
+            continue
+        try:
+            with open(local_path, "rb") as f:
+                contents[remote_path] = f.read()
+        except OSError:
+            print(f"DEBUG: {local_path} no existe, no se sube.")
+    return contents
+
+
+def _build_file_changes(
+    contents: dict[str, bytes], base_shas: dict[str, str], remote_shas: dict[str, str]
+) -> tuple[list[dict[str, Any]], list[str]]:
     """
-    Sube el contenido actual de alumnos.yaml local al repositorio Gitea.
+    Operaciones del endpoint multi-fichero de Gitea para los ficheros que han
+    cambiado en local desde la última sincronización o push (`base_shas`).
+    Se envían con ese SHA como base, así Gitea rechaza el commit si el
+    remoto se movió entretanto. Un fichero sin SHA base solo se crea si no
+    existe en Gitea (`remote_shas`); si existe con otro contenido es un
+    conflicto. Devuelve (operaciones, rutas en conflicto).
     """
-    # 1. Leer contenido local (Usa la ruta local definida al inicio del archivo)
-    content_yaml = get_raw_alumnos_yaml()
-    if not content_yaml:
-        return False, "El fichero local alumnos.yaml está vacío o no existe."
+    changes: list[dict[str, Any]] = []
+    conflicts: list[str] = []
+    for remote_path, content in contents.items():
+        local_sha = git_blob_sha(content)
+        base_sha = base_shas.get(remote_path)
+        if base_sha is None:
+            remote_sha = remote_shas.get(remote_path)
+            if remote_sha == local_sha:
+                continue
+            if remote_sha is not None:
+                conflicts.append(remote_path)
+                continue
+        elif base_sha == local_sha:
+            continue
+        change: dict[str, Any] = {
+            "operation": "update" if base_sha else "create",
+            "path": remote_path,
+            "content": base64.b64encode(content).decode('utf-8'),
+        }
+        if base_sha:
+            change["sha"] = base_sha
+        changes.append(change)
+    return changes, conflicts
 
-    # 2. Configurar URL usando la RUTA REMOTA
-    # MODIFICACIÓN: Usamos GITEA_FILE_PATH_REMOTE para apuntar a edugitops/alumnos.yaml
-    api_url = f"{config.GITEA_API_URL}/repos/{config.GITEA_REPO_OWNER}/{config.GITEA_REPO_NAME}/contents/{config.GITEA_FILE_PATH_REMOTE}"
-    
-    # --- DEBUG ---
-    print(f"DEBUG: Intentando conectar a: {api_url}")
-    print(f"DEBUG: Branch configurada: {config.GITEA_BRANCH}")
-    # -------------
 
-    auth_creds = (config.GITEA_USER, config.GITEA_PASSWORD)
+def _conflict_message(remote_paths: list[str]) -> str:
+    return (
+        f"Conflicto con Gitea: {', '.join(sorted(remote_paths))} ha cambiado en Gitea desde "
+        "la última sincronización. Sincroniza antes de volver a subir."
+    )
+
+
+_MONITORING_LOCK = shared_state.ProcessLock("monitoring")
+
+
+def _run_monitoring(job: jobs.Job) -> dict[str, Any]:
+    """
+    Regenera la monitorización de Checkmk en proceso (tarea en segundo plano):
+    reconcilia las reglas con alumnos.yaml y el catálogo mediante la API REST.
+    La traza queda en job.stdout y el resumen es el resultado de la tarea.
+    """
+    lines: list[str] = []
+
+    def log(message: str) -> None:
+        print(f"DEBUG: {message}")
+        lines.append(message)
+        job.stdout = "\n".join(lines)
 
     try:
-        # 3. Obtener SHA del archivo remoto
-        params = {'ref': config.GITEA_BRANCH}
-        
-        print("DEBUG: Solicitando SHA actual...")
-        response_get = requests.get(api_url, auth=auth_creds, params=params, timeout=5)
-        
-        sha = None
-        
-        if response_get.status_code == 200:
-            data_json = response_get.json()
-            sha = data_json.get('sha')
-            print(f"DEBUG: SHA encontrado: {sha}")
-        elif response_get.status_code == 404:
-            print("DEBUG: Archivo no encontrado en remoto (Se creará uno nuevo).")
-        else:
-            return False, f"Error al consultar Gitea ({response_get.status_code}): {response_get.text}"
+        # Dos workers no deben reconciliar (y activar) Checkmk a la vez
+        with _MONITORING_LOCK:
+            return monitoring.run_monitoring(load_alumnos(), load_catalogo(), log=log)
+    except checkmk_client.CheckmkError as exc:
+        print(f"ERROR: Monitorización falló: {exc}")
+        job.stderr = exc.body
+        raise
 
-        # 4. Codificar contenido en Base64
-        content_encoded = base64.b64encode(content_yaml.encode('utf-8')).decode('utf-8')
 
-        # 5. Preparar Payload
-        data = {
-            "content": content_encoded,
-            "message": commit_message,
-            "branch": config.GITEA_BRANCH,
-        }
-        
-        if sha:
-            data["sha"] = sha
+# Los pushes seguidos comparten una única regeneración de Checkmk
+_MONITORING_SCHEDULER = jobs.CoalescingScheduler("monitoring", _run_monitoring)
 
-        # 6. Enviar PUT (Push)
-        print("DEBUG: Enviando PUT...")
-        response_put = requests.put(api_url, auth=auth_creds, json=data, timeout=10)
 
-        if response_put.status_code in [200, 201]:
-            print("DEBUG: Push exitoso.")
-            
-            try:
-                # BASE_DIR es ".../src"
-                # Subimos un nivel para ir a la raíz de la app (".../app" o ".../app-edugitops")
-                app_root = os.path.dirname(BASE_DIR)
-                
-                # La ruta es siempre fija: app_root/monitoring-scripts/monitoriza-laboratorios.py
-                script_path = os.path.join(app_root, "monitoring-scripts", "monitoriza-laboratorios.py")
-                
-                print(f"DEBUG: Ejecutando script de monitorización: {script_path}")
-                
-                # Ejecutamos
-                result = subprocess.run(
-                    ["python3", script_path], 
-                    capture_output=True, 
-                    text=True,
-                    timeout=60 # Damos algo más de tiempo por si Checkmk es lento
-                )
-                
-                if result.returncode == 0:
-                    print(f"DEBUG: Script Monitorización OK:\n{result.stdout}")
-                else:
-                    print(f"ERROR: Script Monitorización falló (Code {result.returncode}):\n{result.stderr}")
-                    
-            except Exception as e:
-                print(f"ERROR EXCEPCIÓN al ejecutar script monitorización: {str(e)}")
-            # -------------------------------------------------------          
+def schedule_monitoring() -> jobs.Job:
+    """
+    Pide la regeneración de Checkmk y devuelve la tarea que la hará.
+    Si ya hay una esperando (dentro de JOBS_COALESCE_WINDOW) se reutiliza.
+    """
+    job = _MONITORING_SCHEDULER.trigger()
+    if job.coalesced:
+        print(f"DEBUG: Monitorización agrupada con la tarea pendiente {job.id} ({job.coalesced} agrupados).")
+    else:
+        print(f"DEBUG: Monitorización encolada (tarea {job.id}).")
+    return job
+
+
+def get_monitoring_stats() -> dict[str, int]:
+    """Disparos de monitorización recibidos, ejecutados y agrupados."""
+    return _MONITORING_SCHEDULER.get_stats()
+
 
-            return True, "Push realizado con éxito a Gitea."
+def push_files_to_gitea(
+    files: list[tuple[str, str]], commit_message: str, removed: list[str] | None = None,
+    owned: dict[str, str | None] | None = None,
+) -> tuple[bool, str, list[str]]:
+    """
+    Sube varios ficheros locales a Gitea en un único commit (POST /contents)
+    y, en el mismo commit, borra las rutas remotas de `removed`.
+    Solo viajan los ficheros cuyo contenido difiere del último SHA
+    sincronizado o subido (el del estado de sincronización), y con ese SHA:
+    si alguien cambió el fichero en Gitea entretanto, Gitea rechaza el commit
+    y se informa del conflicto sin sobrescribir nada. Solo se lista el
+    directorio para las rutas sin SHA recordado.
+    `owned` son rutas que genera la app (los fragmentos por alumno) con su
+    SHA remoto actual (None si no existen): se sobrescriben o borran sobre él.
+    Devuelve (éxito, mensaje, rutas subidas o borradas).
+    """
+    contents = _read_push_contents(files)
+    if not contents:
+        return False, "El fichero local alumnos.yaml está vacío o no existe.", []
+
+    client = gitea_client.get_client()
+    local_paths = dict(files)
+    removed = removed or []
+    owned = owned or {}
+    state = _load_sync_state()
+    base_shas = {
+        remote_path: str(state[remote_path]["sha"])
+        for remote_path in [*contents, *removed]
+        if remote_path not in owned and isinstance(state.get(remote_path), dict) and state[remote_path].get("sha")
+    }
+    base_shas.update({remote_path: sha for remote_path, sha in owned.items() if sha})
+
+    print(f"DEBUG: Intentando conectar a: {client.repo_url}/contents")
+    print(f"DEBUG: Branch configurada: {client.branch}")
+
+    remote_shas: dict[str, str] = {}
+    unknown = [remote_path for remote_path in [*contents, *removed] if remote_path not in base_shas and remote_path not in owned]
+    if unknown:
+        print("DEBUG: Solicitando SHA actuales...")
+        remote_shas, unreachable = _list_remote_shas(unknown)
+        if unreachable:
+            return False, "Error de conexión con Gitea: no se pudo listar el repositorio.", []
+
+    changes, conflicts = _build_file_changes(contents, base_shas, remote_shas)
+    if conflicts:
+        print(f"DEBUG: Push cancelado, {conflicts} difieren en Gitea y no hay SHA base.")
+        return False, _conflict_message(conflicts), []
+    for remote_path in contents.keys() - base_shas.keys() - {change["path"] for change in changes}:
+        # Ya coincidía con Gitea: queda como base del próximo push
+        _remember_remote_sha(state, remote_path, local_paths[remote_path], remote_shas[remote_path])
+    for remote_path in removed:
+        sha = base_shas.get(remote_path) or remote_shas.get(remote_path)
+        if sha:
+            changes.append({"operation": "delete", "path": remote_path, "sha": sha})
         else:
-            return False, f"Error en Push ({response_put.status_code}): {response_put.text}"
+            # Ya no existe en Gitea
+            state.pop(remote_path, None)
+    if not changes:
+        _save_sync_state(state)
+        return True, "Sin cambios: Gitea ya tiene la versión local.", []
+
+    payload = {
+        "branch": client.branch,
+        "message": commit_message,
+        "files": changes,
+    }
+    print(f"DEBUG: Enviando commit con {[change['path'] for change in changes]}...")
+    response = client.change_files(payload)
+
+    if response.status_code in (409, 422):
+        # El SHA base ya no es el del remoto: alguien lo cambió en Gitea
+        print(f"DEBUG: Gitea rechaza el SHA base ({response.status_code}): {response.text}")
+        return False, _conflict_message([change["path"] for change in changes]), []
+    if response.status_code not in (200, 201):
+        return False, f"Error en Push ({response.status_code}): {response.text}", []
+
+    # Recordamos los nuevos SHA remotos: la próxima sincro no los descargará
+    try:
+        pushed = {str(f.get('path')): f.get('sha') for f in response.json().get('files') or [] if f}
+    except (ValueError, AttributeError, TypeError):
+        pushed = {}
+    for change in changes:
+        if change["operation"] == "delete":
+            state.pop(change["path"], None)
+            continue
+        # Sin SHA en la respuesta, el de blob del contenido subido es el mismo
+        pushed_sha = pushed.get(change["path"])
+        if not isinstance(pushed_sha, str):
+            pushed_sha = git_blob_sha(contents[change["path"]])
+        _remember_remote_sha(state, change["path"], local_paths[change["path"]], pushed_sha)
+    _save_sync_state(state)
+    return True, "Push realizado con éxito a Gitea.", [change["path"] for change in changes]
+
+
+def push_alumnos_to_gitea(
+    commit_message: str = "Update alumnos.yaml from EduGitOps App",
+) -> tuple[bool, str, list[str]]:
+    """
+    Sube alumnos.yaml y catalogo-servicios.yaml locales a Gitea en un único
+    commit (solo los que han cambiado). En modo ALUMNOS_SHARDED el mismo
+    commit lleva los ficheros por alumno que han cambiado o desaparecido.
+    Devuelve (éxito, mensaje, rutas remotas incluidas en el commit); la lista
+    está vacía si Gitea ya tenía la versión local.
+    La monitorización no se regenera aquí: quien llama la encola con
+    schedule_monitoring() (solo hace falta si se ha subido algo).
+    """
+    try:
+        # Antes se compacta el diario: a Git solo sube el alumnos.yaml canónico.
+        compact_journal()
+        files = _gitea_files()
+        removed: list[str] = []
+        owned: dict[str, str | None] = {}
+        if config.ALUMNOS_SHARDED:
+            # Solo viajan los fragmentos de los alumnos que han cambiado
+            shards, removed, owned = write_alumnos_shards()
+            files += shards
+        success, message, committed = push_files_to_gitea(files, commit_message, removed, owned)
+        if not success:
+            return False, message, []
+
+        print(f"DEBUG: {message}")
+        return True, message, committed
 
     except requests.exceptions.RequestException as e:
         # Este es el bloque que falta y que el test está esperando
         print(f"DEBUG: Excepción Request: {e}")
-        return False, f"Error de conexión con Gitea: {str(e)}"
+        return False, f"Error de conexión con Gitea: {str(e)}", []
 
     except Exception as e:
         # Este bloque captura cualquier otro error imprevisto
         print(f"DEBUG: Excepción General: {e}")
-        return False, f"Error inesperado: {str(e)}"
\ No newline at end of file
+        return False, f"Error inesperado: {str(e)}", []
+
+
+# --- Métricas que se calculan al exportar /metrics ---
+
+def _yaml_cache_hit_ratio() -> float:
+    stats = get_cache_stats()
+    lookups = stats["hits"] + stats["misses"]
+    return stats["hits"] / lookups if lookups else 0.0
+
+
+metrics.callback("edugitops_roster_students", "Alumnos en alumnos.yaml (con el diario aplicado).", lambda: len(load_alumnos()))
+metrics.callback("edugitops_catalog_services", "Servicios del catálogo.", lambda: len(load_catalogo()))
+metrics.callback(
+    "edugitops_yaml_cache_lookups_total", "Consultas a la caché YAML por resultado.",
+    lambda: {("hit",): get_cache_stats()["hits"], ("miss",): get_cache_stats()["misses"]}, ("result",),
+    kind="counter", per_process=True,
+)
+metrics.callback(
+    "edugitops_yaml_cache_hit_ratio", "Proporción de aciertos de la caché YAML.", _yaml_cache_hit_ratio, per_process=True
+)
+metrics.callback(
+    "edugitops_monitoring_triggers_total", "Peticiones de regeneración de Checkmk (recibidas, ejecutadas, agrupadas).",
+    lambda: {(key,): value for key, value in get_monitoring_stats().items()}, ("result",), kind="counter",
+)
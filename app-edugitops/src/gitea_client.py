@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import hashlib
+import hmac
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+import metrics
+import profiling
+
+# Códigos de Gitea ante los que merece la pena reintentar (errores transitorios)
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class GiteaClient:
+    """
+    Cliente HTTP de la API de Gitea.
+    - Una única requests.Session con keep-alive y pool de conexiones.
+    - Reintentos con backoff exponencial ante errores de conexión y 5xx
+      (los 5xx solo en métodos idempotentes: un PUT/POST no se repite).
+    - Timeouts configurables y registro de latencia por operación.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        owner: str,
+        repo: str,
+        branch: str,
+        auth: tuple[str, str],
+        pool_size: int = 4,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        timeout: tuple[float, float] = (3.05, 10.0),
+    ) -> None:
+        self.repo_url = f"{api_url.rstrip('/')}/repos/{owner}/{repo}"
+        self.branch = branch
+        self.timeout = timeout
+        self.pool_size = max(1, pool_size)
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.auth = auth
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._stats: dict[str, dict[str, float]] = {}
+        self._stats_lock = threading.Lock()
+
+    # --- Registro de latencias ---
+
+    def _record(self, operation: str, elapsed: float, failed: bool) -> None:
+        elapsed_ms = elapsed * 1000
+        with self._stats_lock:
+            stats = self._stats.setdefault(
+                operation, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0}
+            )
+            stats["count"] += 1
+            stats["errors"] += 1 if failed else 0
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["last_ms"] = elapsed_ms
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Latencias por operación: {op: {count, errors, total_ms, max_ms, last_ms}}."""
+        with self._stats_lock:
+            return {operation: dict(values) for operation, values in self._stats.items()}
+
+    # --- Peticiones ---
+
+    def request(self, method: str, path: str, operation: str, **kwargs: Any) -> requests.Response:
+        """Petición a la API del repositorio (path relativo a /repos/{owner}/{repo})."""
+        kwargs.setdefault("timeout", self.timeout)
+        url = f"{self.repo_url}/{path.lstrip('/')}" if path else self.repo_url
+        start = time.perf_counter()
+        failed = True
+        status = "error"
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 500
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            self._record(operation, elapsed, failed)
+            metrics.GITEA_SECONDS.observe(elapsed, operation=operation, status=status)
+            profiling.record("gitea", elapsed)
+
+    def get_contents(self, remote_path: str) -> requests.Response:
+        """GET /contents/{ruta} en la rama configurada (fichero o listado de directorio)."""
+        path = f"contents/{remote_path}" if remote_path else "contents"
+        return self.request("GET", path, "get_contents", params={"ref": self.branch})
+
+    def put_contents(self, remote_path: str, payload: dict[str, Any]) -> requests.Response:
+        """PUT /contents/{ruta}: crea o actualiza un fichero (un commit)."""
+        return self.request("PUT", f"contents/{remote_path}", "put_contents", json=payload)
+
+    def change_files(self, payload: dict[str, Any]) -> requests.Response:
+        """POST /contents: crea, actualiza o borra varios ficheros en un solo commit."""
+        return self.request("POST", "contents", "change_files", json=payload)
+
+    def get_contents_many(self, remote_paths: list[str]) -> dict[str, requests.Response | Exception]:
+        """
+        Descarga varias rutas en paralelo (hasta el tamaño del pool).
+        Devuelve la respuesta o la excepción de cada ruta, sin lanzar.
+        """
+        def fetch(remote_path: str) -> requests.Response | Exception:
+            try:
+                return self.get_contents(remote_path)
+            except Exception as exc:
+                return exc
+
+        if len(remote_paths) <= 1:
+            return {path: fetch(path) for path in remote_paths}
+
+        workers = min(self.pool_size, len(remote_paths))
+        # Cada hilo hereda el contexto de la petición (tramos de Server-Timing)
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(remote_paths, executor.map(lambda path: context.copy().run(fetch, path), remote_paths)))
+
+
+def verify_webhook_signature(secret: str, body: bytes, signature: str) -> bool:
+    """Comprueba X-Gitea-Signature: HMAC-SHA256 (hex) del cuerpo con el secreto del webhook."""
+    if not secret or not signature:
+        return False
+    expected = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature.strip().lower())
+
+
+_CLIENT: GiteaClient | None = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client() -> GiteaClient:
+    """Cliente compartido por todo el proceso, creado a partir de config.py."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = GiteaClient(
+                api_url=config.GITEA_API_URL,
+                owner=config.GITEA_REPO_OWNER,
+                repo=config.GITEA_REPO_NAME,
+                branch=config.GITEA_BRANCH,
+                auth=(config.GITEA_USER, config.GITEA_PASSWORD),
+                pool_size=config.GITEA_POOL_SIZE,
+                max_retries=config.GITEA_MAX_RETRIES,
+                backoff_factor=config.GITEA_RETRY_BACKOFF,
+                timeout=(config.GITEA_CONNECT_TIMEOUT, config.GITEA_READ_TIMEOUT),
+            )
+        return _CLIENT
+
+
+def reset_client() -> None:
+    """Descarta el cliente compartido (p. ej. tras cambiar la configuración)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is not None:
+            _CLIENT.session.close()
+        _CLIENT = None
@@ -0,0 +1,27 @@
+# Configuración de gunicorn (servidor WSGI de producción).
+# Uso: gunicorn -c src/gunicorn.conf.py wsgi:app
+#
+# Varios procesos worker (WEB_WORKERS) con varios hilos cada uno (WEB_THREADS).
+# Lo que debe ser común a todos (estado de la sincro con Gitea, generaciones de
+# caché, tareas y cerrojos de escritura) vive en SHARED_STATE_DB (shared_state.py).
+from typing import Any
+
+# (con otro nombre: gunicorn interpretaría 'config' como uno de sus ajustes)
+import config as app_config
+
+bind = f"0.0.0.0:{app_config.FLASK_PORT}"
+workers = max(1, app_config.WEB_WORKERS)
+threads = max(1, app_config.WEB_THREADS)
+worker_class = "gthread"
+timeout = app_config.WEB_TIMEOUT
+# Cada worker crea la app tras el fork: sus hilos (sincronización inicial, watch
+# de Kubernetes, cola de tareas) y conexiones no se heredan del proceso maestro
+preload_app = False
+accesslog = "-"
+errorlog = "-"
+
+
+def worker_exit(server: Any, worker: Any) -> None:
+    """Última publicación de las métricas del worker: sus contadores siguen sumando en /metrics."""
+    import metrics
+    metrics.publish()
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Any
+from urllib.parse import urlsplit
+
+import checkmk_rules
+import config
+import data_manager
+import metrics
+import monitoring
+
+STATUS_UP = "up"
+STATUS_DOWN = "down"
+
+
+def endpoints_from_roster(students: list[dict[str, Any]], catalog: dict[str, dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Servicios a sondear según alumnos.yaml y el catálogo: los mismos destinos
+    que las reglas de Checkmk (<app>-service.<alumno>.svc.cluster.local).
+    """
+    desired, _ = checkmk_rules.build_desired_rules(students, catalog)
+    endpoints = []
+    for label, rule in sorted(desired.items()):
+        if rule["protocol"] == "http":
+            parts = urlsplit(rule["url"])
+            host, port = parts.hostname or "", parts.port or 80
+        else:
+            host, port = str(rule["address"]), int(rule["port"])
+        # <servicio>.<namespace>.svc.cluster.local
+        service, _, rest = host.partition(".")
+        endpoints.append({
+            "service_label": label,
+            "protocol": rule["protocol"],
+            "target": rule["target"],
+            "host": host,
+            "port": port,
+            "url": rule.get("url"),
+            "service": service,
+            "namespace": rest.partition(".")[0],
+        })
+    return endpoints
+
+
+async def probe_tcp(host: str, port: int, timeout: float) -> tuple[str, str]:
+    """Abre y cierra una conexión TCP. Devuelve (estado, detalle)."""
+    _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return STATUS_UP, "TCP conectado"
+
+
+async def probe_http(url: str, timeout: float) -> tuple[str, str]:
+    """GET mínimo (HTTP/1.1, Connection: close): arriba si responde 2xx/3xx."""
+    parts = urlsplit(url)
+    host, port = parts.hostname or "", parts.port or 80
+    path = parts.path or "/"
+    if parts.query:
+        path = f"{path}?{parts.query}"
+
+    async def exchange() -> int:
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: edugitops-health\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1")
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+        finally:
+            writer.close()
+        fields = status_line.split()
+        if len(fields) < 2 or not fields[1].isdigit():
+            raise ConnectionError("respuesta HTTP inválida")
+        return int(fields[1])
+
+    code = await asyncio.wait_for(exchange(), timeout)
+    return (STATUS_UP if 200 <= code < 400 else STATUS_DOWN), f"HTTP {code}"
+
+
+async def _probe(endpoint: dict[str, Any], timeout: float, semaphore: asyncio.Semaphore) -> dict[str, Any]:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            if endpoint["protocol"] == "http":
+                status, detail = await probe_http(endpoint["url"], timeout)
+            else:
+                status, detail = await probe_tcp(endpoint["host"], endpoint["port"], timeout)
+        except asyncio.TimeoutError:
+            status, detail = STATUS_DOWN, f"Sin respuesta en {timeout:g}s"
+        except (OSError, ConnectionError) as exc:
+            status, detail = STATUS_DOWN, str(exc) or type(exc).__name__
+        latency_ms = round((time.perf_counter() - start) * 1000, 1)
+    return {**endpoint, "status": status, "detail": detail, "latency_ms": latency_ms}
+
+
+def sweep(endpoints: list[dict[str, Any]], timeout: float = 2.0, concurrency: int = 200) -> list[dict[str, Any]]:
+    """Sondea todos los servicios a la vez (como mucho `concurrency` conexiones abiertas)."""
+    if not endpoints:
+        return []
+
+    async def run() -> list[dict[str, Any]]:
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        return list(await asyncio.gather(*(_probe(endpoint, timeout, semaphore) for endpoint in endpoints)))
+
+    return asyncio.run(run())
+
+
+class HealthProber:
+    """
+    Resultado del último barrido con un TTL. report() barre si está caducado
+    (una sola vez aunque lleguen varias peticiones a la vez); cached_report()
+    nunca espera: devuelve lo último y, si caducó, refresca en segundo plano.
+    """
+
+    def __init__(self, ttl: float = 30.0, timeout: float = 2.0, concurrency: int = 200) -> None:
+        self.ttl = ttl
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self._report: dict[str, Any] | None = None
+        self._sweep_lock = threading.Lock()
+        # Protege _refreshing: un solo barrido en segundo plano a la vez
+        self._refresh_lock = threading.Lock()
+        self._refreshing = False
+
+    def _expired(self) -> bool:
+        # También caduca si otro worker ha cambiado el roster o el catálogo
+        return (
+            self._report is None
+            or time.time() - self._report["checked_at"] >= self.ttl
+            or self._report["generation"] != list(data_manager.data_generation())
+        )
+
+    def _sweep(self) -> dict[str, Any]:
+        generation = list(data_manager.data_generation())
+        endpoints = endpoints_from_roster(
+            data_manager.load_alumnos(), monitoring.catalog_by_id(data_manager.load_catalogo())
+        )
+        start = time.perf_counter()
+        results = sweep(endpoints, self.timeout, self.concurrency)
+        duration = time.perf_counter() - start
+        up = sum(1 for result in results if result["status"] == STATUS_UP)
+        print(f"DEBUG: Sondeo de salud: {up}/{len(results)} servicios arriba en {duration:.2f}s.")
+        return {
+            "checked_at": time.time(),
+            "generation": generation,
+            "duration": round(duration, 3),
+            "summary": {"total": len(results), STATUS_UP: up, STATUS_DOWN: len(results) - up},
+            "services": results,
+        }
+
+    def report(self, force: bool = False) -> dict[str, Any]:
+        """Último barrido (se repite antes si caducó o si `force`)."""
+        with self._sweep_lock:
+            if force or self._expired():
+                self._report = self._sweep()
+            return self._with_age(self._report)
+
+    def cached_report(self) -> dict[str, Any] | None:
+        """Último barrido sin esperar (None si aún no hay ninguno)."""
+        if self._expired():
+            with self._refresh_lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh, name="health-probe", daemon=True).start()
+        report = self._report
+        return self._with_age(report) if report is not None else None
+
+    def _refresh(self) -> None:
+        try:
+            self.report()
+        except Exception as exc:
+            print(f"ERROR: Sondeo de salud falló: {exc}")
+        finally:
+            with self._refresh_lock:
+                self._refreshing = False
+
+    @staticmethod
+    def _with_age(report: dict[str, Any] | None) -> dict[str, Any]:
+        report = dict(report or {})
+        report["age"] = round(time.time() - report["checked_at"], 1)
+        return report
+
+
+_PROBER: HealthProber | None = None
+_PROBER_LOCK = threading.Lock()
+
+
+def _health_metrics() -> dict[tuple[str, ...], float]:
+    # Último barrido ya hecho: exportar métricas no lanza un sondeo
+    report = _PROBER._report if _PROBER is not None else None
+    if not report:
+        return {}
+    return {(status,): float(report["summary"][status]) for status in (STATUS_UP, STATUS_DOWN)}
+
+
+metrics.callback(
+    "edugitops_student_services", "Servicios de alumnos por estado en el último sondeo.", _health_metrics, ("status",),
+    per_process=True,
+)
+
+
+def get_prober() -> HealthProber:
+    """Sonda compartida por todo el proceso, creada a partir de config.py."""
+    global _PROBER
+    with _PROBER_LOCK:
+        if _PROBER is None:
+            _PROBER = HealthProber(
+                ttl=config.HEALTH_PROBE_TTL,
+                timeout=config.HEALTH_PROBE_TIMEOUT,
+                concurrency=config.HEALTH_PROBE_CONCURRENCY,
+            )
+        return _PROBER
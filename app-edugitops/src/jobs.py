@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import config
+import metrics
+import shared_state
+
+# Clave de cada tarea en el estado compartido: 'job:<id>'
+_JOB_KEY_PREFIX = "job:"
+
+# Estados de una tarea en segundo plano
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+class Job:
+    """
+    Tarea en segundo plano. La función que la ejecuta puede rellenar
+    stdout/stderr/returncode y devolver un dict con su resultado
+    (p. ej. número de reglas creadas). Un returncode distinto de 0
+    o una excepción la marcan como fallida.
+    """
+
+    def __init__(self, kind: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.stdout = ""
+        self.stderr = ""
+        self.returncode: int | None = None
+        self.result: dict[str, Any] = {}
+        self.error: str | None = None
+        # Disparos adicionales que se han agrupado en esta tarea
+        self.coalesced = 0
+        self._done = threading.Event()
+
+    @property
+    def duration(self) -> float | None:
+        """Segundos de ejecución (hasta ahora, si sigue en marcha)."""
+        if self.started_at is None:
+            return None
+        end = self.finished_at if self.finished_at is not None else time.time()
+        return round(end - self.started_at, 3)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Espera a que termine. Devuelve True si ha terminado."""
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "duration": self.duration,
+            "returncode": self.returncode,
+            "stdout": self.stdout,
+            "stderr": self.stderr,
+            "result": self.result,
+            "error": self.error,
+            "coalesced": self.coalesced,
+        }
+
+
+class JobQueue:
+    """
+    Cola de tareas en proceso con un pool de hilos acotado.
+    Conserva las últimas `history` tareas para poder consultar su estado,
+    también en el estado compartido para que las vea cualquier worker.
+    """
+
+    def __init__(self, max_workers: int = 1, history: int = 100) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="edugitops-job")
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._history = max(1, history)
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, func: Callable[[Job], dict[str, Any] | None], delay: float = 0.0) -> Job:
+        """
+        Encola `func(job)` y devuelve la tarea (en estado 'queued').
+        Con `delay` la tarea no entra en el pool hasta pasados esos segundos.
+        """
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            # Olvidamos las tareas terminadas más antiguas
+            while len(self._jobs) > self._history:
+                oldest = next((j for j in self._jobs.values() if j.finished_at is not None), None)
+                if oldest is None:
+                    break
+                del self._jobs[oldest.id]
+        self._publish(job)
+        if delay > 0:
+            timer = threading.Timer(delay, self._executor.submit, args=(self._run, job, func))
+            timer.daemon = True
+            timer.start()
+        else:
+            self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job: Job, func: Callable[[Job], dict[str, Any] | None]) -> None:
+        job.state = JOB_RUNNING
+        job.started_at = time.time()
+        self._publish(job)
+        try:
+            job.result = func(job) or {}
+            job.state = JOB_FAILED if job.returncode not in (None, 0) else JOB_SUCCEEDED
+        except Exception as exc:
+            print(f"ERROR: Tarea {job.kind} ({job.id}) falló: {exc}")
+            job.error = str(exc)
+            job.state = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+            metrics.JOB_SECONDS.observe(job.finished_at - job.started_at, kind=job.kind, state=job.state)
+            self._publish(job)
+            shared_state.prune(_JOB_KEY_PREFIX, self._history)
+            job._done.set()
+
+    @staticmethod
+    def _publish(job: Job) -> None:
+        shared_state.put(_JOB_KEY_PREFIX + job.id, job.to_dict())
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+
+class CoalescingScheduler:
+    """
+    Agrupa los disparos de una misma tarea, también entre workers de gunicorn.
+    En cada proceso, el primero la encola con un retardo de `window` segundos
+    y los siguientes, mientras no haya empezado, se suman a ella en vez de
+    encolar otra. Además cada disparo toma un número de secuencia del estado
+    compartido y las ejecuciones se turnan con un ProcessLock: la que empieza
+    anota hasta qué disparo cubre (lee los datos después de todos ellos) y la
+    tarea de otro worker cuyos disparos ya estén cubiertos por una ejecución
+    correcta termina sin repetir el trabajo. Un disparo que llega con la
+    tarea ya en marcha encola una nueva (la que corre pudo leer datos antiguos).
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        func: Callable[[Job], dict[str, Any] | None],
+        window: float | None = None,
+        queue: JobQueue | None = None,
+    ) -> None:
+        self.kind = kind
+        self._func = func
+        self._window = window
+        self._queue = queue
+        self._pending: Job | None = None
+        # Último número de secuencia de los disparos sumados a cada tarea pendiente
+        self._pending_seq: dict[str, int] = {}
+        self._lock = threading.Lock()
+        # Una sola ejecución a la vez en todo el pod
+        self._run_lock = shared_state.ProcessLock(f"scheduler-{kind}")
+        # Contadores en el estado compartido: suman los disparos de todos los workers
+        self._stats_prefix = f"scheduler:{kind}:"
+        # Secuencia de disparos y último disparo cubierto por una ejecución correcta
+        self._seq_key = f"scheduler-seq:{kind}"
+        self._covered_key = f"scheduler:{kind}:covered"
+
+    def trigger(self) -> Job:
+        """Pide una ejecución y devuelve la tarea que la atenderá."""
+        with self._lock:
+            shared_state.incr(self._stats_prefix + "triggers")
+            seq = shared_state.incr(self._seq_key)
+            if self._pending is not None:
+                self._pending.coalesced += 1
+                self._pending_seq[self._pending.id] = seq
+                shared_state.incr(self._stats_prefix + "coalesced")
+                return self._pending
+
+            window = self._window if self._window is not None else config.JOBS_COALESCE_WINDOW
+            queue = self._queue or get_queue()
+            self._pending = queue.submit(self.kind, self._run, delay=window)
+            self._pending_seq[self._pending.id] = seq
+            return self._pending
+
+    def _run(self, job: Job) -> dict[str, Any] | None:
+        # A partir de aquí los disparos nuevos ya no pueden sumarse a esta tarea
+        with self._lock:
+            if self._pending is job:
+                self._pending = None
+            seq = self._pending_seq.pop(job.id, 0)
+
+        with self._run_lock:
+            # seq == 0: sin estado compartido no podemos saber qué está cubierto
+            if seq and shared_state.get(self._covered_key, 0) >= seq:
+                shared_state.incr(self._stats_prefix + "coalesced")
+                print(f"DEBUG: Tarea {self.kind} ({job.id}) cubierta por una ejecución de otro worker.")
+                return {"covered": True}
+
+            shared_state.incr(self._stats_prefix + "runs")
+            # Esta ejecución lee los datos después de todos los disparos hechos hasta ahora
+            latest = shared_state.incr(self._seq_key, 0)
+            result = self._func(job)
+            shared_state.put(self._covered_key, max(latest, seq))
+            return result
+
+    def get_stats(self) -> dict[str, int]:
+        """Disparos recibidos, ejecuciones hechas y disparos agrupados (de todos los workers)."""
+        stats = {"triggers": 0, "runs": 0, "coalesced": 0}
+        stats.update(shared_state.counters(self._stats_prefix))
+        return stats
+
+
+_QUEUE: JobQueue | None = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_queue() -> JobQueue:
+    """Cola compartida por todo el proceso, creada a partir de config.py."""
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = JobQueue(max_workers=config.JOBS_MAX_WORKERS, history=config.JOBS_HISTORY)
+        return _QUEUE
+
+
+def submit(kind: str, func: Callable[[Job], dict[str, Any] | None]) -> Job:
+    return get_queue().submit(kind, func)
+
+
+def get_job(job_id: str) -> Job | None:
+    return get_queue().get(job_id)
+
+
+def get_job_info(job_id: str) -> dict[str, Any] | None:
+    """
+    Estado de una tarea como dict: la de este proceso si la tiene (al día) o
+    la última que publicó el worker que la ejecuta.
+    """
+    job = get_job(job_id)
+    if job is not None:
+        return job.to_dict()
+    info = shared_state.get(_JOB_KEY_PREFIX + job_id)
+    return info if isinstance(info, dict) else None
@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import json
+import subprocess
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+from urllib.parse import urlencode
+
+import config
+import metrics
+
+# Dirección que se muestra si no se conoce ningún nodo (Minikube local)
+DEFAULT_NODE_IP = "127.0.0.1"
+
+ServiceKey = tuple[str, str]
+
+
+def iter_json_objects(lines: Iterable[str]) -> Iterator[dict[str, Any]]:
+    """
+    Objetos JSON de la salida de un watch (`kubectl get -w -o json` o
+    `kubectl get --raw ...?watch=true`): uno tras otro, indentados en varias
+    líneas (o compactos en una). El objeto de primer nivel se cierra con una
+    '}' en la columna 0.
+    """
+    buffer: list[str] = []
+    for line in lines:
+        if not buffer and not line.strip():
+            continue
+        buffer.append(line)
+        if not (line.startswith("}") or (len(buffer) == 1 and line.rstrip().endswith("}"))):
+            continue
+        try:
+            obj = json.loads("".join(buffer))
+        except ValueError:
+            continue
+        buffer = []
+        if isinstance(obj, dict):
+            yield obj
+
+
+def parse_service(obj: dict[str, Any], namespace_prefix: str) -> dict[str, Any] | None:
+    """Servicio NodePort de un alumno a partir del JSON de la API (None si no aplica)."""
+    metadata = obj.get("metadata") or {}
+    spec = obj.get("spec") or {}
+    namespace = str(metadata.get("namespace") or "")
+    if not namespace.startswith(namespace_prefix) or spec.get("type") != "NodePort":
+        return None
+    ports = [
+        {"port": port.get("port"), "node_port": port.get("nodePort"), "protocol": port.get("protocol", "TCP")}
+        for port in spec.get("ports") or []
+        if isinstance(port, dict)
+    ]
+    return {
+        "namespace": namespace,
+        "name": str(metadata.get("name") or ""),
+        "labels": dict(metadata.get("labels") or {}),
+        "ports": ports,
+    }
+
+
+def node_address(obj: dict[str, Any]) -> str | None:
+    """IP externa del nodo o, si no tiene, la interna."""
+    addresses = {
+        address.get("type"): address.get("address")
+        for address in (obj.get("status") or {}).get("addresses") or []
+        if isinstance(address, dict)
+    }
+    return addresses.get("ExternalIP") or addresses.get("InternalIP")
+
+
+class _Store:
+    """Objetos de un tipo de recurso más el estado de su list+watch."""
+
+    def __init__(self) -> None:
+        self.items: dict[Any, Any] = {}
+        self.synced_at: float | None = None
+        self.watching = False
+        self.error: str | None = None
+
+
+class K8sCache:
+    """
+    Caché en memoria de los servicios NodePort de los namespaces de alumnos
+    y de las direcciones de los nodos. Un hilo por recurso lista el recurso
+    en la API (`kubectl get --raw <ruta>`) y abre un watch que empieza en el
+    resourceVersion de ese listado, de modo que no se pierde ningún evento
+    entre ambos; cada `resync` segundos (o si la API responde que esa versión
+    ya es demasiado antigua) se vuelve a listar. Los servicios se indexan por
+    etiqueta.
+    """
+
+    def __init__(
+        self,
+        kubectl: str = "kubectl",
+        namespace_prefix: str = "alumno-",
+        resync: float = 300.0,
+        retry_delay: float = 5.0,
+    ) -> None:
+        self.kubectl = kubectl
+        self.namespace_prefix = namespace_prefix
+        self.resync = resync
+        self.retry_delay = retry_delay
+        self._services = _Store()
+        self._nodes = _Store()
+        self._labels: dict[tuple[str, str], set[ServiceKey]] = {}
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._procs: set[subprocess.Popen[str]] = set()
+
+    # --- Aplicación de listados y eventos ---
+
+    def _index(self, key: ServiceKey, service: dict[str, Any] | None) -> None:
+        """Sustituye la entrada `key` (o la quita si service es None) y su índice de etiquetas."""
+        old = self._services.items.pop(key, None)
+        if old is not None:
+            for label in old["labels"].items():
+                keys = self._labels.get(label)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._labels[label]
+        if service is not None:
+            self._services.items[key] = service
+            for label in service["labels"].items():
+                self._labels.setdefault(label, set()).add(key)
+
+    def replace_services(self, items: list[dict[str, Any]]) -> None:
+        """Sustituye todos los servicios por los de un listado completo."""
+        with self._lock:
+            self._services.items = {}
+            self._labels = {}
+            for obj in items:
+                service = parse_service(obj, self.namespace_prefix)
+                if service is not None:
+                    self._index((service["namespace"], service["name"]), service)
+            self._mark_synced(self._services)
+
+    def apply_service_event(self, event: dict[str, Any]) -> None:
+        """Aplica un evento ADDED/MODIFIED/DELETED del watch de servicios."""
+        obj = event.get("object") or {}
+        metadata = obj.get("metadata") or {}
+        key = (str(metadata.get("namespace") or ""), str(metadata.get("name") or ""))
+        service = None if event.get("type") == "DELETED" else parse_service(obj, self.namespace_prefix)
+        with self._lock:
+            # Un servicio que deja de ser NodePort también sale de la caché
+            self._index(key, service)
+
+    def replace_nodes(self, items: list[dict[str, Any]]) -> None:
+        with self._lock:
+            self._nodes.items = {
+                (obj.get("metadata") or {}).get("name"): node_address(obj) for obj in items
+            }
+            self._mark_synced(self._nodes)
+
+    def apply_node_event(self, event: dict[str, Any]) -> None:
+        obj = event.get("object") or {}
+        name = (obj.get("metadata") or {}).get("name")
+        with self._lock:
+            if event.get("type") == "DELETED":
+                self._nodes.items.pop(name, None)
+            else:
+                self._nodes.items[name] = node_address(obj)
+
+    def _mark_synced(self, store: _Store) -> None:
+        store.synced_at = time.time()
+        store.error = None
+        if self._services.synced_at is not None and self._nodes.synced_at is not None:
+            self._synced.set()
+
+    # --- Consultas ---
+
+    def services(self, selector: dict[str, str] | None = None) -> list[dict[str, Any]]:
+        """Servicios (ordenados) que tienen todas las etiquetas de `selector`."""
+        with self._lock:
+            if selector:
+                keys: set[ServiceKey] | None = None
+                for label in selector.items():
+                    matching = self._labels.get(label, set())
+                    keys = set(matching) if keys is None else keys & matching
+                found = [self._services.items[key] for key in keys or ()]
+            else:
+                found = list(self._services.items.values())
+        return sorted(found, key=lambda service: (service["namespace"], service["name"]))
+
+    def node_ip(self) -> str:
+        with self._lock:
+            addresses = [address for _, address in sorted(self._nodes.items.items()) if address]
+        return addresses[0] if addresses else DEFAULT_NODE_IP
+
+    def deployments(self) -> list[dict[str, Any]]:
+        """Filas de la vista /deployments (primer puerto de cada servicio)."""
+        node_ip = self.node_ip()
+        rows = []
+        for service in self.services():
+            port = service["ports"][0] if service["ports"] else {}
+            node_port = port.get("node_port") or "???"
+            internal_port = port.get("port") or 80
+            rows.append({
+                "namespace": service["namespace"],
+                "app_name": service["name"],
+                "node_ip": node_ip,
+                "port": node_port,
+                "url": f"http://{node_ip}:{node_port}",
+                "pf_cmd": f"kubectl port-forward -n {service['namespace']} svc/{service['name']} {node_port}:{internal_port}",
+            })
+        return rows
+
+    def status(self) -> dict[str, Any]:
+        """Frescura de los datos: última sincronización, si el watch sigue abierto y errores."""
+        now = time.time()
+        with self._lock:
+            stores = {"services": self._services, "nodes": self._nodes}
+            # Un watch abierto está al día aunque no lleguen eventos; si no,
+            # los datos tienen la antigüedad de su último listado correcto
+            ages = [
+                0.0 if store.watching else now - store.synced_at
+                for store in stores.values() if store.synced_at is not None
+            ]
+            return {
+                "synced": self._synced.is_set(),
+                "watching": all(store.watching for store in stores.values()),
+                "age": round(max(ages), 1) if len(ages) == len(stores) else None,
+                "services": len(self._services.items),
+                "error": next((store.error for store in stores.values() if store.error), None),
+            }
+
+    def wait_synced(self, timeout: float | None = None) -> bool:
+        """Espera al primer listado completo de servicios y nodos."""
+        return self._synced.wait(timeout)
+
+    # --- List + watch con kubectl ---
+
+    def start(self) -> K8sCache:
+        watched: list[tuple[str, str, Callable[[list[dict[str, Any]]], None], Callable[[dict[str, Any]], None], _Store]] = [
+            ("services", "/api/v1/services", self.replace_services, self.apply_service_event, self._services),
+            ("nodes", "/api/v1/nodes", self.replace_nodes, self.apply_node_event, self._nodes),
+        ]
+        for resource, path, replace, apply, store in watched:
+            thread = threading.Thread(
+                target=self._list_and_watch, args=(resource, path, replace, apply, store),
+                name=f"k8s-watch-{resource}", daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        with self._lock:
+            procs = list(self._procs)
+        for proc in procs:
+            proc.terminate()
+
+    def _list_and_watch(
+        self,
+        resource: str,
+        path: str,
+        replace: Callable[[list[dict[str, Any]]], None],
+        apply: Callable[[dict[str, Any]], None],
+        store: _Store,
+    ) -> None:
+        while not self._stop.is_set():
+            try:
+                start = time.perf_counter()
+                result = "error"
+                try:
+                    # `kubectl get -o json` no conserva el resourceVersion del listado: se pide a la API
+                    listing = subprocess.run(
+                        [self.kubectl, "get", "--raw", path],
+                        capture_output=True, text=True, check=True, timeout=60,
+                    )
+                    result = "ok"
+                finally:
+                    metrics.KUBECTL_SECONDS.observe(time.perf_counter() - start, resource=resource, result=result)
+                body = json.loads(listing.stdout)
+                replace(body.get("items") or [])
+                resource_version = str((body.get("metadata") or {}).get("resourceVersion") or "")
+                self._watch(resource, path, resource_version, apply, store)
+            except (OSError, ValueError, subprocess.SubprocessError) as exc:
+                detail = getattr(exc, "stderr", None) or exc
+                print(f"ERROR: Caché de Kubernetes ({resource}): {detail}")
+                with self._lock:
+                    store.error = str(detail).strip()
+                self._stop.wait(self.retry_delay)
+
+    def _watch(
+        self, resource: str, path: str, resource_version: str,
+        apply: Callable[[dict[str, Any]], None], store: _Store,
+    ) -> None:
+        """
+        Aplica los eventos posteriores al listado (`resource_version`) hasta
+        que el watch se cierra (como tarde a los `resync` segundos) o la API
+        devuelve un error (p. ej. 410 Gone: hay que volver a listar).
+        """
+        query = urlencode({"watch": "true", "resourceVersion": resource_version, "timeoutSeconds": int(self.resync)})
+        command = [self.kubectl, "get", "--raw", f"{path}?{query}"]
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+        with self._lock:
+            self._procs.add(proc)
+            store.watching = True
+        try:
+            for event in iter_json_objects(proc.stdout or ()):
+                if event.get("type") == "ERROR":
+                    print(f"DEBUG: Watch de {resource} interrumpido: {(event.get('object') or {}).get('message')}")
+                    break
+                if "object" in event:
+                    metrics.KUBE_WATCH_EVENTS.inc(resource=resource, type=event.get("type", ""))
+                    apply(event)
+        finally:
+            proc.kill()
+            proc.wait()
+            with self._lock:
+                self._procs.discard(proc)
+                store.watching = False
+        print(f"DEBUG: Watch de {resource} cerrado, se vuelve a listar.")
+
+
+_CACHE: K8sCache | None = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_cache() -> K8sCache:
+    """Caché compartida por todo el proceso; arranca sus watchers al primer uso."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = K8sCache(
+                kubectl=config.KUBECTL_BIN,
+                namespace_prefix=config.K8S_NAMESPACE_PREFIX,
+                resync=config.K8S_RESYNC_SECONDS,
+            ).start()
+        return _CACHE
+
+
+def _cache_metrics() -> dict[tuple[str, ...], float]:
+    # Solo si la caché ya existe: exportar métricas no debe arrancar los watchers
+    cache = _CACHE
+    if cache is None:
+        return {}
+    status = cache.status()
+    values = {("services",): float(status["services"]), ("watching",): float(status["watching"])}
+    if status["age"] is not None:
+        values[("age_seconds",)] = float(status["age"])
+    return values
+
+
+metrics.callback("edugitops_kube_cache", "Estado de la caché de Kubernetes.", _cache_metrics, ("field",), per_process=True)
+
+
+def reset_cache() -> None:
+    """Detiene y descarta la caché compartida."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is not None:
+            _CACHE.stop()
+        _CACHE = None
@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable
+from typing import Any
+
+import config
+import shared_state
+
+# Registro mínimo de métricas en formato de texto de Prometheus (sin dependencias).
+# Observar un valor es una búsqueda binaria y tres sumas bajo un cerrojo: unos
+# pocos microsegundos, así que la instrumentación puede quedarse siempre activa.
+#
+# Con varios workers de gunicorn cada proceso tiene su propio registro. Cada
+# worker publica el suyo en el estado compartido (publish(), periódicamente y
+# al salir) y /metrics, lo atienda el worker que lo atienda, agrega todos:
+# - contadores e histogramas: suma de todos los workers, también de los que ya
+#   terminaron (su última publicación), para que los totales nunca bajen;
+# - gauges propios de cada proceso (per_process=True): una serie por worker
+#   vivo con la etiqueta worker="<pid>";
+# - el resto de gauges se calculan con datos comunes (ficheros, estado
+#   compartido) y los responde el worker que atiende la petición.
+# Lo de los demás workers llega con hasta METRICS_PUBLISH_INTERVAL de retraso.
+
+# Segundos: de 0,5 ms a 30 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Bytes: de 1 KiB a 64 MiB
+SIZE_BUCKETS = tuple(float(1024 * 4 ** i) for i in range(9))
+
+Labels = tuple[str, ...]
+Samples = dict[Labels, float]
+# Estado publicado de cada worker: [(pid, ¿publicado hace poco?, {métrica: estado})]
+WorkerStates = list[tuple[str, bool, dict[str, Any]]]
+
+_SNAPSHOT_PREFIX = "metrics:worker:"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _render_samples(name: str, labelnames: tuple[str, ...], values: Samples) -> list[str]:
+    return [f"{name}{_format_labels(labelnames, key)} {_format_value(value)}" for key, value in sorted(values.items())]
+
+
+def _sum_samples(states: WorkerStates, name: str) -> Samples:
+    total: Samples = {}
+    for _, _, metrics_state in states:
+        for labels, value in metrics_state.get(name) or []:
+            key = tuple(labels)
+            total[key] = total.get(key, 0.0) + value
+    return total
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+    def state(self) -> Any:
+        """Estado de este proceso para publicarlo (None si no se agrega entre workers)."""
+        return None
+
+    def render_workers(self, states: WorkerStates) -> list[str]:
+        """Muestras agregadas de todos los workers."""
+        return self.render()
+
+
+class Counter(_Metric):
+    """Contador que solo crece."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Samples = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return _render_samples(self.name, self.labelnames, values)
+
+    def state(self) -> Any:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def render_workers(self, states: WorkerStates) -> list[str]:
+        return _render_samples(self.name, self.labelnames, _sum_samples(states, self.name))
+
+
+class Histogram(_Metric):
+    """Histograma acumulado por cubetas (_bucket, _sum y _count)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por etiquetas: [cuentas por cubeta (la última es +Inf), suma, total]
+        self._children: dict[Labels, list[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            child[0][index] += 1
+            child[1] += value
+            child[2] += 1
+
+    def snapshot(self, **labels: Any) -> tuple[float, int]:
+        """(suma, número de observaciones) de unas etiquetas."""
+        with self._lock:
+            child = self._children.get(self._key(labels))
+            return (child[1], child[2]) if child else (0.0, 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            children = {key: (list(child[0]), child[1], child[2]) for key, child in self._children.items()}
+        lines = []
+        for key, (counts, total, count) in sorted(children.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+    def state(self) -> Any:
+        with self._lock:
+            return [[list(key), list(child[0]), child[1], child[2]] for key, child in self._children.items()]
+
+    def render_workers(self, states: WorkerStates) -> list[str]:
+        total = Histogram(self.name, self.documentation, self.labelnames, self.buckets)
+        for _, _, metrics_state in states:
+            for labels, counts, value_sum, count in metrics_state.get(self.name) or []:
+                child = total._children.setdefault(tuple(labels), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                child[0] = [a + b for a, b in zip(child[0], counts)]
+                child[1] += value_sum
+                child[2] += count
+        return total.render()
+
+
+class CallbackMetric(_Metric):
+    """
+    Métrica que se calcula al exportar (p. ej. tamaño del roster o aciertos de
+    caché ya contados en otro módulo). `func` devuelve un valor o un dict
+    {valores de etiquetas: valor}. Si falla, la métrica se omite.
+    Con per_process=True el valor es propio de cada worker (cachés en
+    memoria): se publica y se agrega como los contadores o, si es un gauge,
+    con una serie por worker.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, func: Callable[[], float | Samples],
+        labelnames: tuple[str, ...] = (), kind: str = "gauge", per_process: bool = False,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.per_process = per_process
+        self._func = func
+
+    def _values(self) -> Samples:
+        try:
+            result = self._func()
+        except Exception as exc:
+            print(f"DEBUG: Métrica {self.name} no disponible: {exc}")
+            return {}
+        return result if isinstance(result, dict) else {(): result}
+
+    def render(self) -> list[str]:
+        return _render_samples(self.name, self.labelnames, self._values())
+
+    def state(self) -> Any:
+        if not self.per_process:
+            return None
+        return [[list(key), value] for key, value in self._values().items()]
+
+    def render_workers(self, states: WorkerStates) -> list[str]:
+        if not self.per_process:
+            return self.render()
+        if self.kind == "counter":
+            return _render_samples(self.name, self.labelnames, _sum_samples(states, self.name))
+        values: Samples = {}
+        for worker, fresh, metrics_state in states:
+            if fresh:
+                for labels, value in metrics_state.get(self.name) or []:
+                    values[(*labels, worker)] = value
+        return _render_samples(self.name, (*self.labelnames, "worker"), values)
+
+
+_REGISTRY: dict[str, _Metric] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _register(metric: _Metric) -> Any:
+    """Registra la métrica (si ya existe una con ese nombre, devuelve esa)."""
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, documentation, labelnames))
+
+
+def histogram(
+    name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS
+) -> Histogram:
+    return _register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(
+    name: str, documentation: str, func: Callable[[], float | Samples],
+    labelnames: tuple[str, ...] = (), kind: str = "gauge", per_process: bool = False,
+) -> CallbackMetric:
+    return _register(CallbackMetric(name, documentation, func, labelnames, kind, per_process))
+
+
+def _registered() -> list[_Metric]:
+    with _REGISTRY_LOCK:
+        return sorted(_REGISTRY.values(), key=lambda metric: metric.name)
+
+
+def publish() -> None:
+    """Publica en el estado compartido las métricas de este worker."""
+    states = {}
+    for metric in _registered():
+        state = metric.state()
+        if state is not None:
+            states[metric.name] = state
+    shared_state.put(f"{_SNAPSHOT_PREFIX}{os.getpid()}", {"at": time.time(), "metrics": states})
+
+
+def _worker_states() -> WorkerStates:
+    """Lo publicado por cada worker (el de este proceso, recién publicado)."""
+    publish()
+    # Un worker vivo publica cada METRICS_PUBLISH_INTERVAL: si no, ya terminó
+    fresh_after = time.time() - 3 * max(config.METRICS_PUBLISH_INTERVAL, 1.0)
+    states: WorkerStates = []
+    for key, snapshot in sorted(shared_state.items(_SNAPSHOT_PREFIX).items()):
+        if isinstance(snapshot, dict) and isinstance(snapshot.get("metrics"), dict):
+            worker = key[len(_SNAPSHOT_PREFIX):]
+            states.append((worker, float(snapshot.get("at") or 0) >= fresh_after, snapshot["metrics"]))
+    return states
+
+
+def render() -> str:
+    """Todas las métricas (de todos los workers) en formato de texto de Prometheus (versión 0.0.4)."""
+    states = _worker_states()
+    lines: list[str] = []
+    for metric in _registered():
+        samples = metric.render_workers(states)
+        if samples:
+            lines.extend(metric.header())
+            lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+_PUBLISHER: threading.Thread | None = None
+_PUBLISHER_LOCK = threading.Lock()
+
+
+def _publish_loop() -> None:
+    while True:
+        time.sleep(max(config.METRICS_PUBLISH_INTERVAL, 0.1))
+        publish()
+
+
+def start_publisher() -> None:
+    """Publica las métricas de este worker cada METRICS_PUBLISH_INTERVAL segundos (un hilo por proceso)."""
+    global _PUBLISHER
+    with _PUBLISHER_LOCK:
+        if _PUBLISHER is None or not _PUBLISHER.is_alive():
+            _PUBLISHER = threading.Thread(target=_publish_loop, name="metrics-publisher", daemon=True)
+            _PUBLISHER.start()
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --- Métricas compartidas por varios módulos ---
+
+HTTP_REQUEST_SECONDS = histogram(
+    "edugitops_http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta.", ("route", "method", "status")
+)
+YAML_SECONDS = histogram("edugitops_yaml_duration_seconds", "Duración de parseo/volcado YAML.", ("op",))
+YAML_BYTES = histogram("edugitops_yaml_bytes", "Tamaño de los documentos YAML parseados/volcados.", ("op",), SIZE_BUCKETS)
+GITEA_SECONDS = histogram(
+    "edugitops_gitea_request_duration_seconds", "Latencia de las llamadas a la API de Gitea.", ("operation", "status")
+)
+CHECKMK_SECONDS = histogram(
+    "edugitops_checkmk_request_duration_seconds", "Latencia de las llamadas a la API de Checkmk.", ("operation", "status")
+)
+KUBECTL_SECONDS = histogram(
+    "edugitops_kubectl_duration_seconds", "Duración de los procesos kubectl (listados).", ("resource", "result")
+)
+KUBE_WATCH_EVENTS = counter(
+    "edugitops_kube_watch_events_total", "Eventos recibidos por los watch de Kubernetes.", ("resource", "type")
+)
+JOB_SECONDS = histogram(
+    "edugitops_job_duration_seconds", "Duración de las tareas en segundo plano.", ("kind", "state")
+)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+import checkmk_client
+import checkmk_rules
+import config
+
+Log = Callable[[str], None]
+T = TypeVar("T")
+
+# Modos de regeneración de la monitorización
+MODE_RECONCILE = "reconcile"
+MODE_FULL = "full"
+MODES = (MODE_RECONCILE, MODE_FULL)
+
+
+def catalog_by_id(items: list[dict[str, Any]]) -> dict[str, dict[str, Any]]:
+    """Catálogo como mapa {app_id: {protocol, port, ...}}."""
+    return {item["id"]: item for item in items if isinstance(item, dict) and "id" in item}
+
+
+def _count_by_protocol(rules: list[dict[str, Any]]) -> dict[str, int]:
+    return {
+        "http_rules": sum(1 for rule in rules if rule["protocol"] == "http"),
+        "tcp_rules": sum(1 for rule in rules if rule["protocol"] == "tcp"),
+    }
+
+
+def _fan_out(func: Callable[[T], Any], items: Iterable[T], concurrency: int) -> None:
+    """
+    Aplica `func` a cada elemento con como mucho `concurrency` peticiones
+    simultáneas. Termina todas las operaciones aunque alguna falle y después
+    lanza CheckmkError con el número de fallos (y el primero de ellos).
+    """
+    items = list(items)
+    errors: list[BaseException] = []
+    if concurrency <= 1 or len(items) <= 1:
+        for item in items:
+            try:
+                func(item)
+            except Exception as exc:
+                errors.append(exc)
+    else:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(items)), thread_name_prefix="checkmk") as executor:
+            futures = [executor.submit(func, item) for item in items]
+        errors = [exc for exc in (future.exception() for future in futures) if exc is not None]
+
+    if errors:
+        first = errors[0]
+        raise checkmk_client.CheckmkError(
+            f"{len(errors)} de {len(items)} operaciones fallaron: {first}",
+            getattr(first, "status_code", None),
+            getattr(first, "body", ""),
+        )
+
+
+def _create_rule(client: checkmk_client.CheckmkClient, rule: dict[str, Any], host_name: str, log: Log) -> None:
+    log(f"   Creating {rule['protocol'].upper()}: {rule['service_label']} -> {rule['target']}")
+    client.create_rule(rule["ruleset"], rule["value_raw"], host_name, rule["description"])
+
+
+def reconcile(
+    client: checkmk_client.CheckmkClient,
+    desired: dict[str, dict[str, Any]],
+    host_name: str,
+    host_ip: str | None = None,
+    log: Log = print,
+    concurrency: int = 1,
+) -> dict[str, Any]:
+    """
+    Modo incremental: lista las reglas actuales del host, calcula el diff por
+    service_label y solo crea/borra lo que cambia (en paralelo, hasta
+    `concurrency` peticiones). Activa una única vez y solo si hubo cambios.
+    """
+    log("🔎 [1/4] Listando reglas actuales (HTTP y TCP)...")
+    host_created = client.ensure_host(host_name, host_ip)
+    if host_created:
+        log(f"   Host '{host_name}' no existía: creado.")
+    existing: list[dict[str, Any]] = []
+    for ruleset in checkmk_rules.RULESETS:
+        existing.extend(checkmk_rules.existing_rules(ruleset, client.list_rules(ruleset), host_name))
+
+    diff = checkmk_rules.diff_rules(desired, existing)
+    log(f"⚙️ [2/4] Diff: {len(diff['create'])} a crear, {len(diff['delete'])} a borrar, "
+        f"{diff['unchanged']} sin cambios.")
+
+    def delete(rule: dict[str, Any]) -> None:
+        log(f"   Deleting: {rule.get('service_label') or '?'} ({rule['id']})")
+        client.delete_rule(str(rule["id"]))
+
+    # Primero los borrados: una regla cuyo destino cambió se borra antes de recrearla
+    _fan_out(delete, diff["delete"], concurrency)
+    _fan_out(lambda rule: _create_rule(client, rule, host_name, log), diff["create"], concurrency)
+
+    summary: dict[str, Any] = {
+        **_count_by_protocol(diff["create"]),
+        "created": len(diff["create"]),
+        "deleted": len(diff["delete"]),
+        "unchanged": diff["unchanged"],
+        "activated": False,
+    }
+    log(f"📊 Resumen: {summary['http_rules']} reglas HTTP, {summary['tcp_rules']} reglas TCP creadas.")
+    log(f"♻️ Reconciliación: {summary['created']} creadas, {summary['deleted']} borradas, "
+        f"{summary['unchanged']} sin cambios.")
+
+    if not diff["create"] and not diff["delete"] and not host_created:
+        log("✅ [4/4] Checkmk ya estaba al día. No hay cambios que activar.")
+        return summary
+
+    log("🚀 [3/4] Activando cambios en Checkmk...")
+    summary["activated"] = client.activate_changes()
+    log("✅ [4/4] Proceso completado con éxito.")
+    return summary
+
+
+def full_rebuild(
+    client: checkmk_client.CheckmkClient,
+    desired: dict[str, dict[str, Any]],
+    host_name: str,
+    host_ip: str | None = None,
+    log: Log = print,
+    concurrency: int = 1,
+) -> dict[str, Any]:
+    """Modo completo: borra todas las reglas, recrea el host y crea todas las reglas."""
+    log("🧹 [1/4] Limpiando reglas antiguas (HTTP y TCP)...")
+    rule_ids = [str(rule.get("id")) for ruleset in checkmk_rules.RULESETS for rule in client.list_rules(ruleset)]
+    _fan_out(client.delete_rule, rule_ids, concurrency)
+    deleted = len(rule_ids)
+
+    # Reiniciar host (para asegurar limpieza)
+    client.delete_host(host_name)
+    client.create_host(host_name, host_ip)
+
+    log(f"⚙️ [2/4] Creando {len(desired)} reglas...")
+    _fan_out(lambda rule: _create_rule(client, rule, host_name, log), desired.values(), concurrency)
+
+    summary: dict[str, Any] = {
+        **_count_by_protocol(list(desired.values())),
+        "created": len(desired),
+        "deleted": deleted,
+        "unchanged": 0,
+    }
+    log(f"📊 Resumen: {summary['http_rules']} reglas HTTP, {summary['tcp_rules']} reglas TCP creadas.")
+
+    log("🚀 [3/4] Activando cambios en Checkmk...")
+    summary["activated"] = client.activate_changes()
+    log("✅ [4/4] Proceso completado con éxito.")
+    return summary
+
+
+def run_monitoring(
+    students: list[dict[str, Any]],
+    catalog: list[dict[str, Any]] | dict[str, dict[str, Any]],
+    mode: str = MODE_RECONCILE,
+    log: Log = print,
+    client: checkmk_client.CheckmkClient | None = None,
+    concurrency: int | None = None,
+) -> dict[str, Any]:
+    """
+    Lleva Checkmk al estado que describen alumnos.yaml y el catálogo.
+    `concurrency` limita las peticiones simultáneas (por defecto CHECKMK_CONCURRENCY).
+    Devuelve el resumen (reglas creadas/borradas/sin cambios por protocolo).
+    Lanza CheckmkError si la API falla.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Modo de monitorización desconocido: {mode}")
+    host_name = config.CHECKMK_HOST_NAME
+    if not host_name:
+        raise ValueError("CHECKMK_HOST_NAME no definido.")
+
+    catalog_map = catalog if isinstance(catalog, dict) else catalog_by_id(catalog)
+    desired, warnings = checkmk_rules.build_desired_rules(students, catalog_map)
+    for warning in warnings:
+        log(f"⚠️ {warning}")
+
+    client = client or checkmk_client.get_client()
+    concurrency = max(1, concurrency if concurrency is not None else config.CHECKMK_CONCURRENCY)
+    if mode == MODE_FULL:
+        return full_rebuild(client, desired, host_name, config.CHECKMK_HOST_IP, log, concurrency)
+    return reconcile(client, desired, host_name, config.CHECKMK_HOST_IP, log, concurrency)
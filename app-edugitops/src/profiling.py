@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import hashlib
+import hmac
+import os
+import re
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+import config
+
+# Tramos acumulados de la petición en curso: {nombre: [segundos, veces]}.
+# Fuera de una petición vale None y record() no hace nada.
+_SPANS: contextvars.ContextVar[dict[str, list[float]] | None] = contextvars.ContextVar("edugitops_spans", default=None)
+
+_RING_LOCK = threading.Lock()
+PROFILE_SUFFIX = ".prof"
+
+
+# --- Tramos de Server-Timing ---
+
+def start_request() -> contextvars.Token[dict[str, list[float]] | None]:
+    """Empieza a acumular tramos para la petición actual."""
+    return _SPANS.set({})
+
+
+def finish_request(token: contextvars.Token[dict[str, list[float]] | None]) -> dict[str, list[float]]:
+    """Deja de acumular y devuelve los tramos de la petición."""
+    spans = _SPANS.get() or {}
+    _SPANS.reset(token)
+    return spans
+
+
+def record(name: str, seconds: float) -> None:
+    """Suma `seconds` al tramo `name` de la petición en curso (si la hay)."""
+    spans = _SPANS.get()
+    if spans is None:
+        return
+    span = spans.get(name)
+    if span is None:
+        spans[name] = [seconds, 1]
+    else:
+        span[0] += seconds
+        span[1] += 1
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Mide el bloque como tramo `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def server_timing(spans: dict[str, list[float]], total: float | None = None) -> str:
+    """Cabecera Server-Timing: `yaml_load;dur=1.20;desc="2x", ..., total;dur=9.10`."""
+    parts = [
+        f'{name};dur={seconds * 1000:.2f};desc="{int(count)}x"'
+        for name, (seconds, count) in sorted(spans.items())
+    ]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+# --- Perfil completo (cProfile) de peticiones concretas ---
+
+def sign(path: str) -> str:
+    """Firma de ?profile= para una ruta: HMAC-SHA256 (hex) con PROFILING_SECRET."""
+    return hmac.new(config.PROFILING_SECRET.encode("utf-8"), path.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def profile_requested(path: str, signature: str | None) -> bool:
+    """Se perfila si PROFILING_ENABLED está activo o si ?profile= trae la firma de la ruta."""
+    if config.PROFILING_ENABLED:
+        return True
+    if not signature or not config.PROFILING_SECRET:
+        return False
+    return hmac.compare_digest(sign(path), signature)
+
+
+def start_profile() -> cProfile.Profile | None:
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError as exc:
+        # Otro perfilador activo en este hilo (p. ej. un depurador)
+        print(f"DEBUG: No se pudo perfilar la petición: {exc}")
+        return None
+    return profiler
+
+
+def save_profile(profiler: cProfile.Profile, method: str, path: str) -> str:
+    """
+    Guarda el perfil (formato pstats) en PROFILING_DIR y borra los más
+    antiguos para no pasar de PROFILING_MAX_FILES. Devuelve el nombre.
+    """
+    profiler.disable()
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{slug[:40]}-{uuid.uuid4().hex[:6]}{PROFILE_SUFFIX}"
+    with _RING_LOCK:
+        os.makedirs(config.PROFILING_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(config.PROFILING_DIR, name))
+        for old in list_profiles()[config.PROFILING_MAX_FILES:]:
+            try:
+                os.remove(os.path.join(config.PROFILING_DIR, old["name"]))
+            except OSError:
+                pass
+    print(f"DEBUG: Perfil de {method} {path} guardado en {name}.")
+    return name
+
+
+def list_profiles() -> list[dict[str, Any]]:
+    """Perfiles guardados, del más reciente al más antiguo."""
+    try:
+        entries = [entry for entry in os.scandir(config.PROFILING_DIR) if entry.name.endswith(PROFILE_SUFFIX)]
+    except OSError:
+        return []
+    stats = [(entry.name, entry.stat()) for entry in entries]
+    stats.sort(key=lambda item: (item[1].st_mtime, item[0]), reverse=True)
+    return [{"name": name, "size": stat.st_size, "created_at": stat.st_mtime} for name, stat in stats]
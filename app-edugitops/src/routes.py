@@ -1,34 +1,129 @@
 from __future__ import annotations
 
+import hashlib
+import hmac
 import os
-import subprocess
-import re
-from typing import Any
+import time
+from typing import Any, Callable
 
-from flask import Blueprint, jsonify, render_template, request
+from flask import (
+    Blueprint, Response, abort, before_render_template, g, jsonify, make_response, render_template, request,
+    send_from_directory, template_rendered, url_for,
+)
 from flask.typing import ResponseReturnValue
 
 import data_manager
+import gitea_client
+import health_probe
+import jobs
+import k8s_cache
+import metrics
+import profiling
 import config
 
 main_bp = Blueprint('main', __name__)
 
+@main_bp.before_app_request
+def _start_timer() -> None:
+    g.request_start = time.perf_counter()
+    g.spans_token = profiling.start_request()
+    g.profiler = None
+    if profiling.profile_requested(request.path, request.args.get('profile')):
+        g.profiler = profiling.start_profile()
+
+@main_bp.after_app_request
+def _observe_latency(response: Response) -> Response:
+    """Latencia por ruta (la regla, no la URL, para no disparar la cardinalidad)."""
+    start = g.pop('request_start', None)
+    token = g.pop('spans_token', None)
+    profiler = g.pop('profiler', None)
+    if start is None:
+        return response
+    elapsed = time.perf_counter() - start
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.HTTP_REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=response.status_code)
+
+    spans = profiling.finish_request(token) if token is not None else {}
+    if config.SERVER_TIMING_ENABLED:
+        response.headers['Server-Timing'] = profiling.server_timing(spans, elapsed)
+    if profiler is not None:
+        response.headers['X-Profile'] = profiling.save_profile(profiler, request.method, request.path)
+    return response
+
+def _render_started(sender: Any, template: Any, context: Any, **extra: Any) -> None:
+    g.render_start = time.perf_counter()
+
+def _render_finished(sender: Any, template: Any, context: Any, **extra: Any) -> None:
+    start = g.pop('render_start', None)
+    if start is not None:
+        profiling.record('render', time.perf_counter() - start)
+
+before_render_template.connect(_render_started)
+template_rendered.connect(_render_finished)
+
+def _check_profiling_token() -> None:
+    """
+    Las rutas de perfiles exigen ?token=<PROFILING_SECRET>. Sin secreto
+    configurado no existen (404): los perfiles son de peticiones reales.
+    """
+    secret = config.PROFILING_SECRET
+    if not secret:
+        abort(404)
+    if not hmac.compare_digest(secret, request.args.get('token', '')):
+        abort(403)
+
+@main_bp.route('/admin/profiles')
+def list_profiles() -> ResponseReturnValue:
+    """Perfiles de petición guardados (buffer circular en PROFILING_DIR)."""
+    _check_profiling_token()
+    return jsonify({'profiles': profiling.list_profiles(), 'max_files': config.PROFILING_MAX_FILES})
+
+@main_bp.route('/admin/profiles/<name>')
+def download_profile(name: str) -> ResponseReturnValue:
+    """Descarga un perfil (formato pstats: `python -m pstats <fichero>` o snakeviz)."""
+    _check_profiling_token()
+    if not name.endswith(profiling.PROFILE_SUFFIX):
+        abort(404)
+    return send_from_directory(config.PROFILING_DIR, name, as_attachment=True)
+
+@main_bp.route('/metrics')
+def metrics_view() -> ResponseReturnValue:
+    """Métricas en formato de texto de Prometheus."""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def _int_arg(name: str, default: int | None) -> int | None:
+    """Lee un parámetro entero de la query string (default si falta o es inválido)."""
+    try:
+        return int(request.args.get(name, ""))
+    except ValueError:
+        return default
+
+def _student_page() -> dict[str, Any]:
+    """Página de alumnos según los parámetros q, page y page_size."""
+    return data_manager.search_students(
+        request.args.get("q", ""),
+        page=_int_arg("page", 1) or 1,
+        page_size=_int_arg("page_size", None),
+    )
+
 @main_bp.route('/')
 def index() -> ResponseReturnValue:
     # Cargar datos (puede ser local o actualizado desde git)
-    alumnos: list[dict[str, Any]] = data_manager.load_alumnos()
+    repo = data_manager.get_student_repository()
+    student_page = _student_page()
+    alumnos: list[dict[str, Any]] = student_page["items"]
     servicios: list[dict[str, Any]] = data_manager.load_catalogo()
 
     # Obtener el estado global de la sincronización con Git
-    git_sync_status = data_manager.GIT_SYNC_STATUS
+    git_sync_status = data_manager.get_sync_status()["success"]
 
     selected_id: str | None = request.args.get("id")
     current_student: dict[str, Any] | None = None
 
     if selected_id:
-        current_student = next((a for a in alumnos if str(a.get('id')) == selected_id), None)
+        current_student = repo.get(selected_id)
 
-    # Fallback: si no hay alumno seleccionado y hay alumnos en la lista
+    # Fallback: si no hay alumno seleccionado y hay alumnos en la página
     if not current_student and alumnos and not selected_id:
          current_student = alumnos[0]
 
@@ -44,12 +139,63 @@ def index() -> ResponseReturnValue:
     return render_template(
         'index.html',
         alumnos=alumnos,
+        student_page=student_page,
         servicios=servicios,
         current_student=current_student,
         assigned_apps=assigned_apps,
         git_sync_status=git_sync_status
     )
 
+def _conditional_json(file_etag: str, build: Callable[[], Any], *variant: str) -> ResponseReturnValue:
+    """
+    Respuesta JSON con ETag fuerte derivado del hash del fichero y de la
+    variante pedida (query, id...). Si coincide con If-None-Match devuelve
+    304 sin construir ni serializar el cuerpo.
+    """
+    etag = hashlib.sha256("\x00".join((file_etag,) + variant).encode("utf-8")).hexdigest()[:32]
+    if request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    return response
+
+@main_bp.route('/api/students')
+def api_students() -> ResponseReturnValue:
+    """Búsqueda paginada de alumnos (q, page, page_size) en JSON."""
+    query_string = request.query_string.decode("utf-8", "replace")
+    return _conditional_json(data_manager.get_alumnos_etag(), _student_page, "students", query_string)
+
+@main_bp.route('/api/students/<student_id>')
+def api_student_detail(student_id: str) -> ResponseReturnValue:
+    """Un alumno por su ID en JSON."""
+    alumno = data_manager.get_student(student_id)
+    if alumno is None:
+        return jsonify({'success': False, 'message': 'Alumno no encontrado.'}), 404
+    return _conditional_json(data_manager.get_alumnos_etag(), lambda: alumno, "student", student_id)
+
+@main_bp.route('/api/catalog')
+def api_catalog() -> ResponseReturnValue:
+    """Catálogo de servicios en JSON."""
+    return _conditional_json(data_manager.get_catalogo_etag(), data_manager.load_catalogo, "catalog")
+
+@main_bp.route('/healthz')
+def healthz() -> ResponseReturnValue:
+    """Liveness: el proceso está vivo y atiende peticiones."""
+    return jsonify({'status': 'ok'})
+
+@main_bp.route('/readyz')
+def readyz() -> ResponseReturnValue:
+    """Readiness: la sincronización inicial con Gitea terminó (o agotó su tiempo)."""
+    status = data_manager.initial_sync_status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@main_bp.route('/api/health')
+def api_health() -> ResponseReturnValue:
+    """Estado de cada servicio de alumno (sondeo cacheado; ?refresh=1 fuerza uno nuevo)."""
+    force = request.args.get('refresh', '').lower() in ('1', 'true')
+    return jsonify(health_probe.get_prober().report(force=force))
+
 @main_bp.route('/info')
 def info_route() -> ResponseReturnValue:
     """Muestra la versión y las variables de entorno (con secretos ofuscados)."""
@@ -122,15 +268,36 @@ def delete_student() -> ResponseReturnValue:
     
     if success:
         # Calcular cuál es el siguiente alumno a mostrar tras el borrado
-        alumnos_restantes = data_manager.load_alumnos()
+        primer_alumno = data_manager.get_student_repository().first()
         next_id = None
-        if alumnos_restantes:
-            next_id = alumnos_restantes[0]['id']
+        if primer_alumno:
+            next_id = primer_alumno['id']
             
         return jsonify({'success': True, 'message': msg, 'next_id': next_id})
     else:
         return jsonify({'success': False, 'message': msg}), 400
 
+@main_bp.route('/students/bulk', methods=['POST'])
+def bulk_students() -> ResponseReturnValue:
+    """
+    Altas/modificaciones/bajas masivas en una sola validación y escritura.
+    Acepta CSV (text/csv, columnas op,id,nombre,apps) o JSON: una lista de
+    operaciones o un objeto {"operations": [...]}.
+    """
+    if request.mimetype == 'text/csv':
+        operations: Any = data_manager.parse_bulk_csv(request.get_data(as_text=True))
+    else:
+        operations = request.get_json(silent=True)
+        if isinstance(operations, dict):
+            operations = operations.get("operations")
+
+    if not isinstance(operations, list) or not operations:
+        return jsonify({"success": False, "message": "Se esperaba una lista de operaciones."}), 400
+
+    success, message, results = data_manager.apply_bulk_operations(operations)
+    status = 200 if success else 400
+    return jsonify({'success': success, 'message': message, 'results': results}), status
+
 @main_bp.route('/editor')
 def editor() -> ResponseReturnValue:
     """Renderiza la vista de edición manual de YAML."""
@@ -163,117 +330,92 @@ def git_push() -> ResponseReturnValue:
     if isinstance(data, dict) and data.get("message"):
         message = str(data.get("message"))
 
-    success, msg = data_manager.push_alumnos_to_gitea(commit_message=message)
+    success, msg, committed = data_manager.push_alumnos_to_gitea(commit_message=message)
 
     if success:
-        return jsonify({'success': True, 'message': msg})
+        if not committed:
+            # Nada subido: Checkmk ya refleja lo que hay en Gitea
+            return jsonify({'success': True, 'message': msg})
+        # Checkmk se regenera en segundo plano: la respuesta no espera por él
+        job = data_manager.schedule_monitoring()
+        return jsonify({'success': True, 'message': msg, 'job_id': job.id, 'job_url': url_for('main.job_status', job_id=job.id)})
     else:
         # 502 Bad Gateway es apropiado para errores de upstream (Gitea)
         return jsonify({'success': False, 'message': msg}), 502
 
+@main_bp.route('/jobs/stats', methods=['GET'])
+def jobs_stats() -> ResponseReturnValue:
+    """Contadores de las tareas agrupadas (cuántos pushes compartieron regeneración)."""
+    return jsonify({'monitoring': data_manager.get_monitoring_stats()})
+
+@main_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str) -> ResponseReturnValue:
+    """Estado de una tarea en segundo plano (p. ej. la monitorización tras un push)."""
+    job = jobs.get_job_info(job_id)
+    if job is None:
+        return jsonify({'error': 'Tarea no encontrada'}), 404
+    return jsonify(job)
+
 @main_bp.route('/sync_git', methods=['POST'])
 def sync_git() -> ResponseReturnValue:
     """Fuerza un reintento de sincronización con Gitea."""
     success = data_manager.sync_files_from_gitea()
+    files = data_manager.get_sync_status()["files"]
     
     if success:
-        return jsonify({'success': True, 'message': 'Sincronización con Gitea exitosa.'})
+        return jsonify({'success': True, 'message': 'Sincronización con Gitea exitosa.', 'files': files})
     else:
-        return jsonify({'success': False, 'message': 'Fallo al sincronizar. Verifique que Gitea está activo.'}), 502
-
-def run_kubectl_command(command_list):
-    """Ejecuta un comando kubectl y devuelve la salida como texto."""
-    try:
-        # Añadimos --kubeconfig si fuera necesario, pero asumimos que el entorno tiene acceso
-        result = subprocess.check_output(command_list, text=True, stderr=subprocess.STDOUT)
-        return result.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error ejecutando kubectl: {e.output}")
-        return None
-    except FileNotFoundError:
-        return None
-
-def get_node_external_ip():
-    """Obtiene la IP Externa (o Interna) del primer nodo usando kubectl."""
-    # Comando equivalente a: kubectl get nodes -o wide --no-headers
-    output = run_kubectl_command(['kubectl', 'get', 'nodes', '-o', 'wide', '--no-headers'])
-    
-    if not output:
-        return "127.0.0.1"
-
-    # Procesamos línea por línea (normalmente solo hay un nodo o varios)
-    for line in output.split('\n'):
-        parts = line.split()
-        if len(parts) >= 7:
-            # En 'get nodes -o wide', las columnas suelen ser:
-            # NAME STATUS ROLES AGE VERSION INTERNAL-IP EXTERNAL-IP
-            # Index 5 es Internal, Index 6 es External (normalmente)
-            external_ip = parts[6] if len(parts) > 6 else "<none>"
-            internal_ip = parts[5]
-            
-            # Si tiene IP externa real (no <none>), la usamos. Si no, la interna.
-            if external_ip != "<none>":
-                return external_ip
-            return internal_ip
-            
-    return "127.0.0.1"
+        return jsonify({'success': False, 'message': 'Fallo al sincronizar. Verifique que Gitea está activo.', 'files': files}), 502
+
+@main_bp.route('/webhooks/gitea', methods=['POST'])
+def gitea_webhook() -> ResponseReturnValue:
+    """
+    Webhook de push de Gitea: si el push toca alumnos.yaml o el catálogo en la
+    rama configurada, sincroniza solo esos ficheros (y sus cachés derivadas).
+    """
+    if not config.GITEA_WEBHOOK_SECRET:
+        return jsonify({'success': False, 'message': 'Webhook no configurado (GITEA_WEBHOOK_SECRET).'}), 403
+    signature = request.headers.get('X-Gitea-Signature', '')
+    if not gitea_client.verify_webhook_signature(config.GITEA_WEBHOOK_SECRET, request.get_data(), signature):
+        return jsonify({'success': False, 'message': 'Firma del webhook no válida.'}), 401
+
+    event = request.headers.get('X-Gitea-Event', '')
+    payload: Any = request.get_json(silent=True)
+    if event != 'push' or not isinstance(payload, dict):
+        return jsonify({'success': True, 'message': f"Evento '{event}' ignorado.", 'files': {}})
+
+    changed = data_manager.gitea_push_changed_files(payload)
+    if not changed:
+        return jsonify({'success': True, 'message': 'El push no afecta a los ficheros sincronizados.', 'files': {}})
+
+    # El webhook de nuestro propio push no debe pisar lo guardado después en local.
+    # El sondeo de salud caduca solo (en todos los workers): la sincronización
+    # sube la generación de los datos, igual que /sync_git.
+    files = data_manager.sync_from_gitea(set(changed), keep_local_changes=True)
+    success = 'failed' not in files.values()
+    return jsonify({'success': success, 'files': files}), 200 if success else 502
 
 @main_bp.route('/deployments')
 def deployments_view() -> ResponseReturnValue:
-    """Vista para listar servicios NodePort de alumnos."""
-    
-    deployments_list = []
-    error_msg = None
-    node_ip = "127.0.0.1"
+    """Vista para listar servicios NodePort de alumnos (desde la caché de Kubernetes)."""
+    cache = k8s_cache.get_cache()
+    # Tramo 'kubectl': lo que la vista espera por la caché (solo el primer listado)
+    with profiling.span('kubectl'):
+        cache.wait_synced(config.K8S_INITIAL_SYNC_TIMEOUT)
+    status = cache.status()
 
-    try:
-        # 1. Obtener IP del Nodo
-        node_ip = get_node_external_ip()
-
-        # 2. Obtener Servicios
-        svc_output = run_kubectl_command(['kubectl', 'get', 'svc', '-A', '--no-headers'])
-
-        if svc_output:
-            for line in svc_output.split('\n'):
-                # Ejemplo de línea: 
-                # alumno-pepe  app-lablight-service  NodePort  10.100.x.x  <none>  80:30301/TCP  2m
-                parts = line.split()
-                
-                if len(parts) >= 5:
-                    namespace = parts[0]
-                    name = parts[1]
-                    svc_type = parts[2]
-                    ports_str = parts[4] if len(parts) == 5 else parts[5] 
-
-                    # FILTRO SIMPLIFICADO: Solo namespaces de alumnos y tipo NodePort
-                    if namespace.startswith('alumno-') and svc_type == 'NodePort':
-                        
-                        # Extraer el puerto externo (NodePort)
-                        match = re.search(r':(\d+)', ports_str)
-                        node_port = match.group(1) if match else "???"
-                        
-                        # Extraer el puerto interno (el que está antes de los :)
-                        # Fundamental para que funcione el comando port-forward
-                        internal_port = ports_str.split(':')[0] if ':' in ports_str else "80"
-
-                        # Generar el comando exacto con los puertos correctos
-                        cmd = f"kubectl port-forward -n {namespace} svc/{name} {node_port}:{internal_port}"
-
-                        deployments_list.append({
-                            'namespace': namespace,
-                            'app_name': name,
-                            'node_ip': node_ip,
-                            'port': node_port,
-                            'url': f"http://{node_ip}:{node_port}",
-                            'pf_cmd': cmd  # Comando generado correctamente
-                        })
-            
-            # Ordenar simplemente por namespace
-            deployments_list.sort(key=lambda x: x['namespace'])
-        else:
-            error_msg = "No se pudo obtener la lista de servicios (kubectl devolvió vacío o falló)."
-
-    except Exception as e:
-        error_msg = f"Error inesperado: {str(e)}"
-
-    return render_template('deployments.html', deployments=deployments_list, error=error_msg)
\ No newline at end of file
+    error_msg = None
+    if not status['synced']:
+        detail = status['error'] or "kubectl no respondió a tiempo"
+        error_msg = f"No se pudo obtener la lista de servicios ({detail})."
+
+    # Estado de salud del último sondeo (sin esperar: si caducó se refresca aparte)
+    health = health_probe.get_prober().cached_report()
+    health_by_service = {
+        (result['namespace'], result['service']): result for result in (health or {}).get('services', [])
+    }
+    deployments_list = cache.deployments()
+    for deploy in deployments_list:
+        deploy['health'] = health_by_service.get((deploy['namespace'], deploy['app_name']))
+
+    return render_template('deployments.html', deployments=deployments_list, error=error_msg, cache_status=status)
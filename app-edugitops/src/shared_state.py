@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any
+
+import config
+
+# Estado compartido entre los workers de gunicorn (procesos distintos) en una
+# base de datos SQLite local: valores JSON por clave, contadores y números de
+# generación. Cada proceso/hilo abre su propia conexión (no se comparten tras
+# un fork). Si SQLite falla, las lecturas devuelven el valor por defecto.
+
+_LOCAL = threading.local()
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+)
+
+
+def _connect() -> sqlite3.Connection:
+    """Conexión de este hilo y proceso a SHARED_STATE_DB (se crea al primer uso)."""
+    path = config.SHARED_STATE_DB
+    key = (os.getpid(), path)
+    connections: dict[tuple[int, str], sqlite3.Connection] = _LOCAL.__dict__.setdefault("connections", {})
+    conn = connections.get(key)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Autocommit: cada sentencia es su propia transacción
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        connections[key] = conn
+    return conn
+
+
+def get(key: str, default: Any = None) -> Any:
+    """Valor JSON guardado en `key` (o `default`)."""
+    try:
+        row = _connect().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+    except sqlite3.Error as exc:
+        print(f"ERROR: Estado compartido no disponible ({key}): {exc}")
+        return default
+    return json.loads(row[0]) if row else default
+
+
+def items(prefix: str) -> dict[str, Any]:
+    """Valores JSON de las claves que empiezan por `prefix` (con la clave completa)."""
+    try:
+        rows = _connect().execute(
+            "SELECT key, value FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+    except sqlite3.Error as exc:
+        print(f"ERROR: Estado compartido no disponible ({prefix}): {exc}")
+        return {}
+    return {key: json.loads(value) for key, value in rows}
+
+
+def put(key: str, value: Any) -> None:
+    """Guarda `value` (serializable a JSON) en `key`."""
+    try:
+        _connect().execute(
+            "INSERT INTO kv (key, value, updated_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (key, json.dumps(value, ensure_ascii=False), time.time()),
+        )
+    except sqlite3.Error as exc:
+        print(f"ERROR: No se pudo guardar el estado compartido ({key}): {exc}")
+
+
+def prune(prefix: str, keep: int) -> None:
+    """Conserva solo las `keep` claves más recientes que empiezan por `prefix`."""
+    try:
+        _connect().execute(
+            "DELETE FROM kv WHERE substr(key, 1, ?) = ? AND key NOT IN "
+            "(SELECT key FROM kv WHERE substr(key, 1, ?) = ? ORDER BY updated_at DESC LIMIT ?)",
+            (len(prefix), prefix, len(prefix), prefix, max(0, keep)),
+        )
+    except sqlite3.Error as exc:
+        print(f"ERROR: No se pudo podar el estado compartido ({prefix}): {exc}")
+
+
+def incr(name: str, amount: int = 1) -> int:
+    """Suma `amount` al contador `name` y devuelve su nuevo valor (0 si SQLite falla)."""
+    try:
+        row = _connect().execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value RETURNING value",
+            (name, amount),
+        ).fetchone()
+    except sqlite3.Error as exc:
+        print(f"ERROR: No se pudo actualizar el contador {name}: {exc}")
+        return 0
+    return int(row[0])
+
+
+def counters(prefix: str) -> dict[str, int]:
+    """Contadores cuyo nombre empieza por `prefix` (sin el prefijo)."""
+    try:
+        rows = _connect().execute(
+            "SELECT name, value FROM counters WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall()
+    except sqlite3.Error as exc:
+        print(f"ERROR: Estado compartido no disponible ({prefix}): {exc}")
+        return {}
+    return {name[len(prefix):]: int(value) for name, value in rows}
+
+
+def bump_generation(name: str) -> int:
+    """Nueva generación de un dato (p. ej. 'alumnos' tras escribirlo cualquier worker)."""
+    return incr(f"generation:{name}")
+
+
+def generation(name: str) -> int:
+    return counters(f"generation:{name}").get("", 0)
+
+
+class ProcessLock:
+    """
+    Cerrojo reentrante válido entre hilos y entre procesos: un RLock para los
+    hilos del proceso y flock sobre '<SHARED_STATE_DB>.<nombre>.lock' para
+    los demás workers.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd: int | None = None
+
+    def acquire(self) -> None:
+        self._rlock.acquire()
+        if self._depth == 0:
+            path = f"{config.SHARED_STATE_DB}.{self.name}.lock"
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o600)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._fd = fd
+            except OSError as exc:
+                # Sin fichero de bloqueo seguimos protegidos al menos entre hilos
+                print(f"ERROR: No se pudo bloquear {path}: {exc}")
+                self._fd = None
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+    def __enter__(self) -> ProcessLock:
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.release()
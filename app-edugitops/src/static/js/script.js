@@ -54,35 +54,94 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
-    // --- BÚSQUEDA Y PERSISTENCIA ---
+    // --- BÚSQUEDA Y PAGINACIÓN (servidor) ---
+    // El servidor solo envía una página de alumnos; la búsqueda y las páginas
+    // siguientes se piden a /api/students en vez de filtrar el DOM.
+    const studentList = document.getElementById('student-list');
+    const btnLoadMore = document.getElementById('btn-load-more');
+    const studentCount = document.getElementById('student-count');
+    let searchTimer = null;
+    let searchRequest = 0;
+
+    function renderStudentItem(alumno) {
+        const currentId = document.getElementById('student-id')?.value || '';
+        const isActive = String(alumno.id) === currentId;
+        const apps = Array.isArray(alumno.apps) ? alumno.apps.length : 0;
+
+        const item = document.createElement('a');
+        item.href = '/?id=' + encodeURIComponent(alumno.id);
+        item.className = 'list-group-item list-group-item-action border rounded p-3 d-flex align-items-center gap-3 student-item '
+            + (isActive ? 'active-student-card' : 'bg-light border-0');
+        item.innerHTML = `
+            <div class="avatar-placeholder ${isActive ? 'text-primary' : 'text-secondary'}">
+                <i class="bi bi-person-fill fs-4"></i>
+            </div>
+            <div class="w-100">
+                <div class="d-flex justify-content-between align-items-center">
+                    <span class="fw-semibold student-name"></span>
+                    <span class="small opacity-75 student-id"></span>
+                </div>
+                <small class="${isActive ? 'text-dark' : 'text-muted'}">Labs: ${apps} assigned</small>
+            </div>`;
+        item.querySelector('.student-name').textContent = alumno.nombre;
+        item.querySelector('.student-id').textContent = 'ID: ' + alumno.id;
+        return item;
+    }
+
+    function fetchStudentPage(page, append) {
+        if (!studentList) return Promise.resolve();
+        const query = searchInput ? searchInput.value : '';
+        const params = new URLSearchParams({ q: query, page: page, page_size: studentList.dataset.pageSize || '' });
+        const requestId = ++searchRequest;
+
+        return fetch('/api/students?' + params.toString())
+            .then(res => res.json())
+            .then(data => {
+                // Ignorar respuestas de búsquedas ya superadas por otra más reciente
+                if (requestId !== searchRequest) return;
+                if (!append) studentList.innerHTML = '';
+                data.items.forEach(alumno => studentList.appendChild(renderStudentItem(alumno)));
+
+                studentList.dataset.page = data.page;
+                studentList.dataset.pages = data.pages;
+                if (studentCount) studentCount.textContent = data.total + ' alumnos';
+                if (btnLoadMore) {
+                    btnLoadMore.classList.toggle('d-none', data.page >= data.pages);
+                    btnLoadMore.href = '/?' + new URLSearchParams({ q: query, page: data.page + 1, page_size: data.page_size }).toString();
+                }
+            })
+            .catch(err => console.error('Error buscando alumnos:', err));
+    }
+
     if (searchInput) {
+        // Restaurar la búsqueda guardada si el servidor no trae ya una (?q=)
         const savedSearch = sessionStorage.getItem('edu_search_term');
-        if (savedSearch) searchInput.value = savedSearch;
+        const restoreSearch = Boolean(savedSearch) && !searchInput.value;
+        if (restoreSearch) searchInput.value = savedSearch;
 
         searchInput.addEventListener('input', function() {
-            const filterValue = this.value.toLowerCase();
             sessionStorage.setItem('edu_search_term', this.value);
-            const studentItems = document.querySelectorAll('.student-item');
-
-            studentItems.forEach(item => {
-                const nameText = item.querySelector('.student-name').textContent.toLowerCase();
-                const idText = item.querySelector('.student-id').textContent.toLowerCase();
-                if (nameText.includes(filterValue) || idText.includes(filterValue)) {
-                    item.classList.remove('d-none');
-                    item.style.display = ''; 
-                } else {
-                    item.classList.add('d-none');
-                }
-            });
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => fetchStudentPage(1, false), 250);
         });
 
-        if (savedSearch) searchInput.dispatchEvent(new Event('input'));
+        if (restoreSearch) fetchStudentPage(1, false);
+    }
+
+    if (btnLoadMore) {
+        btnLoadMore.addEventListener('click', function(e) {
+            e.preventDefault();
+            const nextPage = parseInt(studentList?.dataset.page || '1', 10) + 1;
+            fetchStudentPage(nextPage, true);
+        });
     }
 
     function resetSearch() {
-        if (searchInput) {
+        if (searchInput && searchInput.value) {
             searchInput.value = '';
-            searchInput.dispatchEvent(new Event('input'));
+            sessionStorage.setItem('edu_search_term', '');
+            clearTimeout(searchTimer);
+            fetchStudentPage(1, false);
         }
     }
 
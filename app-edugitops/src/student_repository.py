@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import heapq
+import threading
+from typing import Any
+
+StudentRecord = dict[str, Any]
+
+# Longitud máxima de los n-gramas del índice de búsqueda.
+# Consultas de hasta esta longitud se resuelven con una sola consulta al índice.
+SEARCH_NGRAM = 3
+
+
+def _normalize_name(name: Any) -> str:
+    """Clave de unicidad del nombre: sin espacios laterales y en minúsculas."""
+    return str(name or "").strip().lower()
+
+
+def _search_text(sid: str, record: StudentRecord) -> tuple[str, str]:
+    """Textos buscables de un alumno: (nombre, id) en minúsculas."""
+    return _normalize_name(record.get("nombre")), sid.lower()
+
+
+def _ngrams(text: str) -> set[str]:
+    """Todos los fragmentos de 1..SEARCH_NGRAM caracteres de un texto."""
+    grams: set[str] = set()
+    for size in range(1, SEARCH_NGRAM + 1):
+        for start in range(len(text) - size + 1):
+            grams.add(text[start:start + size])
+    return grams
+
+
+def _numeric_id(student_id: str) -> int | None:
+    """Convierte un ID a entero si es posible (los IDs son '001', '002'...)."""
+    try:
+        return int(student_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class StudentRepository:
+    """
+    Índice en memoria de la lista de alumnos.
+    Mantiene dos tablas hash (id -> registro y nombre en minúsculas -> id)
+    y un montículo de IDs numéricos, de modo que buscar, comprobar unicidad y
+    borrar sean O(1) y calcular el siguiente ID O(log n) amortizado (también
+    tras borrar el ID más alto). Conserva el orden original de la lista.
+    Los registros son los mismos dicts que se le pasan (no se copian) y nunca
+    se modifican: actualizar un alumno sustituye su registro por uno nuevo.
+    Así un cambio cuesta O(1) aunque otros hilos estén leyendo a la vez; la
+    lista y el índice de búsqueda se regeneran al pedirlos tras un cambio.
+    """
+
+    def __init__(self, records: list[StudentRecord] | None = None) -> None:
+        # Serializa los cambios entre sí y con quien lee el montículo o
+        # recorre los registros (las consultas por clave no lo necesitan)
+        self._lock = threading.Lock()
+        # Sube con cada cambio; invalida la lista y el índice de búsqueda
+        self._version = 0
+        self._by_id: dict[str, StudentRecord] = {}
+        self._id_by_name: dict[str, str] = {}
+        # IDs numéricos vivos (valor -> nº de IDs con ese valor, p. ej. '7' y
+        # '007') y montículo de máximos (negados). Los borrados se quitan del
+        # montículo de forma perezosa, al consultar el máximo.
+        self._numeric_count: dict[int, int] = {}
+        self._id_heap: list[int] = []
+        # Lista de registros e índice de búsqueda (n-grama -> ids, posición de
+        # cada id y registros indexados), con la versión a la que corresponden.
+        # Se construyen al pedirlos y dejan de valer con cualquier cambio.
+        self._list_cache: tuple[int, list[StudentRecord]] | None = None
+        self._search_index: (
+            tuple[int, dict[str, set[str]], dict[str, int], dict[str, StudentRecord]] | None
+        ) = None
+        for record in records or []:
+            self._add(record)
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __contains__(self, student_id: object) -> bool:
+        return str(student_id) in self._by_id
+
+    def _add(self, record: StudentRecord) -> None:
+        sid = str(record.get("id"))
+        self._by_id[sid] = record
+        self._id_by_name.setdefault(_normalize_name(record.get("nombre")), sid)
+        numeric = _numeric_id(sid)
+        if numeric is not None:
+            count = self._numeric_count.get(numeric, 0)
+            self._numeric_count[numeric] = count + 1
+            if count == 0:
+                heapq.heappush(self._id_heap, -numeric)
+
+    def _unindex_name(self, sid: str, record: StudentRecord) -> None:
+        key = _normalize_name(record.get("nombre"))
+        if self._id_by_name.get(key) == sid:
+            del self._id_by_name[key]
+
+    def get(self, student_id: str | int) -> StudentRecord | None:
+        """Devuelve el alumno con ese ID o None."""
+        return self._by_id.get(str(student_id))
+
+    def first(self) -> StudentRecord | None:
+        """Devuelve el primer alumno de la lista (o None si está vacía)."""
+        with self._lock:
+            return next(iter(self._by_id.values()), None)
+
+    def name_owner(self, name: str) -> str | None:
+        """Devuelve el ID del alumno que usa ese nombre (sin distinguir mayúsculas)."""
+        return self._id_by_name.get(_normalize_name(name))
+
+    def is_name_taken(self, name: str, student_id: str | int) -> bool:
+        """True si el nombre lo usa un alumno con un ID distinto a student_id."""
+        owner = self.name_owner(name)
+        return owner is not None and owner != str(student_id)
+
+    def next_id(self) -> str:
+        """Siguiente ID disponible con el formato de tres dígitos ('004')."""
+        return str(self._max_numeric_id() + 1).zfill(3)
+
+    def _max_numeric_id(self) -> int:
+        with self._lock:
+            heap = self._id_heap
+            while heap and -heap[0] not in self._numeric_count:
+                heapq.heappop(heap)
+            return max(-heap[0], 0) if heap else 0
+
+    def upsert(self, record: StudentRecord) -> bool:
+        """
+        Crea o actualiza un alumno a partir de su campo 'id'.
+        Al actualizar, el registro se sustituye por uno nuevo con los campos
+        del anterior más los de `record` (mantiene posición y claves extra).
+        Devuelve True si se ha creado uno nuevo.
+        """
+        sid = str(record.get("id"))
+        with self._lock:
+            self._version += 1
+            existing = self._by_id.get(sid)
+            if existing is None:
+                self._add(record)
+                return True
+
+            self._unindex_name(sid, existing)
+            updated = {**existing, **record}
+            self._by_id[sid] = updated
+            self._id_by_name.setdefault(_normalize_name(updated.get("nombre")), sid)
+            return False
+
+    def delete(self, student_id: str | int) -> StudentRecord | None:
+        """Elimina un alumno y lo devuelve (None si no existía)."""
+        sid = str(student_id)
+        with self._lock:
+            record = self._by_id.pop(sid, None)
+            if record is None:
+                return None
+
+            self._version += 1
+            self._unindex_name(sid, record)
+            numeric = _numeric_id(sid)
+            if numeric is not None:
+                # Queda en el montículo hasta que llegue a la cima
+                count = self._numeric_count[numeric] - 1
+                if count:
+                    self._numeric_count[numeric] = count
+                else:
+                    del self._numeric_count[numeric]
+            return record
+
+    def copy(self) -> StudentRepository:
+        """Copia independiente para aplicar cambios en bloque (comparte los registros, que no cambian)."""
+        clone = StudentRepository()
+        with self._lock:
+            clone._by_id = dict(self._by_id)
+            clone._id_by_name = dict(self._id_by_name)
+            clone._numeric_count = dict(self._numeric_count)
+            clone._id_heap = list(self._id_heap)
+        return clone
+
+    def to_list(self) -> list[StudentRecord]:
+        """
+        Lista de alumnos en su orden original, lista para volcar a YAML.
+        Se reutiliza mientras no haya cambios: quien la reciba no debe modificarla.
+        """
+        cached = self._list_cache
+        if cached is not None and cached[0] == self._version:
+            return cached[1]
+        with self._lock:
+            version = self._version
+            records = list(self._by_id.values())
+        self._list_cache = (version, records)
+        return records
+
+    def _build_search_index(
+        self,
+    ) -> tuple[int, dict[str, set[str]], dict[str, int], dict[str, StudentRecord]]:
+        # Se construye sobre una foto de los registros (los cambios pueden
+        # seguir mientras tanto) y se publica de una vez
+        with self._lock:
+            version = self._version
+            by_id = dict(self._by_id)
+        index: dict[str, set[str]] = {}
+        positions: dict[str, int] = {}
+        for position, (sid, record) in enumerate(by_id.items()):
+            positions[sid] = position
+            for text in _search_text(sid, record):
+                for gram in _ngrams(text):
+                    index.setdefault(gram, set()).add(sid)
+        built = (version, index, positions, by_id)
+        self._search_index = built
+        return built
+
+    def search(self, query: str) -> list[StudentRecord]:
+        """
+        Alumnos cuyo nombre o ID contiene `query` (sin distinguir mayúsculas).
+        Primero los que empiezan por `query` y después el resto, ambos grupos
+        en el orden de la lista. Usa un índice de n-gramas: las consultas
+        cortas son una búsqueda directa y las largas intersecan sus trigramas.
+        """
+        needle = query.strip().lower()
+        if not needle:
+            return self.to_list()
+
+        built = self._search_index
+        if built is None or built[0] != self._version:
+            built = self._build_search_index()
+        _, index, positions, by_id = built
+        if len(needle) <= SEARCH_NGRAM:
+            candidates = index.get(needle, set())
+        else:
+            grams = [needle[i:i + SEARCH_NGRAM] for i in range(len(needle) - SEARCH_NGRAM + 1)]
+            grams.sort(key=lambda gram: len(index.get(gram, ())))
+            candidates = set(index.get(grams[0], set()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= index.get(gram, set())
+
+        prefix: list[str] = []
+        contains: list[str] = []
+        for sid in sorted(candidates, key=positions.__getitem__):
+            nombre, id_text = _search_text(sid, by_id[sid])
+            if nombre.startswith(needle) or id_text.startswith(needle):
+                prefix.append(sid)
+            elif needle in nombre or needle in id_text:
+                contains.append(sid)
+        return [by_id[sid] for sid in prefix + contains]
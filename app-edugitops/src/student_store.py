@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+
+from student_repository import StudentRecord
+
+# Almacén de alumnos en SQLite (modo ALUMNOS_BACKEND=sqlite).
+# Cada alumno es una fila (el registro completo en JSON, para volcarlo a YAML
+# tal cual) indexada por id, posición y nombre. Las escrituras son por fila
+# y el modo WAL permite lectores concurrentes mientras se escribe.
+# Cada escritura sube `version`, con la que los lectores validan sus cachés.
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS students ("
+    " id TEXT PRIMARY KEY, position INTEGER NOT NULL, nombre_key TEXT NOT NULL, record TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS students_position ON students (position)",
+    "CREATE INDEX IF NOT EXISTS students_nombre_key ON students (nombre_key)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0), ('initialized', 0)",
+)
+
+
+def _encode(record: StudentRecord) -> str:
+    return json.dumps(record, ensure_ascii=False)
+
+
+def _name_key(record: StudentRecord) -> str:
+    """Misma clave de unicidad de nombre que StudentRepository."""
+    return str(record.get("nombre") or "").strip().lower()
+
+
+class SqliteStudentStore:
+    """
+    Alumnos en una base de datos SQLite con índices por id, posición (el
+    orden de alumnos.yaml) y nombre. Cada hilo de cada proceso usa su
+    propia conexión; las escrituras son transacciones cortas.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    # --- Lecturas ---
+
+    def version(self) -> int:
+        """Contador que sube con cada escritura (de cualquier proceso)."""
+        return int(self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0])
+
+    def initialized(self) -> bool:
+        """True si ya se ha importado alguna vez un roster (aunque esté vacío)."""
+        return bool(self._connect().execute("SELECT value FROM meta WHERE key = 'initialized'").fetchone()[0])
+
+    def records(self) -> list[StudentRecord]:
+        """Todos los alumnos en el orden de alumnos.yaml."""
+        rows = self._connect().execute("SELECT record FROM students ORDER BY position").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get(self, student_id: str | int) -> StudentRecord | None:
+        row = self._connect().execute("SELECT record FROM students WHERE id = ?", (str(student_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # --- Escrituras (por fila) ---
+
+    def _put(self, conn: sqlite3.Connection, record: StudentRecord, position: int | None) -> None:
+        sid = str(record.get("id"))
+        if position is None:
+            row = conn.execute("SELECT position FROM students WHERE id = ?", (sid,)).fetchone()
+            if row is None:
+                row = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM students").fetchone()
+            position = int(row[0])
+        conn.execute(
+            "INSERT INTO students (id, position, nombre_key, record) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET position = excluded.position, "
+            "nombre_key = excluded.nombre_key, record = excluded.record",
+            (sid, position, _name_key(record), _encode(record)),
+        )
+
+    def upsert(self, record: StudentRecord) -> None:
+        """Crea o sustituye un alumno (uno nuevo va al final de la lista)."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._put(conn, record, None)
+            self._write(conn)
+
+    def delete(self, student_id: str | int) -> bool:
+        """Elimina un alumno. Devuelve False si no existía."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            deleted = conn.execute("DELETE FROM students WHERE id = ?", (str(student_id),)).rowcount
+            if deleted:
+                self._write(conn)
+        return bool(deleted)
+
+    def replace(self, records: list[StudentRecord]) -> int:
+        """
+        Deja en la base de datos exactamente `records` (en ese orden) en una
+        sola transacción, escribiendo solo las filas que cambian.
+        Devuelve el número de filas escritas o borradas.
+        """
+        conn = self._connect()
+        changed = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            current = {
+                sid: (position, record)
+                for sid, position, record in conn.execute("SELECT id, position, record FROM students")
+            }
+            wanted: set[str] = set()
+            for position, record in enumerate(records):
+                sid = str(record.get("id"))
+                wanted.add(sid)
+                if current.get(sid) != (position, _encode(record)):
+                    self._put(conn, record, position)
+                    changed += 1
+            for sid in current.keys() - wanted:
+                conn.execute("DELETE FROM students WHERE id = ?", (sid,))
+                changed += 1
+            conn.execute("UPDATE meta SET value = 1 WHERE key = 'initialized'")
+            if changed:
+                self._write(conn)
+        return changed
+
+
+_STORES: dict[str, SqliteStudentStore] = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_store(path: str) -> SqliteStudentStore:
+    """Almacén (compartido por el proceso) de la base de datos `path`."""
+    with _STORES_LOCK:
+        store = _STORES.get(path)
+        if store is None:
+            store = _STORES[path] = SqliteStudentStore(path)
+        return store
@@ -0,0 +1,8 @@
+# Punto de entrada WSGI para producción: gunicorn -c src/gunicorn.conf.py wsgi:app
+# (el servidor de desarrollo de Flask sigue disponible con `python src/app.py`).
+from app import create_app
+import metrics
+
+app = create_app()
+# /metrics agrega lo que publica cada worker (ver metrics.py)
+metrics.start_publisher()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import IO, Any
+
+import yaml
+
+import config
+import metrics
+import profiling
+
+# PyYAML solo expone CSafeLoader/CSafeDumper si se compiló contra libyaml.
+HAS_LIBYAML: bool = bool(getattr(yaml, "__with_libyaml__", False)) and hasattr(yaml, "CSafeLoader")
+
+_PURE_LOADER: Any = yaml.SafeLoader
+_PURE_DUMPER: Any = yaml.SafeDumper
+_FAST_LOADER: Any = getattr(yaml, "CSafeLoader", _PURE_LOADER)
+_FAST_DUMPER: Any = getattr(yaml, "CSafeDumper", _PURE_DUMPER)
+
+# Opciones con las que se escriben alumnos.yaml y el resto de ficheros del repo.
+# No cambiarlas sin motivo: ArgoCD y los diffs de Git dependen de este formato.
+ROSTER_DUMP_OPTIONS: dict[str, Any] = {
+    "allow_unicode": True,
+    "default_flow_style": False,
+    "sort_keys": False,
+}
+
+
+def use_libyaml(accelerated: bool | None = None) -> bool:
+    """Decide si se usa el parser en C (si está disponible) para leer."""
+    if accelerated is None:
+        accelerated = config.YAML_USE_LIBYAML
+    return accelerated and HAS_LIBYAML
+
+
+def _stream_size(stream: Any) -> int | None:
+    """Tamaño del documento: longitud del texto o tamaño del fichero abierto."""
+    if isinstance(stream, (str, bytes)):
+        return len(stream)
+    try:
+        return os.fstat(stream.fileno()).st_size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def safe_load(stream: str | bytes | IO[Any], accelerated: bool | None = None) -> Any:
+    """Equivalente a yaml.safe_load usando CSafeLoader cuando es posible."""
+    loader = _FAST_LOADER if use_libyaml(accelerated) else _PURE_LOADER
+    start = time.perf_counter()
+    try:
+        return yaml.load(stream, Loader=loader)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.YAML_SECONDS.observe(elapsed, op="load")
+        profiling.record("yaml_load", elapsed)
+        size = _stream_size(stream)
+        if size is not None:
+            metrics.YAML_BYTES.observe(size, op="load")
+
+
+def safe_dump(data: Any, stream: IO[Any] | None = None, accelerated: bool = False, **kwargs: Any) -> Any:
+    """
+    Equivalente a yaml.safe_dump. Escribe siempre con SafeDumper salvo que se
+    pida CSafeDumper explícitamente (accelerated=True, p. ej. en benchmarks):
+    el emisor en C no produce los mismos bytes (escapa los caracteres fuera
+    del BMP como "\\U0001F600" y algunos saltos de línea Unicode), y los
+    ficheros del repositorio no deben cambiar según dónde se escribieron.
+    """
+    dumper = _FAST_DUMPER if accelerated and HAS_LIBYAML else _PURE_DUMPER
+    try:
+        position = stream.tell() if stream is not None else 0
+    except (AttributeError, OSError, ValueError):
+        position = None
+    start = time.perf_counter()
+    result = yaml.dump(data, stream, Dumper=dumper, **kwargs)
+    elapsed = time.perf_counter() - start
+    metrics.YAML_SECONDS.observe(elapsed, op="dump")
+    profiling.record("yaml_dump", elapsed)
+    if stream is None:
+        metrics.YAML_BYTES.observe(len(result), op="dump")
+    elif position is not None:
+        try:
+            metrics.YAML_BYTES.observe(stream.tell() - position, op="dump")  # type: ignore[union-attr]
+        except (OSError, ValueError):
+            pass
+    return result
+
+
+def dump_roster(data: Any, stream: IO[Any] | None = None, accelerated: bool = False) -> Any:
+    """Vuelca datos con el formato canónico de los ficheros del repositorio."""
+    return safe_dump(data, stream, accelerated=accelerated, **ROSTER_DUMP_OPTIONS)
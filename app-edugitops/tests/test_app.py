@@ -1,28 +1,73 @@
 from __future__ import annotations
 
 from collections.abc import Generator
+from contextlib import contextmanager
 from typing import Any
 
 import pytest
+import hashlib
+import hmac
+import io
+import json
+import posixpath
+import runpy
+import subprocess
 import sys
 import os
+import threading
+import time
 from unittest.mock import patch, mock_open, MagicMock
 from flask.testing import FlaskClient
 
 # Ajustamos el path para poder importar los módulos desde el directorio padre
 root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.join(root_dir, 'src'))
+sys.path.append(os.path.join(root_dir, 'benchmarks'))
 
 from app import create_app
 import data_manager 
+import checkmk_client
+import checkmk_rules
+import gitea_client
+import health_probe
+import jobs
+import k8s_cache
+import metrics
+import monitoring
+import profiling
+import shared_state
+import student_store
+import student_repository
+import yaml_io
 import config # Importamos config para poder mockear la versión
+from checkmk_stub import CheckmkStub
 
 # --- Fixture Global ---
+@pytest.fixture(autouse=True)
+def shared_state_db(tmp_path: Any) -> Generator[str, None, None]:
+    """Cada test usa su propia base de datos de estado compartido (y ficheros de bloqueo)."""
+    path = str(tmp_path / 'state.sqlite')
+    with patch('config.SHARED_STATE_DB', path):
+        yield path
+
+# Backends de alumnos: los tests de la capa de datos que usan ficheros reales
+# (sync_files, bulk_alumnos_file) se ejecutan con cada uno
+STUDENT_BACKENDS = ['yaml', 'sqlite']
+
+@contextmanager
+def _student_backend(backend: str, tmp_path: Any) -> Generator[str, None, None]:
+    with patch('config.ALUMNOS_BACKEND', backend), \
+         patch('config.ALUMNOS_DB', os.path.join(str(tmp_path), 'alumnos.sqlite')):
+        yield backend
+    data_manager._forget_store_view()
+
 @pytest.fixture
 def client() -> Generator[FlaskClient, None, None]:
     """Configura un cliente de pruebas de Flask usando la factoría create_app."""
     flask_app = create_app()
     flask_app.config["TESTING"] = True
+    # La sincronización inicial (una por proceso) no debe competir con los mocks de los tests
+    data_manager.wait_initial_sync(30)
     with flask_app.test_client() as test_client:
         yield test_client
 
@@ -93,7 +138,7 @@ def test_next_id_logic(mock_load_alumnos: Any) -> None:
 @patch('data_manager.load_alumnos')
 @patch('data_manager.load_catalogo')
 @patch('builtins.open', new_callable=mock_open)
-@patch('yaml.safe_dump')
+@patch('yaml_io.dump_roster')
 @patch('os.path.exists', return_value=True)
 def test_save_creates_new_student(
     mock_exists: Any, mock_dump: Any, mock_file: Any, mock_catalogo: Any, mock_alumnos: Any
@@ -130,7 +175,7 @@ def test_save_duplicate_name_error(
 @patch('data_manager.load_alumnos')
 @patch('data_manager.load_catalogo')
 @patch('builtins.open', new_callable=mock_open)
-@patch('yaml.safe_dump')
+@patch('yaml_io.dump_roster')
 @patch('os.path.exists', return_value=True)
 def test_data_manager_url_generation(
     mock_exists: Any, mock_dump: Any, mock_file: Any, mock_catalogo: Any, mock_alumnos: Any
@@ -154,7 +199,7 @@ def test_data_manager_url_generation(
 
 @patch('data_manager.load_alumnos')
 @patch('builtins.open', new_callable=mock_open)
-@patch('yaml.safe_dump')
+@patch('yaml_io.dump_roster')
 @patch('os.path.exists', return_value=True)
 def test_delete_student_logic(
     mock_exists: Any, mock_dump: Any, mock_file: Any, mock_load: Any
@@ -212,7 +257,7 @@ def test_validate_raw_yaml_success(mock_catalogo: Any) -> None:
   check-http:
   - http://app1-service.user1.svc.cluster.local:80
     """
-    with patch('builtins.open', mock_open()), patch('yaml.safe_dump'):
+    with patch('builtins.open', mock_open()), patch('yaml_io.dump_roster'):
         success, msg = data_manager.validate_and_save_raw_yaml(raw_valid)
     assert success is True
 
@@ -263,74 +308,154 @@ def test_validate_raw_yaml_bad_url(mock_catalogo: Any) -> None:
 # ====================================================================
 
 @patch('subprocess.run') # IMPORTANTE: Mockeamos la ejecución del script de monitorización
-@patch('data_manager.get_raw_alumnos_yaml')
-@patch('requests.put')
-@patch('requests.get')
-def test_push_gitea_success(mock_get: Any, mock_put: Any, mock_read_file: Any, mock_subprocess: Any) -> None:
-    """Verifica el flujo correcto de Push (GET SHA -> PUT Content -> Subprocess)."""
-    
-    # 1. Simular lectura de fichero local
-    mock_read_file.return_value = "- nombre: test"
-
-    # 2. Simular respuesta GET (Obtener SHA existente)
-    mock_response_get = MagicMock()
-    mock_response_get.status_code = 200
-    mock_response_get.json.return_value = {'sha': 'dummy_sha_123'}
-    mock_get.return_value = mock_response_get
-
-    # 3. Simular respuesta PUT (Subida exitosa)
-    mock_response_put = MagicMock()
-    mock_response_put.status_code = 200
-    mock_put.return_value = mock_response_put
-
-    # 4. Simular ejecución correcta del script de monitorización
-    mock_proc_result = MagicMock()
-    mock_proc_result.returncode = 0
-    mock_proc_result.stdout = "Script OK"
-    mock_subprocess.return_value = mock_proc_result
+@patch('requests.Session.request')
+def test_push_gitea_success(mock_request: Any, mock_subprocess: Any, sync_files: tuple[str, str]) -> None:
+    """Verifica el flujo correcto de Push (listado de SHA -> un commit multi-fichero)."""
+    import json
+    alumnos_file, catalogo_file = sync_files
+    # alumnos.yaml se sincronizó (sha 'dummy_sha_123') y después cambió en local
+    with open(data_manager.GITEA_SYNC_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump({'edugitops/alumnos.yaml': {'sha': 'dummy_sha_123'}}, f)
+
+    # 1. Simular Gitea: el catálogo (sin SHA recordado) coincide con el remoto
+    listing = MagicMock(status_code=200)
+    listing.json.return_value = [
+        {'type': 'file', 'path': 'edugitops/alumnos.yaml', 'sha': 'dummy_sha_123'},
+        {'type': 'file', 'path': 'edugitops/catalogo-servicios.yaml',
+         'sha': data_manager.git_blob_sha(_read_text(catalogo_file).encode('utf-8'))},
+    ]
+    local_sha = data_manager.git_blob_sha(_read_text(alumnos_file).encode('utf-8'))
+    commit = MagicMock(status_code=201)
+    commit.json.return_value = {'files': [{'path': 'edugitops/alumnos.yaml', 'sha': local_sha}]}
+    mock_request.side_effect = [listing, commit]
+
+    # 2. Simular ejecución correcta del script de monitorización
+    mock_subprocess.return_value = MagicMock(returncode=0, stdout="Script OK")
 
     # Ejecutar función
-    success, msg = data_manager.push_alumnos_to_gitea()
+    success, msg, _ = data_manager.push_alumnos_to_gitea()
 
     assert success is True
     assert "éxito" in msg
 
-    # Verificar llamadas
-    mock_get.assert_called_once()
-    mock_put.assert_called_once()
-    mock_subprocess.assert_called_once() # Verificar que se intentó llamar al script
+    # Verificar llamadas: un listado y un único commit
+    assert [c.args[0] for c in mock_request.call_args_list] == ['GET', 'POST']
+    mock_subprocess.assert_not_called() # La monitorización ya no bloquea el push (se encola)
     
-    # Verificar payload del PUT
-    args, kwargs = mock_put.call_args
+    # Verificar payload del POST: solo viaja el fichero que cambió
+    args, kwargs = mock_request.call_args
     payload = kwargs['json']
-    assert payload['sha'] == 'dummy_sha_123'
-    assert 'content' in payload
+    assert [f['path'] for f in payload['files']] == ['edugitops/alumnos.yaml']
+    assert payload['files'][0]['operation'] == 'update'
+    assert payload['files'][0]['sha'] == 'dummy_sha_123'
+    assert 'content' in payload['files'][0]
+
+    # Un segundo push sin cambios no necesita ninguna petición a Gitea
+    mock_request.reset_mock()
+    success, msg, _ = data_manager.push_alumnos_to_gitea()
+    assert success is True
+    assert "Sin cambios" in msg
+    mock_request.assert_not_called()
+
+@patch('requests.Session.request')
+def test_push_gitea_conflict_is_not_overwritten(mock_request: Any, sync_files: tuple[str, str]) -> None:
+    """Si el remoto cambió entre la sincronización y el push, se informa del conflicto sin reintentar."""
+    alumnos_file, catalogo_file = sync_files
+    remote = {'edugitops/alumnos.yaml': _read_text(alumnos_file), 'edugitops/catalogo-servicios.yaml': _read_text(catalogo_file)}
+    mock_request.side_effect = _fake_gitea({path: data_manager.git_blob_sha(text.encode('utf-8')) for path, text in remote.items()}, remote)
+    data_manager.sync_from_gitea()
+    synced_sha = data_manager.git_blob_sha(remote['edugitops/alumnos.yaml'].encode('utf-8'))
+
+    # Cambio local; mientras, alguien edita alumnos.yaml y el catálogo en Gitea
+    data_manager.save_alumno_changes('002', 'u2', [])
+    mock_request.reset_mock()
+    mock_request.side_effect = [MagicMock(status_code=409, text="sha mismatch")]
+
+    success, msg, _ = data_manager.push_alumnos_to_gitea()
 
+    assert success is False
+    assert "Conflicto" in msg and 'edugitops/alumnos.yaml' in msg
+    # Un único POST con el SHA sincronizado como base y sin el catálogo (no cambió en local)
+    assert [c.args[0] for c in mock_request.call_args_list] == ['POST']
+    files = mock_request.call_args.kwargs['json']['files']
+    assert [(f['path'], f['operation'], f['sha']) for f in files] == [('edugitops/alumnos.yaml', 'update', synced_sha)]
+
+@patch('requests.Session.request')
+def test_push_gitea_without_base_sha_does_not_revert_remote(mock_request: Any, sync_files: tuple[str, str]) -> None:
+    """Sin SHA recordado, un fichero que difiere del remoto no se sube (podría ser una versión vieja)."""
+    listing = MagicMock(status_code=200)
+    listing.json.return_value = [
+        {'type': 'file', 'path': 'edugitops/alumnos.yaml', 'sha': 'editado-en-gitea'},
+        {'type': 'file', 'path': 'edugitops/catalogo-servicios.yaml', 'sha': 'editado-en-gitea'},
+    ]
+    mock_request.side_effect = [listing]
+
+    success, msg, _ = data_manager.push_alumnos_to_gitea()
+
+    assert success is False
+    assert "Conflicto" in msg and 'edugitops/catalogo-servicios.yaml' in msg
+    assert [c.args[0] for c in mock_request.call_args_list] == ['GET']
+
+@patch('data_manager.GITEA_SYNC_STATE_FILE', '/nonexistent/state.json')
 @patch('data_manager.get_raw_alumnos_yaml')
-@patch('requests.get')
-def test_push_gitea_connection_error(mock_get: Any, mock_read_file: Any) -> None:
+@patch('requests.Session.request')
+def test_push_gitea_connection_error(mock_request: Any, mock_read_file: Any) -> None:
     """Verifica el manejo de errores de conexión."""
     import requests
     mock_read_file.return_value = "content"
     
     # Simular excepción de conexión
-    mock_get.side_effect = requests.exceptions.ConnectionError("Gitea down")
+    mock_request.side_effect = requests.exceptions.ConnectionError("Gitea down")
 
-    success, msg = data_manager.push_alumnos_to_gitea()
+    success, msg, _ = data_manager.push_alumnos_to_gitea()
 
     assert success is False
     assert "Error de conexión" in msg
 
+@patch('config.JOBS_COALESCE_WINDOW', 0)
+@patch('monitoring.run_monitoring')
 @patch('data_manager.push_alumnos_to_gitea')
-def test_git_push_route(mock_push: Any, client: FlaskClient) -> None:
-    """Verifica que la ruta responde correctamente."""
-    mock_push.return_value = (True, "Push OK")
+def test_git_push_route(mock_push: Any, mock_monitoring: Any, client: FlaskClient) -> None:
+    """Verifica que la ruta responde sin esperar a la monitorización, que queda encolada."""
+    mock_push.return_value = (True, "Push OK", ['alumnos.yaml'])
+
+    def fake_monitoring(students: Any, catalog: Any, log: Any) -> dict[str, Any]:
+        log("📊 Resumen: 3 reglas HTTP, 1 reglas TCP creadas.")
+        return {'http_rules': 3, 'tcp_rules': 1}
+    mock_monitoring.side_effect = fake_monitoring
     
     response = client.post('/git_push', json={})
     
     assert response.status_code == 200
     assert response.json['success'] is True
 
+    # La tarea de monitorización se consulta en /jobs/<id>
+    job_id = response.json['job_id']
+    assert response.json['job_url'] == f'/jobs/{job_id}'
+    assert jobs.get_job(job_id).wait(5)
+    status = client.get(f'/jobs/{job_id}').json
+    assert status['kind'] == 'monitoring'
+    assert status['state'] == 'succeeded'
+    assert status['result'] == {'http_rules': 3, 'tcp_rules': 1}
+    assert "Resumen" in status['stdout']
+    assert status['duration'] is not None
+    mock_monitoring.assert_called_once()
+
+@patch('data_manager.schedule_monitoring')
+@patch('data_manager.push_alumnos_to_gitea', return_value=(True, "Sin cambios: Gitea ya tiene la versión local.", []))
+def test_git_push_without_changes_does_not_schedule_monitoring(mock_push: Any, mock_schedule: Any, client: FlaskClient) -> None:
+    """Un push sin nada que subir no regenera Checkmk (ni devuelve tarea)."""
+    response = client.post('/git_push', json={})
+
+    assert response.status_code == 200
+    assert response.json['success'] is True
+    assert 'job_id' not in response.json
+    mock_schedule.assert_not_called()
+
+def test_job_status_not_found(client: FlaskClient) -> None:
+    """Una tarea desconocida devuelve 404."""
+    assert client.get('/jobs/no-existe').status_code == 404
+
 # ====================================================================
 # BLOQUE 6: Tests de Información del Sistema (NUEVO)
 # ====================================================================
@@ -360,4 +485,1841 @@ def test_info_route_masks_secrets(client: FlaskClient) -> None:
     assert 'super_secret_password' not in html
     
     # 3. Pero sí debe aparecer ofuscada (primeros 3 chars 'sup' + asteriscos)
-    assert 'sup********' in html
\ No newline at end of file
+    assert 'sup********' in html
+
+# ====================================================================
+# BLOQUE 7: Tests de Caché de YAML
+# ====================================================================
+
+def _write_alumnos_file(path: Any, content: str) -> str:
+    filepath = os.path.join(str(path), "alumnos.yaml")
+    with open(filepath, "w", encoding="utf-8") as f:
+        f.write(content)
+    return filepath
+
+def test_load_yaml_cache_hit(tmp_path: Any) -> None:
+    """La segunda lectura de un fichero sin cambios no debe volver a parsearlo."""
+    filepath = _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n")
+    before = data_manager.get_cache_stats()
+
+    with patch('yaml_io.safe_load', wraps=data_manager.yaml_io.safe_load) as spy_load:
+        first = data_manager._load_yaml(filepath)
+        second = data_manager._load_yaml(filepath)
+
+    after = data_manager.get_cache_stats()
+    assert first == second == [{'nombre': 'u1', 'id': '001'}]
+    assert spy_load.call_count == 1
+    assert after['misses'] - before['misses'] == 1
+    assert after['hits'] - before['hits'] == 1
+
+def test_load_yaml_cache_detects_external_change(tmp_path: Any) -> None:
+    """Si el fichero cambia en disco (tamaño/mtime), se debe volver a parsear."""
+    filepath = _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n")
+    assert len(data_manager._load_yaml(filepath)) == 1
+
+    _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n- nombre: u2\n  id: '002'\n")
+    assert len(data_manager._load_yaml(filepath)) == 2
+
+def test_load_yaml_missing_file_does_not_bump_generation(tmp_path: Any) -> None:
+    """Leer un fichero que no existe no escribe en el estado compartido; solo suelta lo cacheado."""
+    filepath = _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n")
+    with patch('data_manager.ALUMNOS_FILE', filepath):
+        assert len(data_manager._load_yaml(filepath)) == 1
+        os.remove(filepath)
+        with patch('shared_state.bump_generation') as spy_bump:
+            assert data_manager._load_yaml(filepath) == []
+            assert data_manager._load_yaml(filepath) == []
+            assert data_manager.load_alumnos() == []
+        spy_bump.assert_not_called()
+        assert filepath not in data_manager._YAML_CACHE
+
+@patch('data_manager.load_catalogo', return_value=[])
+def test_save_refreshes_cache(mock_catalogo: Any, tmp_path: Any) -> None:
+    """Guardar un alumno debe dejar en caché lo escrito (sin volver a parsear)."""
+    filepath = _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n")
+    with patch('data_manager.ALUMNOS_FILE', filepath):
+        assert len(data_manager.load_alumnos()) == 1
+        success, _ = data_manager.save_alumno_changes('002', 'u2', [])
+        assert success is True
+
+        with patch('yaml_io.safe_load') as spy_load:
+            alumnos = data_manager.load_alumnos()
+        spy_load.assert_not_called()
+        assert [a['id'] for a in alumnos] == ['001', '002']
+
+    # Y lo cacheado coincide con lo que hay realmente en disco
+    data_manager._invalidate_cache(filepath)
+    assert [a['id'] for a in data_manager._load_yaml(filepath)] == ['001', '002']
+
+# ====================================================================
+# BLOQUE 8: Tests del Repositorio Indexado de Alumnos
+# ====================================================================
+
+def test_repository_lookup_and_uniqueness() -> None:
+    """Búsqueda por ID y unicidad de nombre sin distinguir mayúsculas."""
+    from student_repository import StudentRepository
+    repo = StudentRepository([{'id': '001', 'nombre': 'Juan'}, {'id': '002', 'nombre': 'ana'}])
+
+    assert repo.get('002') == {'id': '002', 'nombre': 'ana'}
+    assert repo.get(1) is None
+    assert repo.is_name_taken(' JUAN ', '002') is True
+    assert repo.is_name_taken('juan', '001') is False
+
+    # Renombrar libera el nombre anterior
+    repo.upsert({'id': '001', 'nombre': 'pedro'})
+    assert repo.is_name_taken('juan', '002') is False
+    assert repo.name_owner('Pedro') == '001'
+
+def test_repository_next_id_after_delete() -> None:
+    """El siguiente ID se recalcula si se borra el ID más alto."""
+    from student_repository import StudentRepository
+    repo = StudentRepository([{'id': '001'}, {'id': '007'}, {'id': 'x'}])
+    assert repo.next_id() == "008"
+
+    assert repo.delete('007') is not None
+    assert repo.next_id() == "002"
+    assert repo.delete('007') is None
+    assert [a['id'] for a in repo.to_list()] == ['001', 'x']
+
+def test_repository_descending_deletes_keep_next_id_cheap() -> None:
+    """Borrar de mayor a menor no recorre todos los IDs en cada baja (montículo perezoso)."""
+    from student_repository import StudentRepository
+    repo = StudentRepository([{'id': str(i).zfill(3)} for i in range(1, 5001)] + [{'id': '7'}])
+    clone = repo.copy()
+
+    with patch('student_repository._numeric_id', wraps=student_repository._numeric_id) as spy:
+        for i in range(5000, 7, -1):
+            repo.delete(str(i).zfill(3))
+            assert repo.next_id() == str(i).zfill(3)
+    assert spy.call_count < 10000
+
+    # '7' y '007' valen lo mismo: el máximo sigue siendo 7 hasta borrar ambos
+    for sid in ('007', '7'):
+        assert repo.next_id() == "008"
+        repo.delete(sid)
+    assert repo.next_id() == "007"
+    repo.upsert({'id': '042'})
+    assert repo.next_id() == "043"
+    # La copia tiene su propio montículo
+    assert clone.next_id() == "5001"
+
+@patch('data_manager.load_alumnos')
+def test_repository_reused_while_data_unchanged(mock_load: Any) -> None:
+    """El repositorio solo se reconstruye si cambia la lista de alumnos."""
+    mock_load.return_value = [{'id': '001', 'nombre': 'a'}]
+    first = data_manager.get_student_repository()
+    assert data_manager.get_student_repository() is first
+
+    mock_load.return_value = [{'id': '001', 'nombre': 'a'}]
+    assert data_manager.get_student_repository() is not first
+
+def test_saves_update_published_repository_in_place(tmp_path: Any) -> None:
+    """Guardar y borrar cambian el repositorio cacheado en el sitio, sustituyendo registros."""
+    from student_repository import StudentRepository
+    alumnos_file = _write_alumnos_file(tmp_path, "".join(
+        f"- nombre: alu{i}\n  id: '{i:03d}'\n  apps: []\n  check-http: []\n" for i in range(1, 2001)
+    ))
+    with patch('data_manager.ALUMNOS_FILE', alumnos_file), \
+         patch('data_manager.load_catalogo', return_value=[{'id': 'app1', 'port': 80}]):
+        published = data_manager.get_student_repository()
+        before = published.get('001')
+        # Ni se copia el repositorio ni se reconstruye a partir de la lista
+        with patch.object(StudentRepository, '__init__', autospec=True,
+                          side_effect=StudentRepository.__init__) as spy_init, \
+             patch.object(StudentRepository, 'copy', autospec=True,
+                          side_effect=StudentRepository.copy) as spy_copy:
+            assert data_manager.save_alumno_changes('001', 'renombrado', ['app1'])[0] is True
+            assert data_manager.delete_student('002')[0] is True
+        assert spy_init.call_count == 0 and spy_copy.call_count == 0
+        assert data_manager.get_student_repository() is published
+        # Quien ya tenía el registro anterior no lo ve cambiar
+        assert before['nombre'] == 'alu1'
+        assert published.get('001')['nombre'] == 'renombrado'
+        assert '002' not in published and len(published) == 1999
+
+        # Búsquedas concurrentes con escrituras: sin errores de iteración
+        errors: list[BaseException] = []
+        def reader() -> None:
+            try:
+                for _ in range(20):
+                    data_manager.search_students('alu')
+                    data_manager.get_student_repository().to_list()
+            except BaseException as exc:
+                errors.append(exc)
+        readers = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in readers:
+            thread.start()
+        for i in range(3000, 3020):
+            data_manager.save_alumno_changes(str(i), f'alu{i}', [])
+            data_manager.delete_student(str(i))
+        for thread in readers:
+            thread.join()
+        assert errors == []
+    data_manager._invalidate_cache(alumnos_file)
+
+# ====================================================================
+# BLOQUE 9: Tests de la Capa de Serialización YAML
+# ====================================================================
+
+ROSTER_SAMPLE = [
+    {'nombre': 'alumno-josé', 'id': '001', 'apps': ['grafana'],
+     'check-http': ['http://grafana-service.alumno-josé.svc.cluster.local:3000']},
+    {'nombre': 'alumno-ñu', 'id': '002', 'apps': [], 'check-http': []},
+]
+
+@pytest.mark.skipif(not yaml_io.HAS_LIBYAML, reason="PyYAML sin soporte libyaml")
+def test_yaml_io_libyaml_output_identical() -> None:
+    """El volcado con libyaml debe ser idéntico byte a byte al puro en Python."""
+    fast = yaml_io.dump_roster(ROSTER_SAMPLE, accelerated=True)
+    pure = yaml_io.dump_roster(ROSTER_SAMPLE, accelerated=False)
+    assert fast == pure
+    assert yaml_io.safe_load(fast, accelerated=True) == ROSTER_SAMPLE
+
+def test_yaml_io_falls_back_without_libyaml() -> None:
+    """Sin libyaml debe usar SafeLoader/SafeDumper y producir el formato canónico."""
+    with patch('yaml_io.HAS_LIBYAML', False), patch('yaml.load', wraps=yaml_io.yaml.load) as spy_load:
+        assert yaml_io.use_libyaml(True) is False
+        text = yaml_io.dump_roster(ROSTER_SAMPLE)
+        assert yaml_io.safe_load(text) == ROSTER_SAMPLE
+
+    assert spy_load.call_args.kwargs['Loader'] is yaml_io.yaml.SafeLoader
+    assert text.startswith("- nombre: alumno-josé\n  id: '001'\n")
+
+def test_yaml_io_dump_is_canonical_with_libyaml_enabled() -> None:
+    """Con libyaml activado solo se acelera la lectura: la escritura es la pura (sin escapes \\U)."""
+    data = [{'nombre': 'Ana 😀', 'id': '001'}]
+    with patch('config.YAML_USE_LIBYAML', True), patch('yaml.dump', wraps=yaml_io.yaml.dump) as spy_dump:
+        text = yaml_io.dump_roster(data)
+        assert yaml_io.safe_load(text) == data
+        nel = yaml_io.dump_roster({'nota': 'x\x85y'})
+
+    assert spy_dump.call_args.kwargs['Dumper'] is yaml_io.yaml.SafeDumper
+    assert text == "- nombre: Ana 😀\n  id: '001'\n"
+    assert nel == yaml_io.yaml.safe_dump({'nota': 'x\x85y'}, **yaml_io.ROSTER_DUMP_OPTIONS)
+
+# ====================================================================
+# BLOQUE 10: Tests del Diario de Cambios de Alumnos
+# ====================================================================
+
+@pytest.fixture
+def journal_files(tmp_path: Any) -> Generator[tuple[str, str], None, None]:
+    """alumnos.yaml temporal con el modo diario activado."""
+    alumnos_file = _write_alumnos_file(tmp_path, "- nombre: u1\n  id: '001'\n  apps: []\n  check-http: []\n")
+    journal_file = os.path.join(str(tmp_path), "alumnos.journal")
+    with patch('data_manager.ALUMNOS_FILE', alumnos_file), \
+         patch('data_manager.ALUMNOS_JOURNAL_FILE', journal_file), \
+         patch('config.ALUMNOS_JOURNAL_ENABLED', True), \
+         patch('data_manager.load_catalogo', return_value=[{'id': 'app1', 'port': 80}]):
+        yield alumnos_file, journal_file
+    data_manager._invalidate_cache(alumnos_file)
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def test_journal_save_appends_without_rewriting(journal_files: tuple[str, str]) -> None:
+    """En modo diario, guardar/borrar no reescribe alumnos.yaml pero las lecturas lo ven."""
+    alumnos_file, journal_file = journal_files
+    original = _read_text(alumnos_file)
+
+    assert data_manager.save_alumno_changes('002', 'u2', ['app1'])[0] is True
+    assert data_manager.save_alumno_changes('001', 'u1-bis', [])[0] is True
+    assert data_manager.delete_student('002')[0] is True
+
+    assert _read_text(alumnos_file) == original
+    assert len(_read_text(journal_file).splitlines()) == 3
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['u1-bis']
+
+    # Otro proceso (caché vacía) reconstruye lo mismo a partir del diario
+    data_manager._invalidate_cache(alumnos_file)
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['u1-bis']
+
+def test_journal_compacts_on_threshold(journal_files: tuple[str, str]) -> None:
+    """Al llegar al umbral se vuelca todo a alumnos.yaml y se borra el diario."""
+    alumnos_file, journal_file = journal_files
+    with patch('config.ALUMNOS_JOURNAL_COMPACT_EVERY', 2):
+        data_manager.save_alumno_changes('002', 'u2', ['app1'])
+        assert os.path.exists(journal_file)
+        data_manager.save_alumno_changes('003', 'u3', [])
+
+    assert not os.path.exists(journal_file)
+    expected = yaml_io.dump_roster([
+        {'nombre': 'u1', 'id': '001', 'apps': [], 'check-http': []},
+        {'nombre': 'u2', 'id': '002', 'apps': ['app1'],
+         'check-http': ['http://app1-service.u2.svc.cluster.local:80']},
+        {'nombre': 'u3', 'id': '003', 'apps': [], 'check-http': []},
+    ])
+    assert _read_text(alumnos_file) == expected
+
+def test_journal_save_cost_does_not_grow_with_roster(tmp_path: Any) -> None:
+    """En modo diario un guardado no copia, recorre ni vuelca el roster (coste constante)."""
+    from student_repository import StudentRepository
+    alumnos_file = _write_alumnos_file(tmp_path, "".join(
+        f"- nombre: alu{i}\n  id: '{i:03d}'\n  apps: []\n  check-http: []\n" for i in range(1, 5001)
+    ))
+    journal_file = os.path.join(str(tmp_path), "alumnos.journal")
+    with patch('data_manager.ALUMNOS_FILE', alumnos_file), \
+         patch('data_manager.ALUMNOS_JOURNAL_FILE', journal_file), \
+         patch('config.ALUMNOS_JOURNAL_ENABLED', True), \
+         patch('config.ALUMNOS_JOURNAL_COMPACT_EVERY', 1000), \
+         patch('data_manager.load_catalogo', return_value=[{'id': 'app1', 'port': 80}]):
+        data_manager.save_alumno_changes('001', 'primero', [])  # Carga el roster y crea el diario
+
+        with patch.object(StudentRepository, '__init__', autospec=True,
+                          side_effect=StudentRepository.__init__) as spy_init, \
+             patch.object(StudentRepository, 'to_list', autospec=True,
+                          side_effect=StudentRepository.to_list) as spy_list, \
+             patch.object(StudentRepository, 'copy', autospec=True,
+                          side_effect=StudentRepository.copy) as spy_copy, \
+             patch('data_manager._parse_yaml_file', wraps=data_manager._parse_yaml_file) as spy_parse, \
+             patch('yaml_io.dump_roster', wraps=yaml_io.dump_roster) as spy_dump:
+            for i in range(5001, 5051):
+                assert data_manager.save_alumno_changes(str(i), f'alu{i}', ['app1'])[0] is True
+                assert data_manager.save_alumno_changes(str(i), f'otro{i}', [])[0] is True
+                assert data_manager.delete_student(str(i - 5000).zfill(3))[0] is True
+        for spy in (spy_init, spy_list, spy_copy, spy_parse, spy_dump):
+            assert spy.call_count == 0
+
+        alumnos = data_manager.load_alumnos()
+        assert len(alumnos) == 5000
+        assert alumnos[-1]['nombre'] == 'otro5050'
+        assert data_manager.get_student('5001')['apps'] == []
+    data_manager._invalidate_cache(alumnos_file)
+
+@patch('requests.Session.request')
+def test_journal_compacted_before_push(mock_request: Any, journal_files: tuple[str, str], tmp_path: Any) -> None:
+    """El push siempre sube el alumnos.yaml canónico con los cambios del diario."""
+    import base64
+    alumnos_file, journal_file = journal_files
+    data_manager.save_alumno_changes('002', 'u2', [])
+
+    mock_request.side_effect = [MagicMock(status_code=404), MagicMock(status_code=500, text="boom")]
+    with patch('data_manager.GITEA_SYNC_STATE_FILE', os.path.join(str(tmp_path), "state.json")):
+        data_manager.push_alumnos_to_gitea()
+
+    assert not os.path.exists(journal_file)
+    files = {f['path']: f for f in mock_request.call_args.kwargs['json']['files']}
+    pushed = base64.b64decode(files[config.GITEA_FILE_PATH_REMOTE]['content']).decode('utf-8')
+    assert pushed == _read_text(alumnos_file)
+    assert "u2" in pushed
+
+# ====================================================================
+# BLOQUE 11: Tests de Operaciones Masivas
+# ====================================================================
+
+@pytest.fixture(params=STUDENT_BACKENDS)
+def bulk_alumnos_file(request: Any, tmp_path: Any) -> Generator[str, None, None]:
+    """alumnos.yaml temporal con dos alumnos y un catálogo con 'app1' (con cada backend)."""
+    alumnos_file = _write_alumnos_file(
+        tmp_path,
+        "- nombre: u1\n  id: '001'\n  apps: []\n  check-http: []\n"
+        "- nombre: u2\n  id: '002'\n  apps: []\n  check-http: []\n",
+    )
+    with patch('data_manager.ALUMNOS_FILE', alumnos_file), \
+         patch('data_manager.load_catalogo', return_value=[{'id': 'app1', 'port': 80}]), \
+         _student_backend(request.param, tmp_path):
+        yield alumnos_file
+    data_manager._invalidate_cache(alumnos_file)
+
+def test_bulk_operations_single_write(bulk_alumnos_file: str) -> None:
+    """Todas las operaciones válidas se aplican con una única escritura."""
+    operations = [
+        {'op': 'create', 'nombre': 'u3', 'apps': ['app1']},
+        {'op': 'update', 'id': '001', 'apps': ['app1']},
+        {'op': 'delete', 'id': '002'},
+    ]
+    sqlite = config.ALUMNOS_BACKEND == 'sqlite'
+    data_manager.load_alumnos()  # En modo SQLite, importa alumnos.yaml al almacén
+    version = student_store.get_store(config.ALUMNOS_DB).version() if sqlite else 0
+    with patch('yaml_io.dump_roster', wraps=yaml_io.dump_roster) as spy_dump:
+        success, msg, results = data_manager.apply_bulk_operations(operations)
+
+    assert success is True
+    # Una escritura: alumnos.yaml o una única transacción del almacén (que no toca el fichero)
+    assert spy_dump.call_count == (0 if sqlite else 1)
+    if sqlite:
+        assert student_store.get_store(config.ALUMNOS_DB).version() == version + 1
+    assert [r['id'] for r in results] == ['003', '001', '002']
+    alumnos = data_manager.load_alumnos()
+    assert [a['nombre'] for a in alumnos] == ['u1', 'u3']
+    assert alumnos[0]['check-http'] == ['http://app1-service.u1.svc.cluster.local:80']
+
+def test_bulk_operations_atomic_on_error(bulk_alumnos_file: str) -> None:
+    """Si una fila falla no se aplica ninguna y se informa fila a fila."""
+    original = _read_text(bulk_alumnos_file)
+    operations = [
+        {'op': 'create', 'nombre': 'nuevo'},
+        {'op': 'create', 'nombre': 'NUEVO'},
+        {'op': 'update', 'id': '001', 'apps': ['no-existe']},
+        {'op': 'delete', 'id': '999'},
+    ]
+    success, msg, results = data_manager.apply_bulk_operations(operations)
+
+    assert success is False
+    assert [r['success'] for r in results] == [True, False, False, False]
+    assert "ya está en uso" in results[1]['message']
+    assert "no existe en el catálogo" in results[2]['message']
+    assert _read_text(bulk_alumnos_file) == original
+
+def test_bulk_route_accepts_csv(bulk_alumnos_file: str, client: FlaskClient) -> None:
+    """La ruta /students/bulk acepta CSV con las apps separadas por ';'."""
+    csv_body = "op,id,nombre,apps\ncreate,010,u10,app1\nupdate,002,u2-bis,\n"
+    response = client.post('/students/bulk', data=csv_body, content_type='text/csv')
+
+    assert response.status_code == 200
+    assert response.json['success'] is True
+    assert data_manager.get_student_repository().get('010')['apps'] == ['app1']
+    assert data_manager.get_student_repository().get('002')['nombre'] == 'u2-bis'
+
+# ====================================================================
+# BLOQUE 12: Tests de Búsqueda y Paginación de Alumnos
+# ====================================================================
+
+def test_repository_search_prefix_and_substring() -> None:
+    """La búsqueda encuentra por nombre o ID, primero los que empiezan por la consulta."""
+    from student_repository import StudentRepository
+    repo = StudentRepository([
+        {'id': '001', 'nombre': 'alumno-juan'},
+        {'id': '002', 'nombre': 'Juana'},
+        {'id': '010', 'nombre': 'pepe'},
+    ])
+    assert [a['id'] for a in repo.search('JUAN')] == ['002', '001']
+    assert [a['id'] for a in repo.search('01')] == ['010', '001']
+    assert [a['id'] for a in repo.search('umno-ju')] == ['001']
+    assert repo.search('xyz') == []
+
+    # El índice se rehace tras un cambio
+    repo.upsert({'id': '010', 'nombre': 'juanjo'})
+    assert [a['id'] for a in repo.search('juan')] == ['002', '010', '001']
+
+@patch('data_manager.load_alumnos')
+def test_search_students_pagination(mock_alumnos: Any) -> None:
+    """search_students devuelve la página pedida y los totales."""
+    mock_alumnos.return_value = [{'id': str(i).zfill(3), 'nombre': f'alumno-{i}'} for i in range(1, 26)]
+
+    page = data_manager.search_students('', page=3, page_size=10)
+    assert [a['id'] for a in page['items']] == ['021', '022', '023', '024', '025']
+    assert (page['total'], page['pages'], page['page']) == (25, 3, 3)
+
+    # Una página fuera de rango se ajusta a la última
+    assert data_manager.search_students('alumno-1', page=9, page_size=5)['page'] == 3
+
+@patch('data_manager.load_catalogo', return_value=[])
+@patch('data_manager.load_alumnos')
+def test_index_renders_only_one_page(mock_alumnos: Any, mock_catalogo: Any, client: FlaskClient) -> None:
+    """La portada solo renderiza la página pedida del directorio."""
+    mock_alumnos.return_value = [{'id': str(i).zfill(3), 'nombre': f'alumno-{i}', 'apps': []} for i in range(1, 8)]
+
+    html = client.get('/?page=2&page_size=3').data.decode('utf-8')
+    assert 'alumno-4' in html and 'alumno-6' in html
+    assert 'alumno-3<' not in html and 'alumno-7' not in html
+    assert 'Cargar más' in html
+    # El enlace a la página siguiente conserva el tamaño de página
+    assert 'page=3&amp;page_size=3' in html
+
+@patch('data_manager.load_alumnos')
+def test_api_students_search(mock_alumnos: Any, client: FlaskClient) -> None:
+    """GET /api/students filtra por q y pagina en JSON."""
+    mock_alumnos.return_value = [{'id': '001', 'nombre': 'ana'}, {'id': '002', 'nombre': 'juan'}]
+
+    response = client.get('/api/students?q=jua')
+    assert response.status_code == 200
+    assert response.json['total'] == 1
+    assert response.json['items'][0]['nombre'] == 'juan'
+
+# ====================================================================
+# BLOQUE 13: Tests de la API JSON con ETag
+# ====================================================================
+
+def test_api_students_etag_roundtrip(bulk_alumnos_file: str, client: FlaskClient) -> None:
+    """La API devuelve ETag y responde 304 mientras el fichero no cambie."""
+    first = client.get('/api/students')
+    etag = first.headers['ETag']
+    assert first.status_code == 200 and etag
+
+    cached = client.get('/api/students', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+    # Otra página es otra representación: otro ETag
+    assert client.get('/api/students?page=2').headers['ETag'] != etag
+
+    data_manager.save_alumno_changes('003', 'u3', [])
+    changed = client.get('/api/students', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.json['total'] == 3
+
+def test_api_student_detail(bulk_alumnos_file: str, client: FlaskClient) -> None:
+    """GET /api/students/<id> devuelve el alumno o 404."""
+    response = client.get('/api/students/002')
+    assert response.status_code == 200
+    assert response.json['nombre'] == 'u2'
+    assert client.get('/api/students/002', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/students/999').status_code == 404
+
+def test_api_catalog_etag(tmp_path: Any, client: FlaskClient) -> None:
+    """El ETag del catálogo deriva del hash del contenido del fichero."""
+    catalog_file = os.path.join(str(tmp_path), "catalogo.yaml")
+    with open(catalog_file, "w", encoding="utf-8") as f:
+        f.write("- id: app1\n  port: 80\n")
+
+    with patch('data_manager.CATALOGO_FILE', catalog_file):
+        response = client.get('/api/catalog')
+        assert response.json == [{'id': 'app1', 'port': 80}]
+        etag = response.headers['ETag']
+        assert client.get('/api/catalog', headers={'If-None-Match': etag}).status_code == 304
+
+        with open(catalog_file, "w", encoding="utf-8") as f:
+            f.write("- id: app2\n  port: 8080\n")
+        assert client.get('/api/catalog', headers={'If-None-Match': etag}).status_code == 200
+
+# ====================================================================
+# BLOQUE 14: Tests de Sincronización Condicional con Gitea
+# ====================================================================
+
+@pytest.fixture(params=STUDENT_BACKENDS)
+def sync_files(request: Any, tmp_path: Any) -> Generator[tuple[str, str], None, None]:
+    """Ficheros locales temporales para sincronizar (alumnos y catálogo), con cada backend."""
+    alumnos_file = _write_alumnos_file(tmp_path, "- nombre: local\n  id: '001'\n")
+    catalogo_file = os.path.join(str(tmp_path), "catalogo.yaml")
+    with open(catalogo_file, "w", encoding="utf-8") as f:
+        f.write("- id: app1\n  port: 80\n")
+    with patch('data_manager.ALUMNOS_FILE', alumnos_file), \
+         patch('data_manager.CATALOGO_FILE', catalogo_file), \
+         patch('data_manager.GITEA_SYNC_STATE_FILE', os.path.join(str(tmp_path), "state.json")), \
+         patch('config.GITEA_FILE_PATH_REMOTE', 'edugitops/alumnos.yaml'), \
+         patch('config.GITEA_CATALOGO_PATH_REMOTE', 'edugitops/catalogo-servicios.yaml'), \
+         _student_backend(request.param, tmp_path):
+        yield alumnos_file, catalogo_file
+    data_manager._invalidate_cache(alumnos_file)
+    data_manager._invalidate_cache(catalogo_file)
+
+def _fake_gitea(listing: dict[str, str], contents: dict[str, str], broken: tuple[str, ...] = ()) -> Any:
+    """Simula la API de contenidos de Gitea: listado del directorio y descargas."""
+    import base64
+
+    def fake_request(method: str, url: str, **kwargs: Any) -> MagicMock:
+        path = url.split('/contents')[-1].lstrip('/')
+        if path in broken:
+            return MagicMock(status_code=500)
+        if path == 'edugitops':
+            entries = [{'type': 'file', 'path': p, 'sha': sha} for p, sha in listing.items()]
+            return MagicMock(status_code=200, json=MagicMock(return_value=entries))
+        text = contents[path]
+        payload = {'content': base64.b64encode(text.encode('utf-8')).decode('ascii'),
+                   'sha': data_manager.git_blob_sha(text.encode('utf-8'))}
+        return MagicMock(status_code=200, json=MagicMock(return_value=payload))
+    return fake_request
+
+def test_git_blob_sha_matches_git() -> None:
+    """El SHA calculado coincide con `git hash-object` (caso conocido)."""
+    assert data_manager.git_blob_sha(b"hello\n") == "ce013625030ba8dba906f756967f9e9ca394464a"
+
+@patch('requests.Session.request')
+def test_sync_skips_unchanged_files(mock_get: Any, sync_files: tuple[str, str]) -> None:
+    """Si el SHA remoto coincide con el local no se descarga ni se reescribe."""
+    alumnos_file, catalogo_file = sync_files
+    remote_catalog = "- id: app2\n  port: 8080\n"
+    mock_get.side_effect = _fake_gitea(
+        listing={
+            'edugitops/alumnos.yaml': data_manager.git_blob_sha(_read_text(alumnos_file).encode('utf-8')),
+            'edugitops/catalogo-servicios.yaml': data_manager.git_blob_sha(remote_catalog.encode('utf-8')),
+        },
+        contents={'edugitops/catalogo-servicios.yaml': remote_catalog},
+    )
+
+    report = data_manager.sync_from_gitea()
+
+    assert report == {'edugitops/alumnos.yaml': 'unchanged', 'edugitops/catalogo-servicios.yaml': 'updated'}
+    assert _read_text(catalogo_file) == remote_catalog
+    assert data_manager.GIT_SYNC_STATUS is True
+    # Listado del directorio + una sola descarga
+    assert mock_get.call_count == 2
+
+    # Segunda sincronización: nada cambió, solo el listado
+    mock_get.reset_mock()
+    assert set(data_manager.sync_from_gitea().values()) == {'unchanged'}
+    assert mock_get.call_count == 1
+
+@patch('requests.Session.request')
+def test_sync_reports_failed_files(mock_get: Any, sync_files: tuple[str, str]) -> None:
+    """Un fallo de descarga se informa por fichero y marca la sincro como fallida."""
+    alumnos_file, _ = sync_files
+    mock_get.side_effect = _fake_gitea(
+        listing={'edugitops/alumnos.yaml': 'otro-sha', 'edugitops/catalogo-servicios.yaml': 'otro-sha'},
+        contents={'edugitops/catalogo-servicios.yaml': "- id: app1\n  port: 80\n"},
+        broken=('edugitops/alumnos.yaml',),
+    )
+
+    report = data_manager.sync_from_gitea()
+
+    assert report['edugitops/alumnos.yaml'] == 'failed'
+    assert report['edugitops/catalogo-servicios.yaml'] == 'updated'
+    assert data_manager.sync_files_from_gitea() is False
+    assert "local" in _read_text(alumnos_file)
+
+# ====================================================================
+# BLOQUE 15: Tests del Cliente de Gitea
+# ====================================================================
+
+def _gitea_test_client(**kwargs: Any) -> gitea_client.GiteaClient:
+    return gitea_client.GiteaClient(
+        api_url="http://gitea.test/api/v1/", owner="o", repo="r", branch="main",
+        auth=("u", "p"), **kwargs,
+    )
+
+def test_gitea_client_session_configuration() -> None:
+    """Una sesión con pool del tamaño pedido y reintentos solo en métodos idempotentes."""
+    gitea = _gitea_test_client(pool_size=6, max_retries=2)
+    adapter = gitea.session.get_adapter("http://gitea.test")
+
+    assert gitea.session.auth == ("u", "p")
+    assert adapter._pool_maxsize == 6
+    assert adapter.max_retries.total == 2
+    assert 503 in adapter.max_retries.status_forcelist
+    assert adapter.max_retries.is_retry("GET", 503) is True
+    assert adapter.max_retries.is_retry("PUT", 503) is False
+
+@patch('requests.Session.request')
+def test_gitea_client_requests_and_stats(mock_request: Any) -> None:
+    """Construye las URLs de contenidos, aplica timeouts y registra latencias."""
+    gitea = _gitea_test_client(timeout=(1.0, 2.0))
+    mock_request.side_effect = [MagicMock(status_code=200), MagicMock(status_code=502), MagicMock(status_code=201)]
+
+    gitea.get_contents("edugitops/alumnos.yaml")
+    gitea.get_contents("")
+    gitea.put_contents("edugitops/alumnos.yaml", {"content": "x"})
+
+    first = mock_request.call_args_list[0]
+    assert first.args == ("GET", "http://gitea.test/api/v1/repos/o/r/contents/edugitops/alumnos.yaml")
+    assert first.kwargs["params"] == {"ref": "main"}
+    assert first.kwargs["timeout"] == (1.0, 2.0)
+    assert mock_request.call_args_list[1].args[1] == "http://gitea.test/api/v1/repos/o/r/contents"
+
+    stats = gitea.get_stats()
+    assert stats["get_contents"]["count"] == 2
+    assert stats["get_contents"]["errors"] == 1
+    assert stats["put_contents"]["count"] == 1
+
+@patch('requests.Session.request')
+def test_gitea_client_get_many_in_parallel(mock_request: Any) -> None:
+    """Las descargas múltiples devuelven respuesta o excepción por ruta, sin lanzar."""
+    import requests
+
+    def fake_request(method: str, url: str, **kwargs: Any) -> MagicMock:
+        if url.endswith("/b"):
+            raise requests.exceptions.ConnectionError("down")
+        return MagicMock(status_code=200, url=url)
+    mock_request.side_effect = fake_request
+
+    results = _gitea_test_client(pool_size=3).get_contents_many(["a", "b", "c"])
+
+    assert set(results) == {"a", "b", "c"}
+    assert results["a"].url.endswith("/contents/a")
+    assert isinstance(results["b"], requests.exceptions.ConnectionError)
+    assert results["c"].status_code == 200
+
+@patch('requests.Session.request')
+def test_sync_skips_downloads_when_gitea_unreachable(mock_request: Any, sync_files: tuple[str, str]) -> None:
+    """Si el listado falla por conexión no se intenta descargar cada fichero."""
+    import requests
+    mock_request.side_effect = requests.exceptions.ConnectionError("Gitea down")
+
+    report = data_manager.sync_from_gitea()
+
+    assert set(report.values()) == {'failed'}
+    assert mock_request.call_count == 1
+
+# ====================================================================
+# BLOQUE 16: Tests de la Cola de Tareas
+# ====================================================================
+
+def test_job_queue_runs_jobs_and_reports_state() -> None:
+    """Las tareas terminan en 'succeeded' o 'failed' con su salida y resultado."""
+    queue = jobs.JobQueue(max_workers=1)
+
+    def ok(job: jobs.Job) -> dict[str, Any]:
+        job.stdout = "hecho"
+        job.returncode = 0
+        return {'rules': 2}
+
+    def bad_exit(job: jobs.Job) -> None:
+        job.returncode = 3
+
+    def boom(job: jobs.Job) -> None:
+        raise RuntimeError("fallo")
+
+    done, failed, crashed = queue.submit('ok', ok), queue.submit('exit', bad_exit), queue.submit('boom', boom)
+    for job in (done, failed, crashed):
+        assert job.wait(5)
+    queue.shutdown()
+
+    assert done.state == jobs.JOB_SUCCEEDED
+    assert done.to_dict()['result'] == {'rules': 2}
+    assert done.stdout == "hecho"
+    assert failed.state == jobs.JOB_FAILED
+    assert crashed.state == jobs.JOB_FAILED
+    assert crashed.error == "fallo"
+    assert queue.get(done.id) is done
+
+def test_job_queue_history_is_bounded() -> None:
+    """Solo se conservan las últimas tareas terminadas."""
+    queue = jobs.JobQueue(max_workers=1, history=2)
+    submitted = []
+    for _ in range(4):
+        job = queue.submit('noop', lambda job: None)
+        job.wait(5)
+        submitted.append(job)
+    queue.shutdown()
+
+    assert queue.get(submitted[0].id) is None
+    assert queue.get(submitted[-1].id) is submitted[-1]
+
+def test_coalescing_scheduler_merges_triggers_within_window() -> None:
+    """Los disparos que llegan antes de que empiece la tarea comparten ejecución."""
+    queue = jobs.JobQueue(max_workers=1)
+    calls = []
+    release = threading.Event()
+
+    def work(job: jobs.Job) -> dict[str, Any]:
+        calls.append(job.id)
+        release.wait(5)
+        return {}
+
+    scheduler = jobs.CoalescingScheduler('monitoring', work, window=0.2, queue=queue)
+    first = [scheduler.trigger() for _ in range(3)]
+    assert len({job.id for job in first}) == 1
+    assert first[0].coalesced == 2
+
+    # Con la tarea ya en marcha, un disparo nuevo encola otra ejecución
+    while not calls:
+        time.sleep(0.01)
+    later = scheduler.trigger()
+    assert later is not first[0]
+    release.set()
+    assert first[0].wait(5) and later.wait(5)
+    queue.shutdown()
+
+    assert calls == [first[0].id, later.id]
+    assert scheduler.get_stats() == {'triggers': 4, 'runs': 2, 'coalesced': 2}
+
+def test_coalescing_scheduler_merges_triggers_across_workers() -> None:
+    """Disparos en dos workers dentro de la ventana: una sola ejecución cubre los de ambos."""
+    calls = []
+
+    def work(job: jobs.Job) -> dict[str, Any]:
+        calls.append(job.id)
+        return {}
+
+    # Dos planificadores con su propia cola hacen de dos workers de gunicorn
+    queue_a, queue_b = jobs.JobQueue(max_workers=1), jobs.JobQueue(max_workers=1)
+    worker_a = jobs.CoalescingScheduler('monitoring', work, window=0.2, queue=queue_a)
+    worker_b = jobs.CoalescingScheduler('monitoring', work, window=0.4, queue=queue_b)
+    job_a, job_b = worker_a.trigger(), worker_b.trigger()
+    assert job_a.wait(5) and job_b.wait(5)
+
+    assert len(calls) == 1
+    covered = job_b if calls == [job_a.id] else job_a
+    assert covered.result == {'covered': True}
+    assert covered.state == jobs.JOB_SUCCEEDED
+    assert worker_a.get_stats() == {'triggers': 2, 'runs': 1, 'coalesced': 1}
+
+    # Un disparo posterior a la ejecución necesita otra
+    later = worker_b.trigger()
+    assert later.wait(5)
+    assert calls[-1] == later.id
+    queue_a.shutdown()
+    queue_b.shutdown()
+
+@patch('config.JOBS_COALESCE_WINDOW', 0.2)
+@patch('monitoring.run_monitoring', return_value={})
+@patch('data_manager.push_alumnos_to_gitea', return_value=(True, "Push OK", ['alumnos.yaml']))
+def test_back_to_back_pushes_share_one_monitoring_run(mock_push: Any, mock_monitoring: Any, client: FlaskClient) -> None:
+    """Varios pushes seguidos producen una sola regeneración de Checkmk."""
+    before = client.get('/jobs/stats').json['monitoring']
+    job_ids = {client.post('/git_push', json={}).json['job_id'] for _ in range(3)}
+
+    assert len(job_ids) == 1
+    job = jobs.get_job(job_ids.pop())
+    assert job.wait(5)
+    assert job.to_dict()['coalesced'] == 2
+    mock_monitoring.assert_called_once()
+
+    after = client.get('/jobs/stats').json['monitoring']
+    assert after['triggers'] - before['triggers'] == 3
+    assert after['runs'] - before['runs'] == 1
+    assert after['coalesced'] - before['coalesced'] == 2
+
+# ====================================================================
+# BLOQUE 17: Tests de Reconciliación de Reglas de Checkmk
+# ====================================================================
+
+RECONCILE_CATALOG = {
+    'web': {'id': 'web', 'port': 80},
+    'db': {'id': 'db', 'port': 5432, 'protocol': 'tcp'},
+}
+
+def _checkmk_rule(rule_id: str, ruleset: str, value_raw: str, host: str = 'cluster-tfm') -> dict[str, Any]:
+    """Regla tal y como la devuelve el listado de la API de Checkmk."""
+    return {'id': rule_id, 'extensions': {
+        'value_raw': value_raw,
+        'conditions': {'host_name': {'match_on': [host], 'operator': 'one_of'}},
+    }}
+
+def test_build_desired_rules_by_service_label() -> None:
+    """Las reglas deseadas se indexan por '<alumno>-<app>' con el value_raw de los scripts."""
+    students = [{'nombre': 'ana', 'apps': ['web', 'db', 'nope']}, {'nombre': '', 'apps': ['web']}]
+
+    desired, warnings = checkmk_rules.build_desired_rules(students, RECONCILE_CATALOG)
+
+    assert set(desired) == {'ana-web', 'ana-db'}
+    assert desired['ana-web']['url'] == 'http://web-service.ana.svc.cluster.local:80'
+    assert desired['ana-db']['target'] == 'db-service.ana.svc.cluster.local:5432'
+    assert len(warnings) == 1
+    # El value_raw generado se reconoce al listarlo de vuelta
+    for rule in desired.values():
+        assert checkmk_rules.rule_identity(rule['ruleset'], rule['value_raw']) == (rule['service_label'], rule['target'])
+
+def test_diff_rules_only_touches_changes() -> None:
+    """Solo se crean/borran las reglas que cambian; el resto queda intacto."""
+    desired, _ = checkmk_rules.build_desired_rules(
+        [{'nombre': 'ana', 'apps': ['web', 'db']}, {'nombre': 'luis', 'apps': ['web']}], RECONCILE_CATALOG)
+    http = checkmk_rules.HTTP_RULESET
+    listing = [
+        _checkmk_rule('r1', http, desired['ana-web']['value_raw']),           # igual
+        _checkmk_rule('r2', http, desired['ana-web']['value_raw']),           # duplicada
+        _checkmk_rule('r3', http, checkmk_rules.http_value_raw('luis-web', 'http://otra:80')),  # desfasada
+        _checkmk_rule('r4', http, checkmk_rules.http_value_raw('pepe-web', 'http://x:80')),     # sobrante
+        _checkmk_rule('r5', http, desired['ana-web']['value_raw'], host='otro-host'),           # otro host
+    ]
+    existing = checkmk_rules.existing_rules(http, listing, 'cluster-tfm')
+
+    diff = checkmk_rules.diff_rules(desired, existing)
+
+    assert sorted(rule['id'] for rule in diff['delete']) == ['r2', 'r3', 'r4']
+    assert sorted(rule['service_label'] for rule in diff['create']) == ['ana-db', 'luis-web']
+    assert diff['unchanged'] == 1
+
+# ====================================================================
+# BLOQUE 18: Tests del Cliente de Checkmk y la Monitorización en Proceso
+# ====================================================================
+
+def _checkmk_test_client() -> checkmk_client.CheckmkClient:
+    return checkmk_client.CheckmkClient("http://cmk.test/", "cmk", "automation", "secreto", max_retries=0)
+
+@patch('requests.Session.request')
+def test_checkmk_client_rule_requests(mock_request: Any) -> None:
+    """Crea y lista reglas contra la API 1.0 con la sesión autenticada."""
+    cmk = _checkmk_test_client()
+    mock_request.side_effect = [
+        MagicMock(status_code=200, json=MagicMock(return_value={'id': 'r-1'})),
+        MagicMock(status_code=200, json=MagicMock(return_value={'value': [{'id': 'r-1'}]})),
+        MagicMock(status_code=404),
+    ]
+
+    assert cmk.create_rule(checkmk_rules.TCP_RULESET, "{'port': 80}", 'cluster-tfm', 'Monitorizar TCP x') == 'r-1'
+    assert cmk.list_rules(checkmk_rules.TCP_RULESET) == [{'id': 'r-1'}]
+    assert cmk.delete_rule('r-1') is False
+
+    method, url = mock_request.call_args_list[0].args
+    payload = mock_request.call_args_list[0].kwargs['json']
+    assert (method, url) == ('POST', 'http://cmk.test/cmk/check_mk/api/1.0/domain-types/rule/collections/all')
+    assert payload['conditions']['host_name']['match_on'] == ['cluster-tfm']
+    assert mock_request.call_args_list[1].kwargs['params'] == {'ruleset_name': checkmk_rules.TCP_RULESET}
+    assert cmk.session.headers['Authorization'] == 'Bearer automation secreto'
+    assert cmk.get_stats()['create_rule']['count'] == 1
+
+@patch('requests.Session.request')
+def test_checkmk_client_activation_uses_etag(mock_request: Any) -> None:
+    """Activa con el ETag de pending_changes y reintenta con '*' ante un 412."""
+    cmk = _checkmk_test_client()
+    mock_request.side_effect = [
+        MagicMock(status_code=200, headers={'ETag': '"abc"'}),
+        MagicMock(status_code=412),
+        MagicMock(status_code=200),
+    ]
+
+    assert cmk.activate_changes() is True
+    assert mock_request.call_args_list[1].kwargs['headers'] == {'If-Match': '"abc"'}
+    assert mock_request.call_args_list[2].kwargs['headers'] == {'If-Match': '*'}
+
+    mock_request.side_effect = [MagicMock(status_code=200, headers={}), MagicMock(status_code=500, text="boom")]
+    with pytest.raises(checkmk_client.CheckmkError) as excinfo:
+        cmk.activate_changes()
+    assert excinfo.value.status_code == 500
+
+def _fake_checkmk(existing: dict[str, list[dict[str, Any]]]) -> MagicMock:
+    fake = MagicMock()
+    fake.ensure_host.return_value = False
+    fake.list_rules.side_effect = lambda ruleset: existing.get(ruleset, [])
+    fake.activate_changes.return_value = True
+    return fake
+
+def test_monitoring_reconcile_applies_only_the_diff() -> None:
+    """La reconciliación en proceso solo crea/borra lo que cambia y activa una vez."""
+    students = [{'nombre': 'ana', 'apps': ['web']}, {'nombre': 'luis', 'apps': ['db']}]
+    desired, _ = checkmk_rules.build_desired_rules(students, RECONCILE_CATALOG)
+    http = checkmk_rules.HTTP_RULESET
+    fake = _fake_checkmk({http: [
+        _checkmk_rule('keep', http, desired['ana-web']['value_raw']),
+        _checkmk_rule('gone', http, checkmk_rules.http_value_raw('pepe-web', 'http://x:80')),
+    ]})
+
+    with patch('config.CHECKMK_HOST_NAME', 'cluster-tfm'):
+        summary = monitoring.run_monitoring(students, list(RECONCILE_CATALOG.values()), client=fake, log=lambda m: None)
+
+    fake.delete_rule.assert_called_once_with('gone')
+    fake.create_rule.assert_called_once()
+    assert fake.create_rule.call_args.args[0] == checkmk_rules.TCP_RULESET
+    fake.activate_changes.assert_called_once()
+    assert summary == {'http_rules': 0, 'tcp_rules': 1, 'created': 1, 'deleted': 1, 'unchanged': 1, 'activated': True}
+
+    # Sin cambios no se activa nada
+    fake = _fake_checkmk({http: [_checkmk_rule('keep', http, desired['ana-web']['value_raw'])],
+                          checkmk_rules.TCP_RULESET: [_checkmk_rule('t', checkmk_rules.TCP_RULESET, desired['luis-db']['value_raw'])]})
+    with patch('config.CHECKMK_HOST_NAME', 'cluster-tfm'):
+        summary = monitoring.run_monitoring(students, RECONCILE_CATALOG, client=fake, log=lambda m: None)
+    fake.activate_changes.assert_not_called()
+    assert summary['unchanged'] == 2
+
+def test_monitoring_fan_out_respects_concurrency() -> None:
+    """Las altas se reparten en paralelo sin superar el límite de concurrencia."""
+    students = [{'nombre': f'alumno{i}', 'apps': ['web']} for i in range(12)]
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def slow_create(*args: Any) -> str:
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.02)
+        with lock:
+            in_flight[0] -= 1
+        return 'id'
+
+    fake = _fake_checkmk({})
+    fake.create_rule.side_effect = slow_create
+    with patch('config.CHECKMK_HOST_NAME', 'cluster-tfm'):
+        summary = monitoring.run_monitoring(students, RECONCILE_CATALOG, client=fake, log=lambda m: None, concurrency=3)
+
+    assert summary['created'] == 12
+    assert fake.create_rule.call_count == 12
+    assert 1 < peak[0] <= 3
+    fake.activate_changes.assert_called_once()
+
+def test_monitoring_fan_out_reports_failures_without_activating() -> None:
+    """Si alguna operación falla se terminan las demás, se informa y no se activa."""
+    students = [{'nombre': f'alumno{i}', 'apps': ['web']} for i in range(4)]
+    fake = _fake_checkmk({})
+    fake.create_rule.side_effect = [None, checkmk_client.CheckmkError("create_rule: 500", 500), None, None]
+
+    with patch('config.CHECKMK_HOST_NAME', 'cluster-tfm'), pytest.raises(checkmk_client.CheckmkError) as excinfo:
+        monitoring.run_monitoring(students, RECONCILE_CATALOG, client=fake, log=lambda m: None, concurrency=2)
+
+    assert "1 de 4" in str(excinfo.value)
+    assert fake.create_rule.call_count == 4
+    fake.activate_changes.assert_not_called()
+
+@patch('time.sleep')
+@patch('requests.Session.request')
+def test_checkmk_client_retries_post_on_429(mock_request: Any, mock_sleep: Any) -> None:
+    """Un POST rechazado con 429 se reintenta respetando Retry-After."""
+    cmk = checkmk_client.CheckmkClient("http://cmk.test", "cmk", "u", "s", max_retries=2)
+    mock_request.side_effect = [
+        MagicMock(status_code=429, headers={'Retry-After': '2'}),
+        MagicMock(status_code=200, json=MagicMock(return_value={'id': 'r-9'})),
+    ]
+
+    assert cmk.create_rule(checkmk_rules.HTTP_RULESET, "{}", 'h', 'd') == 'r-9'
+    mock_sleep.assert_called_once_with(2.0)
+    # Un 500 en un POST no se repite (podría duplicar la regla)
+    mock_request.side_effect = [MagicMock(status_code=500, text="boom")]
+    with pytest.raises(checkmk_client.CheckmkError):
+        cmk.create_rule(checkmk_rules.HTTP_RULESET, "{}", 'h', 'd')
+
+# ====================================================================
+# BLOQUE 19: Tests de la Monitorización contra un Checkmk Simulado
+# ====================================================================
+
+@pytest.fixture
+def checkmk_stub() -> Generator[tuple[CheckmkStub, checkmk_client.CheckmkClient], None, None]:
+    """Checkmk simulado en local (HTTP real) y un cliente que apunta a él."""
+    with CheckmkStub() as stub:
+        cmk = checkmk_client.CheckmkClient(stub.base_url, stub.site, "u", "s", max_retries=0)
+        with patch('config.CHECKMK_HOST_NAME', 'cluster-tfm'):
+            yield stub, cmk
+        cmk.session.close()
+
+def test_monitoring_end_to_end_against_stub(checkmk_stub: tuple[CheckmkStub, checkmk_client.CheckmkClient]) -> None:
+    """Alta inicial, reconciliación sin cambios y tras editar un alumno, por HTTP."""
+    stub, cmk = checkmk_stub
+    students = [{'nombre': 'ana', 'apps': ['web', 'db']}, {'nombre': 'luis', 'apps': ['web']}]
+    run = lambda roster, mode: monitoring.run_monitoring(
+        roster, RECONCILE_CATALOG, mode=mode, client=cmk, log=lambda m: None, concurrency=2)
+
+    summary = run(students, monitoring.MODE_FULL)
+    assert summary['created'] == 3 and summary['activated'] is True
+    assert 'cluster-tfm' in stub.hosts
+    assert len(stub.rules) == 3 and stub.pending_changes == 0
+
+    stub.reset_counters()
+    summary = run(students, monitoring.MODE_RECONCILE)
+    assert summary['unchanged'] == 3 and summary['activated'] is False
+    assert set(stub.requests) == {'get_host', 'list_rules'}
+
+    students[1]['apps'] = ['db']
+    summary = run(students, monitoring.MODE_RECONCILE)
+    assert (summary['created'], summary['deleted'], summary['unchanged']) == (1, 1, 2)
+    assert stub.activations == 2
+    labels = {checkmk_rules.rule_identity(rule['ruleset'], rule['value_raw'])[0] for rule in stub.rules.values()}
+    assert labels == {'ana-web', 'ana-db', 'luis-db'}
+
+def test_checkmk_stub_enforces_activation_etag(checkmk_stub: tuple[CheckmkStub, checkmk_client.CheckmkClient]) -> None:
+    """El simulador exige el ETag vigente (o '*') para activar, como Checkmk."""
+    stub, cmk = checkmk_stub
+    cmk.create_rule(checkmk_rules.HTTP_RULESET, "{}", 'cluster-tfm', 'x')
+    with patch.object(cmk, 'pending_changes_etag', return_value='"viejo"'):
+        assert cmk.activate_changes() is True  # 412 y reintento con '*'
+    assert stub.requests['activate_changes'] == 2
+    assert cmk.activate_changes() is False  # nada pendiente (422)
+
+# ====================================================================
+# BLOQUE 20: Tests de la Caché de Kubernetes (/deployments)
+# ====================================================================
+
+def _k8s_service(namespace: str, name: str, svc_type: str = 'NodePort', node_port: int = 30080, labels: dict[str, str] | None = None) -> dict[str, Any]:
+    """Servicio tal y como lo devuelve `kubectl get svc -o json`."""
+    return {
+        'metadata': {'namespace': namespace, 'name': name, 'labels': labels or {}},
+        'spec': {'type': svc_type, 'ports': [{'port': 80, 'nodePort': node_port, 'protocol': 'TCP'}]},
+    }
+
+def _k8s_node(name: str, internal: str, external: str | None = None) -> dict[str, Any]:
+    addresses = [{'type': 'InternalIP', 'address': internal}]
+    if external:
+        addresses.append({'type': 'ExternalIP', 'address': external})
+    return {'metadata': {'name': name}, 'status': {'addresses': addresses}}
+
+def test_iter_json_objects_splits_watch_stream() -> None:
+    """La salida de `kubectl get -w -o json` son objetos indentados seguidos."""
+    event = {'type': 'ADDED', 'object': _k8s_service('alumno-ana', 'web')}
+    stream = json.dumps(event, indent=4) + "\n" + json.dumps(event) + "\n"
+
+    objects = list(k8s_cache.iter_json_objects(io.StringIO(stream)))
+
+    assert objects == [event, event]
+
+def test_k8s_cache_applies_list_and_watch_events() -> None:
+    """El listado inicial y los eventos del watch mantienen la caché y su índice."""
+    cache = k8s_cache.K8sCache()
+    cache.replace_services([
+        _k8s_service('alumno-ana', 'web', labels={'app': 'web'}),
+        _k8s_service('alumno-luis', 'db', node_port=30306, labels={'app': 'db'}),
+        _k8s_service('alumno-ana', 'interno', svc_type='ClusterIP'),
+        _k8s_service('kube-system', 'dns'),
+    ])
+    cache.replace_nodes([_k8s_node('n1', '10.0.0.5', '192.168.1.10')])
+    assert cache.wait_synced(0)
+
+    assert [svc['name'] for svc in cache.services()] == ['web', 'db']
+    assert [svc['namespace'] for svc in cache.services({'app': 'db'})] == ['alumno-luis']
+
+    cache.apply_service_event({'type': 'ADDED', 'object': _k8s_service('alumno-eva', 'web', node_port=30081, labels={'app': 'web'})})
+    cache.apply_service_event({'type': 'DELETED', 'object': _k8s_service('alumno-luis', 'db')})
+    cache.apply_service_event({'type': 'MODIFIED', 'object': _k8s_service('alumno-ana', 'web', svc_type='ClusterIP')})
+
+    assert [svc['namespace'] for svc in cache.services({'app': 'web'})] == ['alumno-eva']
+    assert cache.services({'app': 'db'}) == []
+    row = cache.deployments()[0]
+    assert row['url'] == 'http://192.168.1.10:30081'
+    assert row['pf_cmd'] == 'kubectl port-forward -n alumno-eva svc/web 30081:80'
+    assert cache.status()['services'] == 1
+
+def test_k8s_cache_watch_starts_at_list_resource_version() -> None:
+    """El watch empieza en el resourceVersion del listado (sin hueco) y un ERROR obliga a volver a listar."""
+    cache = k8s_cache.K8sCache(resync=60)
+    listing = {'kind': 'ServiceList', 'metadata': {'resourceVersion': '42'},
+               'items': [_k8s_service('alumno-ana', 'web')]}
+    events = [
+        {'type': 'ADDED', 'object': _k8s_service('alumno-eva', 'web', node_port=30081)},
+        {'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410, 'message': 'too old resource version'}},
+        {'type': 'ADDED', 'object': _k8s_service('alumno-luis', 'web', node_port=30082)},
+    ]
+    commands = []
+
+    class FakeWatch:
+        def __init__(self, command: list[str], **kwargs: Any) -> None:
+            commands.append(command)
+            self.stdout = io.StringIO("".join(json.dumps(event) + "\n" for event in events))
+            cache._stop.set()  # Una sola vuelta de list + watch
+
+        def kill(self) -> None:
+            pass
+
+        def wait(self) -> int:
+            return 0
+
+    listed = subprocess.CompletedProcess([], 0, json.dumps(listing), '')
+    with patch('subprocess.run', return_value=listed) as mock_run, patch('subprocess.Popen', FakeWatch):
+        cache._list_and_watch('services', '/api/v1/services', cache.replace_services,
+                              cache.apply_service_event, cache._services)
+
+    assert mock_run.call_args.args[0] == ['kubectl', 'get', '--raw', '/api/v1/services']
+    assert commands == [['kubectl', 'get', '--raw',
+                         '/api/v1/services?watch=true&resourceVersion=42&timeoutSeconds=60']]
+    assert [svc['namespace'] for svc in cache.services()] == ['alumno-ana', 'alumno-eva']
+
+def test_k8s_cache_age_is_zero_while_watching() -> None:
+    """Un watch abierto y tranquilo no envejece; sin watch cuenta desde el último listado."""
+    cache = k8s_cache.K8sCache()
+    cache.replace_services([_k8s_service('alumno-ana', 'web')])
+    cache.replace_nodes([_k8s_node('n1', '10.0.0.5')])
+    with patch('time.time', return_value=time.time() + 120):
+        assert cache.status()['age'] == pytest.approx(120, abs=1)
+        cache._services.watching = cache._nodes.watching = True
+        assert cache.status()['age'] == 0
+        cache._nodes.watching = False
+        assert cache.status()['age'] == pytest.approx(120, abs=1)
+
+def test_deployments_view_renders_from_cache(client: FlaskClient) -> None:
+    """La vista no lanza kubectl: pinta lo que hay en la caché e indica su antigüedad."""
+    cache = k8s_cache.K8sCache()
+    cache.replace_services([_k8s_service('alumno-ana', 'web')])
+    cache.replace_nodes([_k8s_node('n1', '10.0.0.5')])
+
+    with patch('k8s_cache.get_cache', return_value=cache), patch('subprocess.run') as mock_run, \
+            patch('health_probe.HealthProber.cached_report', return_value=None):
+        response = client.get('/deployments')
+
+    html = response.data.decode('utf-8')
+    assert response.status_code == 200
+    assert 'http://10.0.0.5:30080' in html
+    assert 'actualizados hace' in html
+    mock_run.assert_not_called()
+
+def test_deployments_view_reports_unsynced_cache(client: FlaskClient) -> None:
+    """Si kubectl no ha respondido se muestra el error en vez de una tabla vacía sin más."""
+    cache = k8s_cache.K8sCache()
+    with patch('k8s_cache.get_cache', return_value=cache), patch('config.K8S_INITIAL_SYNC_TIMEOUT', 0), \
+            patch('health_probe.HealthProber.cached_report', return_value=None):
+        html = client.get('/deployments').data.decode('utf-8')
+    assert 'No se pudo obtener la lista de servicios' in html
+
+# ====================================================================
+# BLOQUE 21: Tests del Sondeo de Salud de los Servicios
+# ====================================================================
+
+@pytest.fixture
+def probe_targets() -> Generator[dict[str, int], None, None]:
+    """Servidor HTTP local (200 en '/', 500 en '/roto') y un puerto cerrado."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import socket
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            self.send_response(500 if self.path == '/roto' else 200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with socket.socket() as free:
+        free.bind(('127.0.0.1', 0))
+        closed_port = free.getsockname()[1]
+    yield {'open': server.server_address[1], 'closed': closed_port}
+    server.shutdown()
+    server.server_close()
+
+def test_endpoints_from_roster_match_checkmk_targets() -> None:
+    """Se sondean los mismos destinos que vigila Checkmk."""
+    endpoints = health_probe.endpoints_from_roster([{'nombre': 'alumno-ana', 'apps': ['web', 'db']}], RECONCILE_CATALOG)
+
+    by_label = {endpoint['service_label']: endpoint for endpoint in endpoints}
+    assert by_label['alumno-ana-web']['url'] == 'http://web-service.alumno-ana.svc.cluster.local:80'
+    assert (by_label['alumno-ana-db']['host'], by_label['alumno-ana-db']['port']) == ('db-service.alumno-ana.svc.cluster.local', 5432)
+    assert by_label['alumno-ana-db']['namespace'] == 'alumno-ana'
+    assert by_label['alumno-ana-web']['service'] == 'web-service'
+
+def test_sweep_probes_http_and_tcp(probe_targets: dict[str, int]) -> None:
+    """HTTP 2xx y TCP abierto están arriba; 5xx y puerto cerrado, caídos."""
+    port, closed = probe_targets['open'], probe_targets['closed']
+    endpoints = [
+        {'service_label': 'ok', 'protocol': 'http', 'url': f'http://127.0.0.1:{port}/'},
+        {'service_label': 'roto', 'protocol': 'http', 'url': f'http://127.0.0.1:{port}/roto'},
+        {'service_label': 'tcp', 'protocol': 'tcp', 'host': '127.0.0.1', 'port': port},
+        {'service_label': 'cerrado', 'protocol': 'tcp', 'host': '127.0.0.1', 'port': closed},
+    ]
+
+    results = {result['service_label']: result for result in health_probe.sweep(endpoints, timeout=2)}
+
+    assert results['ok']['status'] == 'up' and results['ok']['detail'] == 'HTTP 200'
+    assert results['roto']['status'] == 'down' and results['roto']['detail'] == 'HTTP 500'
+    assert results['tcp']['status'] == 'up'
+    assert results['cerrado']['status'] == 'down'
+    assert all(result['latency_ms'] >= 0 for result in results.values())
+
+def test_health_prober_caches_results_for_ttl() -> None:
+    """Dentro del TTL no se vuelve a sondear salvo que se fuerce."""
+    prober = health_probe.HealthProber(ttl=60)
+    up = {'service_label': 'a', 'status': 'up'}
+    with patch('health_probe.endpoints_from_roster', return_value=[{}]), \
+            patch('health_probe.sweep', return_value=[up]) as mock_sweep:
+        first = prober.report()
+        prober.report()
+        assert mock_sweep.call_count == 1
+        prober.report(force=True)
+        assert mock_sweep.call_count == 2
+
+    assert first['summary'] == {'total': 1, 'up': 1, 'down': 0}
+    assert prober.cached_report()['services'] == [up]
+
+def test_api_health_route(client: FlaskClient) -> None:
+    """/api/health devuelve el resumen y el detalle por servicio."""
+    prober = health_probe.HealthProber(ttl=60)
+    down = {'service_label': 'alumno-ana-web', 'status': 'down', 'detail': 'HTTP 503'}
+    with patch('health_probe.get_prober', return_value=prober), \
+            patch('health_probe.endpoints_from_roster', return_value=[{}]), \
+            patch('health_probe.sweep', return_value=[down]):
+        data = client.get('/api/health').json
+
+    assert data['summary'] == {'total': 1, 'up': 0, 'down': 1}
+    assert data['services'] == [down]
+    assert data['age'] >= 0
+
+def test_deployments_view_shows_health_column(client: FlaskClient) -> None:
+    """La vista de despliegues muestra el estado del último sondeo de cada servicio."""
+    cache = k8s_cache.K8sCache()
+    cache.replace_services([_k8s_service('alumno-ana', 'web-service')])
+    cache.replace_nodes([])
+    report = {'checked_at': time.time(), 'services': [
+        {'namespace': 'alumno-ana', 'service': 'web-service', 'status': 'down', 'detail': 'HTTP 503', 'latency_ms': 3.0},
+    ]}
+    with patch('k8s_cache.get_cache', return_value=cache), \
+            patch('health_probe.HealthProber.cached_report', return_value=report):
+        html = client.get('/deployments').data.decode('utf-8')
+
+    assert 'Caído' in html
+    assert 'HTTP 503' in html
+
+@patch('data_manager.load_catalogo', return_value=[])
+@patch('data_manager.load_alumnos', return_value=[])
+def test_cached_report_starts_a_single_refresh(mock_alumnos: Any, mock_catalogo: Any) -> None:
+    """Peticiones concurrentes con el barrido caducado lanzan un único refresco en segundo plano."""
+    prober = health_probe.HealthProber(ttl=3600)
+    release = threading.Event()
+    sweeps = []
+
+    def slow_sweep() -> dict[str, Any]:
+        sweeps.append(1)
+        release.wait(5)
+        return {'checked_at': time.time(), 'generation': list(data_manager.data_generation()),
+                'duration': 0, 'summary': {}, 'services': []}
+
+    with patch.object(prober, '_sweep', side_effect=slow_sweep):
+        barrier = threading.Barrier(8)
+
+        def request() -> None:
+            barrier.wait()
+            prober.cached_report()
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        release.set()
+        deadline = time.time() + 5
+        while prober._refreshing and time.time() < deadline:
+            time.sleep(0.01)
+
+    assert sweeps == [1]
+    assert prober.cached_report() is not None
+
+# ====================================================================
+# BLOQUE 22: Tests del Arranque y las Sondas de Kubernetes
+# ====================================================================
+
+def test_create_app_does_not_wait_for_gitea() -> None:
+    """create_app vuelve enseguida aunque Gitea tarde: la sincronización va en un hilo."""
+    release = threading.Event()
+    with patch.dict(data_manager._INITIAL_SYNC, started_at=None, finished_at=None, success=None), \
+            patch.object(data_manager, '_INITIAL_SYNC_DONE', threading.Event()), \
+            patch('data_manager.sync_files_from_gitea', side_effect=lambda: release.wait(5)) as mock_sync:
+        start = time.perf_counter()
+        flask_app = create_app()
+        assert time.perf_counter() - start < 1
+
+        test_client = flask_app.test_client()
+        assert test_client.get('/healthz').status_code == 200
+        assert test_client.get('/readyz').status_code == 503
+
+        release.set()
+        assert data_manager.wait_initial_sync(5)
+        ready = test_client.get('/readyz')
+        assert ready.status_code == 200
+        assert ready.json['success'] is True
+        mock_sync.assert_called_once()
+
+def test_readyz_ready_after_timeout(client: FlaskClient) -> None:
+    """Si la sincronización se alarga más de INITIAL_SYNC_TIMEOUT, la app se da por lista."""
+    with patch.dict(data_manager._INITIAL_SYNC, started_at=time.time() - 60, finished_at=None, success=None), \
+            patch.object(data_manager, '_INITIAL_SYNC_DONE', threading.Event()), \
+            patch('config.INITIAL_SYNC_TIMEOUT', 15):
+        response = client.get('/readyz')
+
+    assert response.status_code == 200
+    assert response.json['timed_out'] is True
+
+# ====================================================================
+# BLOQUE 23: Tests del Webhook de Push de Gitea
+# ====================================================================
+
+WEBHOOK_SECRET = 'secreto-webhook'
+
+def _post_webhook(client: FlaskClient, payload: dict[str, Any], secret: str = WEBHOOK_SECRET, event: str = 'push') -> Any:
+    """Envía el webhook firmado como lo hace Gitea (X-Gitea-Signature = HMAC-SHA256 hex)."""
+    body = json.dumps(payload).encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return client.post('/webhooks/gitea', data=body, content_type='application/json',
+                       headers={'X-Gitea-Signature': signature, 'X-Gitea-Event': event})
+
+def _push_payload(*modified: str, branch: str = 'gonzalo') -> dict[str, Any]:
+    return {'ref': f'refs/heads/{branch}', 'commits': [{'added': [], 'removed': [], 'modified': list(modified)}]}
+
+@patch('config.GITEA_WEBHOOK_SECRET', WEBHOOK_SECRET)
+@patch('config.GITEA_BRANCH', 'gonzalo')
+@patch('requests.Session.request')
+def test_gitea_webhook_refreshes_only_changed_files(mock_request: Any, client: FlaskClient, sync_files: tuple[str, str]) -> None:
+    """Un push que solo cambia el catálogo descarga solo el catálogo."""
+    alumnos_file, catalogo_file = sync_files
+    remote_catalog = "- id: app2\n  port: 8080\n"
+    mock_request.side_effect = _fake_gitea(
+        listing={
+            'edugitops/alumnos.yaml': 'sha-remoto-distinto',
+            'edugitops/catalogo-servicios.yaml': data_manager.git_blob_sha(remote_catalog.encode('utf-8')),
+        },
+        contents={'edugitops/catalogo-servicios.yaml': remote_catalog},
+    )
+    alumnos_generation, catalogo_generation = data_manager.data_generation()
+    response = _post_webhook(client, _push_payload('edugitops/catalogo-servicios.yaml', 'README.md'))
+
+    assert response.status_code == 200
+    assert response.json['files'] == {'edugitops/catalogo-servicios.yaml': 'updated'}
+    assert _read_text(catalogo_file) == remote_catalog
+    assert "local" in _read_text(alumnos_file)
+    # Listado del directorio + la descarga del catálogo
+    assert mock_request.call_count == 2
+    # El sondeo de salud de todos los workers caduca por la generación del catálogo
+    assert data_manager.data_generation() == (alumnos_generation, catalogo_generation + 1)
+    assert data_manager.load_catalogo()[0]['id'] == 'app2'
+
+@patch('config.GITEA_WEBHOOK_SECRET', WEBHOOK_SECRET)
+@patch('config.GITEA_BRANCH', 'gonzalo')
+@patch('requests.Session.request')
+def test_gitea_webhook_of_own_push_keeps_later_local_changes(mock_request: Any, client: FlaskClient, sync_files: tuple[str, str]) -> None:
+    """El webhook del push de la app no descarga nada: lo guardado después del push se conserva."""
+    _, catalogo_file = sync_files
+    gitea = _FakeGiteaRepo({'edugitops/catalogo-servicios.yaml': _read_text(catalogo_file)})
+    mock_request.side_effect = gitea
+    data_manager.save_alumno_changes('002', 'u2', [])
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+
+    # Se guarda otro cambio antes de que llegue el webhook del push anterior
+    data_manager.save_alumno_changes('003', 'u3', [])
+    mock_request.reset_mock()
+    response = _post_webhook(client, _push_payload('edugitops/alumnos.yaml'))
+
+    assert response.json['files'] == {'edugitops/alumnos.yaml': 'unchanged'}
+    assert [c.args[0] for c in mock_request.call_args_list] == ['GET']
+    assert data_manager.get_student('003') is not None
+    # Si el remoto sí se mueve (otro commit en Gitea), se descarga
+    gitea.shas['edugitops/alumnos.yaml'] = 'editado-en-gitea'
+    with patch('data_manager._store_downloaded_file', return_value='editado-en-gitea') as mock_store:
+        assert _post_webhook(client, _push_payload('edugitops/alumnos.yaml')).json['files'] == {'edugitops/alumnos.yaml': 'updated'}
+    mock_store.assert_called_once()
+
+@patch('config.GITEA_WEBHOOK_SECRET', WEBHOOK_SECRET)
+@patch('config.GITEA_BRANCH', 'gonzalo')
+@patch('requests.Session.request')
+def test_gitea_webhook_ignores_other_branches_and_files(mock_request: Any, client: FlaskClient, sync_files: tuple[str, str]) -> None:
+    """Pushes a otra rama o que no tocan los ficheros sincronizados no llaman a Gitea."""
+    assert _post_webhook(client, _push_payload('edugitops/alumnos.yaml', branch='main')).json['files'] == {}
+    assert _post_webhook(client, _push_payload('docs/README.md')).json['files'] == {}
+    assert _post_webhook(client, {}, event='issues').json['files'] == {}
+    mock_request.assert_not_called()
+
+@patch('config.GITEA_WEBHOOK_SECRET', WEBHOOK_SECRET)
+@patch('data_manager.sync_from_gitea')
+def test_gitea_webhook_rejects_bad_signature(mock_sync: Any, client: FlaskClient) -> None:
+    """Sin la firma HMAC correcta se responde 401 y no se sincroniza nada."""
+    response = _post_webhook(client, _push_payload('edugitops/alumnos.yaml'), secret='otro')
+
+    assert response.status_code == 401
+    mock_sync.assert_not_called()
+
+@patch('config.GITEA_WEBHOOK_SECRET', '')
+def test_gitea_webhook_disabled_without_secret(client: FlaskClient) -> None:
+    """Si no hay secreto configurado el webhook está desactivado."""
+    assert _post_webhook(client, _push_payload('edugitops/alumnos.yaml'), secret='').status_code == 403
+
+# ====================================================================
+# BLOQUE 24: Tests de las Métricas de Prometheus
+# ====================================================================
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    """Formato de texto de Prometheus: cubetas acumuladas, _sum y _count."""
+    histogram = metrics.Histogram('prueba_seconds', 'Prueba.', ('op',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, op='x')
+
+    lines = histogram.render()
+
+    assert 'prueba_seconds_bucket{op="x",le="0.1"} 2' in lines
+    assert 'prueba_seconds_bucket{op="x",le="1"} 3' in lines
+    assert 'prueba_seconds_bucket{op="x",le="+Inf"} 4' in lines
+    assert 'prueba_seconds_sum{op="x"} 3.65' in lines
+    assert 'prueba_seconds_count{op="x"} 4' in lines
+
+def test_callback_metric_skips_failures() -> None:
+    """Una métrica calculada que falla no rompe el resto de /metrics."""
+    def boom() -> float:
+        raise RuntimeError("sin datos")
+    assert metrics.CallbackMetric('prueba_gauge', 'Prueba.', boom).render() == []
+    assert metrics.CallbackMetric('prueba_gauge', 'Prueba.', lambda: {('a',): 2}, ('k',)).render() == ['prueba_gauge{k="a"} 2']
+
+@patch('data_manager.load_alumnos', return_value=[{'id': '001'}, {'id': '002'}])
+def test_metrics_endpoint_exposes_routes_yaml_and_gauges(mock_alumnos: Any, client: FlaskClient) -> None:
+    """/metrics incluye la latencia por ruta, YAML y los gauges del roster y la caché."""
+    client.get('/api/catalog')
+    yaml_io.safe_load("- id: app1\n")
+
+    response = client.get('/metrics')
+    body = response.data.decode('utf-8')
+
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    assert 'edugitops_http_request_duration_seconds_count{route="/api/catalog",method="GET",status="200"}' in body
+    assert 'edugitops_yaml_duration_seconds_count{op="load"}' in body
+    assert 'edugitops_yaml_bytes_bucket{op="load",le="1024"}' in body
+    assert 'edugitops_roster_students 2' in body
+    assert '# TYPE edugitops_yaml_cache_hit_ratio gauge' in body
+    assert 'edugitops_monitoring_triggers_total{result="coalesced"}' in body
+
+@patch('requests.Session.request')
+def test_gitea_calls_are_observed_by_operation_and_status(mock_request: Any) -> None:
+    """Cada llamada a Gitea queda en el histograma con su operación y código."""
+    mock_request.return_value = MagicMock(status_code=404)
+    client = gitea_client.GiteaClient('http://gitea/api/v1', 'o', 'r', 'main', ('u', 'p'))
+    _, before = metrics.GITEA_SECONDS.snapshot(operation='get_contents', status='404')
+
+    client.get_contents('x.yaml')
+
+    assert metrics.GITEA_SECONDS.snapshot(operation='get_contents', status='404')[1] == before + 1
+
+# ====================================================================
+# BLOQUE 25: Tests del Perfilado por Petición (Server-Timing)
+# ====================================================================
+
+def test_server_timing_header_has_named_spans(client: FlaskClient) -> None:
+    """Cada respuesta lleva Server-Timing con los tramos medidos y el total."""
+    data_manager._invalidate_cache(data_manager.ALUMNOS_FILE)
+    response = client.get('/')
+
+    timing = response.headers['Server-Timing']
+    assert 'yaml_load;dur=' in timing
+    assert 'render;dur=' in timing
+    assert 'total;dur=' in timing
+    assert 'X-Profile' not in response.headers
+
+def test_server_timing_outside_request_is_noop() -> None:
+    """Fuera de una petición record() no acumula nada."""
+    profiling.record('gitea', 1.0)
+    token = profiling.start_request()
+    profiling.record('gitea', 0.002)
+    profiling.record('gitea', 0.001)
+    spans = profiling.finish_request(token)
+    assert spans['gitea'][1] == 2
+    assert profiling.server_timing(spans) == 'gitea;dur=3.00;desc="2x"'
+
+def test_signed_profile_request_is_saved_and_downloadable(client: FlaskClient, tmp_path: Any) -> None:
+    """?profile=<firma> guarda un cProfile en el buffer circular, descargable desde /admin/profiles."""
+    with patch('config.PROFILING_SECRET', 'perfil'), patch('config.PROFILING_DIR', str(tmp_path)), \
+            patch('config.PROFILING_MAX_FILES', 2):
+        assert 'X-Profile' not in client.get('/api/catalog?profile=firma-mala').headers
+
+        names = []
+        for _ in range(3):
+            response = client.get(f"/api/catalog?profile={profiling.sign('/api/catalog')}")
+            names.append(response.headers['X-Profile'])
+
+        assert client.get('/admin/profiles').status_code == 403
+        listing = client.get('/admin/profiles?token=perfil').json['profiles']
+        assert [entry['name'] for entry in listing] == names[:0:-1]
+
+        download = client.get(f"/admin/profiles/{names[-1]}?token=perfil")
+        assert download.status_code == 200
+        assert len(download.data) > 0
+        assert client.get(f"/admin/profiles/{names[0]}?token=perfil").status_code == 404
+
+def test_profile_admin_routes_hidden_without_secret(client: FlaskClient, tmp_path: Any) -> None:
+    """Sin PROFILING_SECRET las rutas de perfiles no existen, aunque el perfilado esté activo."""
+    with patch('config.PROFILING_SECRET', ''), patch('config.PROFILING_ENABLED', True), \
+            patch('config.PROFILING_DIR', str(tmp_path)):
+        name = client.get('/api/catalog').headers['X-Profile']
+        assert client.get('/admin/profiles').status_code == 404
+        assert client.get(f'/admin/profiles/{name}').status_code == 404
+
+# ====================================================================
+# BLOQUE 26: Tests del Estado Compartido entre Workers (gunicorn)
+# ====================================================================
+
+def _run_other_worker(code: str, db_path: str) -> subprocess.CompletedProcess[str]:
+    """Ejecuta `code` en otro proceso Python con el mismo SHARED_STATE_DB (como otro worker)."""
+    env = dict(os.environ, SHARED_STATE_DB=db_path, PYTHONPATH=os.path.join(root_dir, 'src'))
+    return subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, timeout=30)
+
+def test_process_lock_excludes_other_processes(shared_state_db: str) -> None:
+    """ProcessLock es reentrante en el proceso y bloquea a los demás workers."""
+    probe = (
+        "import fcntl, os, sys\n"
+        f"fd = os.open({shared_state_db + '.alumnos.lock'!r}, os.O_CREAT | os.O_RDWR)\n"
+        "try:\n"
+        "    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)\n"
+        "except BlockingIOError:\n"
+        "    sys.exit(3)\n"
+    )
+    lock = shared_state.ProcessLock('alumnos')
+    with lock:
+        with lock:
+            assert _run_other_worker(probe, shared_state_db).returncode == 3
+        assert _run_other_worker(probe, shared_state_db).returncode == 3
+    assert _run_other_worker(probe, shared_state_db).returncode == 0
+
+def test_sync_status_is_shared_between_workers(client: FlaskClient, shared_state_db: str) -> None:
+    """La sincronización hecha por otro worker es la que ven la portada y get_sync_status()."""
+    result = _run_other_worker(
+        "import shared_state\n"
+        "shared_state.put('gitea_sync', {'success': True, 'files': {'alumnos.yaml': 'updated'}, 'at': 1.0})\n",
+        shared_state_db,
+    )
+    assert result.returncode == 0, result.stderr
+
+    with patch('data_manager.GIT_SYNC_STATUS', False):
+        status = data_manager.get_sync_status()
+        assert status['success'] is True
+        assert status['files'] == {'alumnos.yaml': 'updated'}
+        assert client.get('/').status_code == 200
+
+@patch('data_manager.load_catalogo', return_value=[])
+@patch('data_manager.load_alumnos', return_value=[])
+def test_data_generation_expires_health_report(mock_alumnos: Any, mock_catalogo: Any) -> None:
+    """Escribir el roster en cualquier worker sube su generación y caduca el sondeo cacheado."""
+    prober = health_probe.HealthProber(ttl=3600)
+    first = prober.report()
+    assert prober.report()['checked_at'] == first['checked_at']
+
+    alumnos, catalogo = data_manager.data_generation()
+    data_manager._invalidate_cache(data_manager.ALUMNOS_FILE)
+    assert data_manager.data_generation() == (alumnos + 1, catalogo)
+    assert prober._expired()
+    assert prober.report()['generation'] == [alumnos + 1, catalogo]
+
+def test_job_state_is_visible_from_any_worker(client: FlaskClient) -> None:
+    """Las tareas se publican en el estado compartido y /jobs/<id> las sirve aunque sean de otro worker."""
+    queue = jobs.JobQueue(max_workers=1)
+    job = queue.submit('prueba', lambda job: {'ok': 1})
+    assert job.wait(5)
+    queue.shutdown()
+    published = shared_state.get(f'job:{job.id}')
+    assert published['state'] == jobs.JOB_SUCCEEDED
+    assert published['result'] == {'ok': 1}
+
+    response = client.get(f'/jobs/{job.id}')
+    assert response.status_code == 200
+    assert response.json['state'] == jobs.JOB_SUCCEEDED
+    assert client.get('/jobs/no-existe').status_code == 404
+
+def test_gunicorn_config_uses_web_settings() -> None:
+    """src/gunicorn.conf.py toma workers, hilos y timeout de config.py."""
+    with patch('config.WEB_WORKERS', 3), patch('config.WEB_THREADS', 8), patch('config.WEB_TIMEOUT', 45):
+        settings = runpy.run_path(os.path.join(root_dir, 'src', 'gunicorn.conf.py'))
+    assert settings['workers'] == 3
+    assert settings['threads'] == 8
+    assert settings['timeout'] == 45
+    assert settings['worker_class'] == 'gthread'
+
+def test_metrics_are_aggregated_across_workers(client: FlaskClient) -> None:
+    """/metrics suma contadores e histogramas de todos los workers y etiqueta los gauges de cada proceso."""
+    client.get('/api/catalog')
+    metrics.publish()
+    own = shared_state.get(f'metrics:worker:{os.getpid()}')['metrics']
+    _, local_count = metrics.HTTP_REQUEST_SECONDS.snapshot(route='/api/catalog', method='GET', status=200)
+    # Otro worker con lo mismo publicado: uno vivo y otro que terminó hace tiempo
+    shared_state.put('metrics:worker:1', {'at': time.time(), 'metrics': own})
+    shared_state.put('metrics:worker:2', {'at': 0, 'metrics': own})
+
+    body = client.get('/metrics').data.decode('utf-8')
+
+    series = 'edugitops_http_request_duration_seconds_count{route="/api/catalog",method="GET",status="200"}'
+    assert f'{series} {3 * local_count}' in body
+    # Los gauges propios del proceso: una serie por worker vivo
+    assert f'edugitops_yaml_cache_hit_ratio{{worker="{os.getpid()}"}}' in body
+    assert 'edugitops_yaml_cache_hit_ratio{worker="1"}' in body
+    assert 'edugitops_yaml_cache_hit_ratio{worker="2"}' not in body
+    # Los gauges de datos comunes no se repiten por worker
+    assert 'edugitops_catalog_services{' not in body
+
+# ====================================================================
+# BLOQUE 27: Tests de los Backends de Alumnos (YAML y SQLite)
+# ====================================================================
+
+@pytest.fixture
+def student_backend(sync_files: tuple[str, str]) -> str:
+    """Backend de alumnos con el que se ejecuta el test (sync_files los recorre todos)."""
+    return config.ALUMNOS_BACKEND
+
+def test_backend_crud_roundtrip(student_backend: str) -> None:
+    """Alta, modificación, baja, unicidad de nombre y siguiente ID."""
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['local']
+    assert data_manager.get_next_student_id() == '002'
+
+    assert data_manager.save_alumno_changes('002', 'u2', ['app1']) == (True, "Alumno creado correctamente.")
+    assert data_manager.save_alumno_changes('003', 'U2', [])[0] is False
+    assert data_manager.save_alumno_changes('001', 'local-bis', [])[0] is True
+    assert data_manager.delete_student('999') == (False, "Alumno no encontrado.")
+
+    alumnos = data_manager.load_alumnos()
+    assert [a['nombre'] for a in alumnos] == ['local-bis', 'u2']
+    assert alumnos[1]['check-http'] == ['http://app1-service.u2.svc.cluster.local:80']
+    assert data_manager.get_student('002')['apps'] == ['app1']
+
+    assert data_manager.delete_student('001')[0] is True
+    assert [a['id'] for a in data_manager.load_alumnos()] == ['002']
+    assert data_manager.get_student('001') is None
+    assert data_manager.search_students('u')['total'] == 1
+
+def test_backend_bulk_and_raw_editor(student_backend: str) -> None:
+    """Las operaciones masivas son atómicas y el editor RAW sustituye el roster completo."""
+    success, _, results = data_manager.apply_bulk_operations([
+        {'op': 'create', 'nombre': 'u2'},
+        {'op': 'update', 'id': '001', 'apps': ['no-existe']},
+    ])
+    assert success is False and results[1]['success'] is False
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['local']
+
+    success, _, _ = data_manager.apply_bulk_operations([{'op': 'create', 'nombre': 'u2'}, {'op': 'delete', 'id': '001'}])
+    assert success is True
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['u2']
+
+    raw = "- nombre: ana\n  id: '010'\n  apps:\n  - app1\n  check-http:\n  - http://app1-service.ana.svc.cluster.local:80\n"
+    assert data_manager.validate_and_save_raw_yaml(raw)[0] is True
+    assert data_manager.get_raw_alumnos_yaml() == raw
+    assert [a['id'] for a in data_manager.load_alumnos()] == ['010']
+
+def test_backend_etag_changes_on_write(student_backend: str, client: FlaskClient) -> None:
+    """El ETag de /api/students cambia con cada escritura de cualquiera de los backends."""
+    etag = client.get('/api/students').headers['ETag']
+    assert client.get('/api/students', headers={'If-None-Match': etag}).status_code == 304
+
+    data_manager.save_alumno_changes('002', 'u2', [])
+    changed = client.get('/api/students', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.json['total'] == 2
+
+@patch('requests.Session.request')
+def test_backend_push_uploads_canonical_yaml(mock_request: Any, student_backend: str, sync_files: tuple[str, str]) -> None:
+    """El push sube (y deja en disco) el alumnos.yaml canónico con todos los cambios."""
+    import base64
+    alumnos_file, _ = sync_files
+    data_manager.save_alumno_changes('002', 'u2', ['app1'])
+    if student_backend == 'sqlite':
+        # Con SQLite las escrituras no tocan alumnos.yaml hasta el push
+        assert 'u2' not in _read_text(alumnos_file)
+
+    mock_request.side_effect = [MagicMock(status_code=404), MagicMock(status_code=500, text="boom")]
+    data_manager.push_alumnos_to_gitea()
+
+    files = {f['path']: f for f in mock_request.call_args.kwargs['json']['files']}
+    pushed = base64.b64decode(files['edugitops/alumnos.yaml']['content']).decode('utf-8')
+    assert pushed == _read_text(alumnos_file)
+    assert pushed == yaml_io.dump_roster(data_manager.load_alumnos())
+    assert 'u2' in pushed
+
+@patch('requests.Session.request')
+def test_backend_sync_imports_remote_roster(mock_get: Any, student_backend: str, sync_files: tuple[str, str]) -> None:
+    """Un alumnos.yaml nuevo en Gitea sustituye al roster local en ambos backends."""
+    alumnos_file, catalogo_file = sync_files
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['local']
+    remote = "- nombre: remoto\n  id: '005'\n"
+    mock_get.side_effect = _fake_gitea(
+        listing={
+            'edugitops/alumnos.yaml': data_manager.git_blob_sha(remote.encode('utf-8')),
+            'edugitops/catalogo-servicios.yaml': data_manager.git_blob_sha(_read_text(catalogo_file).encode('utf-8')),
+        },
+        contents={'edugitops/alumnos.yaml': remote},
+    )
+
+    assert data_manager.sync_from_gitea()['edugitops/alumnos.yaml'] == 'updated'
+    assert _read_text(alumnos_file) == remote
+    assert [a['nombre'] for a in data_manager.load_alumnos()] == ['remoto']
+    assert data_manager.get_student('005')['nombre'] == 'remoto'
+
+@patch('config.ALUMNOS_BACKEND', 'sqlite')
+def test_sqlite_store_sees_writes_from_other_workers(sync_files: tuple[str, str], tmp_path: Any) -> None:
+    """Otro proceso escribe una fila en el almacén y las lecturas de este la ven."""
+    db_path = os.path.join(str(tmp_path), 'alumnos.sqlite')
+    with patch('config.ALUMNOS_DB', db_path):
+        assert [a['id'] for a in data_manager.load_alumnos()] == ['001']
+        result = subprocess.run(
+            [sys.executable, '-c',
+             "import sys, student_store\n"
+             "student_store.get_store(sys.argv[1]).upsert({'nombre': 'otro', 'id': '002'})\n",
+             db_path],
+            env=dict(os.environ, PYTHONPATH=os.path.join(root_dir, 'src')),
+            capture_output=True, text=True, timeout=30,
+        )
+        assert result.returncode == 0, result.stderr
+
+        assert [a['id'] for a in data_manager.load_alumnos()] == ['001', '002']
+        assert data_manager.get_student_repository().get('002')['nombre'] == 'otro'
+    data_manager._forget_store_view()
+
+# ====================================================================
+# BLOQUE 28: Tests del Roster Fragmentado (un fichero por alumno)
+# ====================================================================
+
+class _FakeGiteaRepo:
+    """Repositorio de Gitea en memoria: listados, y commits multi-fichero que guarda."""
+
+    def __init__(self, files: dict[str, str]) -> None:
+        self.shas = {path: data_manager.git_blob_sha(text.encode('utf-8')) for path, text in files.items()}
+        self.commits: list[list[dict[str, Any]]] = []
+
+    def __call__(self, method: str, url: str, **kwargs: Any) -> MagicMock:
+        import base64
+        if method == 'POST':
+            files = kwargs['json']['files']
+            self.commits.append(files)
+            pushed = []
+            for change in files:
+                if change['operation'] == 'delete':
+                    del self.shas[change['path']]
+                    continue
+                sha = data_manager.git_blob_sha(base64.b64decode(change['content']))
+                self.shas[change['path']] = sha
+                pushed.append({'path': change['path'], 'sha': sha})
+            return MagicMock(status_code=201, json=MagicMock(return_value={'files': pushed}))
+        directory = url.split('/contents/')[-1]
+        entries = [{'type': 'file', 'path': p, 'sha': sha} for p, sha in self.shas.items()
+                   if posixpath.dirname(p) == directory]
+        return MagicMock(status_code=200 if entries else 404, json=MagicMock(return_value=entries))
+
+    def last_commit(self) -> dict[str, str]:
+        return {change['path']: change['operation'] for change in self.commits[-1]}
+
+@pytest.fixture
+def sharded_roster(sync_files: tuple[str, str], tmp_path: Any) -> Generator[str, None, None]:
+    """Modo ALUMNOS_SHARDED con los ficheros por alumno en un directorio temporal."""
+    shards_dir = os.path.join(str(tmp_path), 'alumnos')
+    with patch('config.ALUMNOS_SHARDED', True), \
+         patch('config.GITEA_ALUMNOS_SHARDS_PATH_REMOTE', 'edugitops/alumnos'), \
+         patch('data_manager.ALUMNOS_SHARDS_DIR', shards_dir):
+        yield shards_dir
+
+@patch('requests.Session.request')
+def test_sharded_push_sends_only_changed_students(mock_request: Any, sharded_roster: str, sync_files: tuple[str, str]) -> None:
+    """Cada push sube solo los ficheros de los alumnos que han cambiado (y borra los de las bajas)."""
+    _, catalogo_file = sync_files
+    gitea = _FakeGiteaRepo({'edugitops/catalogo-servicios.yaml': _read_text(catalogo_file)})
+    mock_request.side_effect = gitea
+    data_manager.save_alumno_changes('002', 'u2', ['app1'])
+
+    # Primer push: alumnos.yaml y un fichero por alumno
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+    assert gitea.last_commit() == {
+        'edugitops/alumnos.yaml': 'create',
+        'edugitops/alumnos/001.yaml': 'create',
+        'edugitops/alumnos/002.yaml': 'create',
+    }
+    shard = yaml_io.safe_load(_read_text(os.path.join(sharded_roster, '002.yaml')))
+    assert shard == data_manager.get_student('002')
+
+    # Cambia un alumno: viaja solo su fichero (se lista el directorio de
+    # fragmentos; el SHA de alumnos.yaml se toma del estado)
+    mock_request.reset_mock()
+    data_manager.save_alumno_changes('002', 'u2', [])
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+    assert gitea.last_commit() == {'edugitops/alumnos.yaml': 'update', 'edugitops/alumnos/002.yaml': 'update'}
+    assert [c.args[0] for c in mock_request.call_args_list] == ['GET', 'POST']
+
+    # Una baja borra su fichero en el mismo commit
+    data_manager.delete_student('001')
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+    assert gitea.last_commit() == {'edugitops/alumnos.yaml': 'update', 'edugitops/alumnos/001.yaml': 'delete'}
+    assert sorted(os.listdir(sharded_roster)) == ['002.yaml']
+    assert sorted(p for p in gitea.shas if p.startswith('edugitops/alumnos/')) == ['edugitops/alumnos/002.yaml']
+
+    # Sin cambios no hay commit
+    mock_request.reset_mock()
+    assert "Sin cambios" in data_manager.push_alumnos_to_gitea()[1]
+    assert [c.args[0] for c in mock_request.call_args_list] == ['GET']
+
+@patch('requests.Session.request')
+def test_sharded_push_deletes_shards_without_sync_state(mock_request: Any, sharded_roster: str, sync_files: tuple[str, str]) -> None:
+    """Las bajas se deciden con el listado de Gitea: sin el estado local (reinicio del pod) también se borran."""
+    _, catalogo_file = sync_files
+    gitea = _FakeGiteaRepo({'edugitops/catalogo-servicios.yaml': _read_text(catalogo_file)})
+    mock_request.side_effect = gitea
+    data_manager.save_alumno_changes('002', 'u2', [])
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+
+    # El pod se reinicia: se pierde el estado y la sincronización inicial lo rehace para alumnos.yaml
+    os.remove(data_manager.GITEA_SYNC_STATE_FILE)
+    data_manager.sync_from_gitea()
+    data_manager.delete_student('001')
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+
+    assert gitea.last_commit() == {'edugitops/alumnos.yaml': 'update', 'edugitops/alumnos/001.yaml': 'delete'}
+    assert sorted(p for p in gitea.shas if p.startswith('edugitops/alumnos/')) == ['edugitops/alumnos/002.yaml']
+
+def test_shard_names_are_safe_paths() -> None:
+    """El ID de un alumno no puede sacar su fichero del directorio de fragmentos."""
+    assert data_manager._shard_name('001') == '001.yaml'
+    assert data_manager._shard_name('../x/y') == '%2E%2E%2Fx%2Fy.yaml'
+    assert data_manager._shard_name('.oculto') == '%2Eoculto.yaml'
+    assert data_manager._shard_name('josé') == 'jos%C3%A9.yaml'
+    assert data_manager._shard_name('') == '%.yaml'
+
+@patch('requests.Session.request')
+def test_sharded_ids_never_share_a_file(mock_request: Any, sharded_roster: str, sync_files: tuple[str, str]) -> None:
+    """IDs que solo difieren en caracteres no seguros ('a/b', 'a_b', 'a:b') tienen cada uno su fichero."""
+    ids = ['a/b', 'a_b', 'a:b', 'a%2Fb']
+    assert len({data_manager._shard_name(sid) for sid in ids}) == len(ids)
+
+    _, catalogo_file = sync_files
+    gitea = _FakeGiteaRepo({'edugitops/catalogo-servicios.yaml': _read_text(catalogo_file)})
+    mock_request.side_effect = gitea
+    for number, sid in enumerate(ids):
+        assert data_manager.save_alumno_changes(sid, f'alu-{number}', [])[0] is True
+    assert data_manager.push_alumnos_to_gitea()[0] is True
+
+    for sid in ids:
+        shard = os.path.join(sharded_roster, data_manager._shard_name(sid))
+        assert yaml_io.safe_load(_read_text(shard))['id'] == sid
+        assert f'edugitops/alumnos/{data_manager._shard_name(sid)}' in gitea.shas
+
+def test_sharded_applicationset_uses_glob_generator() -> None:
+    """El ApplicationSet fragmentado lee un fichero por alumno y genera las mismas aplicaciones."""
+    labs_dir = os.path.join(os.path.dirname(root_dir), 'edugitops', 'labs')
+    import yaml
+    with open(os.path.join(labs_dir, 'applicationset.yaml'), encoding='utf-8') as f:
+        single = [doc for doc in yaml.safe_load_all(f)]
+    with open(os.path.join(labs_dir, 'applicationset-sharded.yaml'), encoding='utf-8') as f:
+        sharded = [doc for doc in yaml.safe_load_all(f)]
+
+    appset = sharded[-1]
+    assert appset['spec']['generators'][0]['git']['files'] == [{'path': '${GITOPS_BASE_PATH}/alumnos/*.yaml'}]
+    # Mismo nombre y plantilla: cambiar de modo sustituye el generador sin recrear las apps
+    assert appset['metadata'] == single[-1]['metadata']
+    assert appset['spec']['template'] == single[-1]['spec']['template']
@@ -12,6 +12,6 @@ else
 fi
 
 # Sustituir variables y aplicar
-envsubst '$APP_IMAGE $APP_VERSION $GITEA_API_URL $GITEA_REPO_NAME $GITEA_BRANCH $GITEA_FILE_PATH $GITEA_CATALOGO_PATH $GITEA_USER $GITEA_PASSWORD $FLASK_DEBUG $CHECKMK_API_USER $CHECKMK_API_SECRET $CHECKMK_SITE $CHECKMK_HOST_NAME $CHECKMK_URL $CHECKMK_HOST_IP' < ./stack/app-edugitops.yaml | kubectl apply -f -
+envsubst '$APP_IMAGE $APP_VERSION $GITEA_API_URL $GITEA_REPO_NAME $GITEA_BRANCH $GITEA_FILE_PATH $GITEA_CATALOGO_PATH $ALUMNOS_SHARDED $GITEA_ALUMNOS_SHARDS_PATH $GITEA_USER $GITEA_PASSWORD $GITEA_WEBHOOK_SECRET $FLASK_DEBUG $CHECKMK_API_USER $CHECKMK_API_SECRET $CHECKMK_SITE $CHECKMK_HOST_NAME $CHECKMK_URL $CHECKMK_HOST_IP' < ./stack/app-edugitops.yaml | kubectl apply -f -
 
 echo "✅ App desplegada."
\ No newline at end of file
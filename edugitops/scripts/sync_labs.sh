@@ -7,6 +7,12 @@ if [ -f .env ]; then
     set -a; source .env; set +a
 fi
 
-envsubst '$GITEA_REPO_URL $GITOPS_BASE_PATH $GITEA_BRANCH $GITEA_USER $GITEA_PASSWORD' < labs/applicationset.yaml | kubectl apply -f - -n argocd
+# Con ALUMNOS_SHARDED el ApplicationSet lee un fichero por alumno (generador glob)
+APPSET_FILE=labs/applicationset.yaml
+case "${ALUMNOS_SHARDED}" in
+    [Tt]rue|1|t) APPSET_FILE=labs/applicationset-sharded.yaml ;;
+esac
+
+envsubst '$GITEA_REPO_URL $GITOPS_BASE_PATH $GITEA_BRANCH $GITEA_USER $GITEA_PASSWORD' < "$APPSET_FILE" | kubectl apply -f - -n argocd
 
 echo "✅ Sincronización enviada."
\ No newline at end of file